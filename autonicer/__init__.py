@@ -1,7 +1,21 @@
-from .autonicer import AutoNICER
-from .autonicer import get_caldb_ver
-from .autonicer import run
-from .reprocess import Reprocess
+from .caldb import get_caldb_ver
+from .cli import run
+
+# AutoNICER and Reprocess pull in pandas/astropy/astroquery/aiohttp, they
+# are only imported once used so the CLI starts fast
+_lazy = {
+    "AutoNICER": ".autonicer",
+    "Reprocess": ".reprocess",
+}
+
+
+def __getattr__(name):
+    if name in _lazy:
+        import importlib
+        value = getattr(importlib.import_module(_lazy[name], __name__), name)
+        globals()[name] = value
+        return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 __all__ = [
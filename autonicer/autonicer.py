@@ -2,7 +2,6 @@
 # Copyright 2022-2025 Nicholas Kuechel
 # License Apache 2.0
 
-import subprocess as sp
 import os
 import sys
 import pandas as pd
@@ -12,35 +11,41 @@ from astropy.coordinates import SkyCoord
 from astroquery import exceptions
 from astropy.time import Time
 from termcolor import colored
-import datetime
-import gzip
-import shutil
 import glob
+import tempfile
 import concurrent.futures
 import logging
-import argparse as ap
-from .reprocess import reprocess_check
-from .reprocess import inlist
+from .pipeline import Pipeline
+from .download import Downloader
+from .cache import CatalogCache
+from .ledger import Ledger
+from .metrics import timed
+from .compress import gzip_file
+from .compress import LEVEL
+from .fitshead import getval
+from .tasks import run_task
+from .tasks import pfiles_env
 from importlib.metadata import version
 import asyncio
-import aiohttp
-from pathlib import Path
-from tqdm import tqdm
 
 
 AUTONICER = os.path.basename(sys.argv[0])
 VERSION = version('autonicer')
 logger = logging.getLogger(AUTONICER)
+SELECTORS = ("cycle", "date", "exposure", "range")
 
 
-def get_caldb_ver():
+def caldb_of(file):
     """
-    Gets most up to nicer caldb version
+    CALDB version a reduced event file was made with
+
+    Returns:
+    str, CALDBVER of the events extension or None if unreadable
     """
-    caldb = sp.run("nicaldbver", shell=True,
-                   capture_output=True, encoding="utf-8")
-    convo = str(caldb.stdout).split("\n")
-    return convo[0]
+    try:
+        return getval(file, "CALDBVER", ext=1)
+    except (OSError, KeyError, IndexError):
+        return None
 
 
 async def download_file(url: str) -> None:
@@ -50,35 +55,8 @@ async def download_file(url: str) -> None:
     Parameters:
     url: str, url to fetch data from
     """
-    split_url = url.split("/")
-    file = '/'.join(split_url[7:])
-    file = Path(file)
-    file.parent.mkdir(exist_ok=True, parents=True)
-    file_path = file.resolve()
-    file_name = file.name
-    async with aiohttp.ClientSession() as session:
-        async with session.get(url) as resp:
-            if resp.status == 200:
-                file_size = int(resp.headers['Content-Length'])
-                with open(file_path, 'wb') as fd:
-                    progress = tqdm(total=file_size, desc=file_name,
-                                    unit="B", unit_scale=True, leave=False)
-                    while True:
-                        try:
-                            chunk = await resp.content.read(1024)
-                        except (asyncio.CancelledError,
-                                aiohttp.ClientResponseError) as e:
-                            logger.error(f"ERROR: Chunk read error: {e}\n")
-                            break
-                        if not chunk:
-                            progress.close()
-                            break
-                        fd.write(chunk)
-                        progress.update(len(chunk))
-                    progress.close()
-            else:
-                logger.info(f"Download: {file_name} failed "
-                            f"with code: {resp.status}\n")
+    async with Downloader() as dl:
+        await dl.fetch(url)
 
 
 async def download_obsid(urls: list) -> None:
@@ -88,20 +66,19 @@ async def download_obsid(urls: list) -> None:
     Parameters:
     urls: list, urls to all files that make up an entire obsid dataset
     """
-    sem = asyncio.Semaphore(4)
-    async with sem:
-        tasks = []
-        for url in urls:
-            task = asyncio.create_task(download_file(url))
-            tasks.append(task)
-        await asyncio.gather(*tasks)
+    async with Downloader() as dl:
+        await dl.fetch_all(urls)
 
 
 class AutoNICER(object):
-    def __init__(self, src=None, bc=None, comp=None):
+    def __init__(self, src=None, bc=None, comp=None, prefetch=1,
+                 downloader=None, jobs=1, catalog=None, incremental=False,
+                 gz_level=LEVEL, gz_workers=None, metrics=None,
+                 disk_budget=None, prune=False):
         self.st = True
         self.xti = 0
         self.queue = []
+        self._queued = set()
         self.caldb_ver = ""
         self.obj = src
         self.bc_sel = bc
@@ -109,6 +86,21 @@ class AutoNICER(object):
         self.tar_sel = comp
         self.q_path = 0
         self.q_name = 0
+        self.ledger = None
+        self.prefetch = prefetch
+        if downloader is None:
+            downloader = Downloader()
+        self.downloader = downloader
+        self.jobs = jobs
+        if catalog is None:
+            catalog = CatalogCache()
+        self.catalog = catalog
+        self.incremental = incremental
+        self.gz_level = gz_level
+        self.gz_workers = gz_workers
+        self.metrics = metrics
+        self.disk_budget = disk_budget
+        self.prune = prune
         self.startup()
 
     def startup(self):
@@ -151,11 +143,38 @@ class AutoNICER(object):
         self.bc_sel = null_parse(self.bc_sel)
         self.tar_sel = null_parse(self.tar_sel)
 
-    def call_nicer(self):
+    def call_nicer(self, refresh=False):
         """
         Querys the nicermastr catalog for all observations
         of the specified source(self.obj)
+
+        Results are cached per target. A cached table younger than the
+        cache TTL is used without querying HEASARC (unless refresh), and
+        an older one is used if HEASARC can't be reached.
+
+        Parameters:
+        refresh: bool, always query HEASARC
         """
+        with timed(self.metrics, "catalog", target=self.obj) as rec:
+            rec["source"] = self._query_catalog(refresh)
+            rec["rows"] = len(self.xti)
+
+    def _query_catalog(self, refresh=False):
+        """
+        Gets the query table of self.obj from the cache or HEASARC
+
+        Returns:
+        str, where it came from (cache, heasarc or stale cache)
+        """
+        cached = None
+        if self.catalog is not None:
+            cached = self.catalog.load(self.obj)
+        if cached is not None and not refresh and \
+                cached[1] < self.catalog.ttl:
+            logger.info(f"Using cached query results for {self.obj} "
+                        f"({cached[1] / 3600:.1f} hours old)")
+            self._index_xti(cached[0])
+            return "cache"
         heasarc = Heasarc()
         try:
             Heasarc.clear_cache()
@@ -168,58 +187,141 @@ class AutoNICER(object):
                                 "red"))
             logger.info(colored("Exiting ...", "red"))
             exit()
+        except Exception as e:
+            if cached is None:
+                raise
+            logger.info(colored(f"Unable to reach HEASARC ({e})", "red"))
+            logger.info(colored(f"Using cached query results for {self.obj} "
+                                f"({cached[1] / 3600:.1f} hours old)",
+                                "yellow"))
+            self._index_xti(cached[0])
+            return "stale cache"
         else:
             xti = xti.to_pandas()
             xti.columns = [name.upper() for name in xti.columns]
             xti["TIME"] = Time(xti["TIME"], format="mjd").to_datetime()
-            self.xti = xti
+            if self.catalog is not None:
+                self.catalog.save(self.obj, xti)
+            self._index_xti(xti)
+            return "heasarc"
+
+    def _index_xti(self, xti):
+        """
+        Indexes the query table by OBSID and adds its Cycle# column
+        """
+        xti["OBSID"] = xti["OBSID"].astype(str).str.strip()
+        xti.index = pd.Index(xti["OBSID"].to_numpy())
+        self.xti = xti
+        self.make_cycle()
+        return self.xti
 
     def make_cycle(self):
         """
         Makes a Cycle# column in resulting query table from obsid table
         """
-        cycle = []
-        for i in self.xti["OBSID"]:
-            convo = np.floor(float(i) * 10 ** (-9))
-            cycle.append(int(convo))
-        self.xti["Cycle#"] = cycle
+        self.xti["Cycle#"] = (self.xti["OBSID"].astype(np.int64) //
+                              10 ** 9)
         return self.xti
 
+    def _queued_obsids(self):
+        """
+        Set of the queued OBSIDs, resynced if the queue was edited directly
+        """
+        if len(self._queued) != len(self.queue):
+            self._queued = {i["OBSID"] for i in self.queue}
+        return self._queued
+
+    def _queue_rows(self, rows):
+        """
+        Queues up every row of the query table in rows that isn't
+        queued up already
+
+        Returns:
+        int, number of OBSIDs added
+        """
+        queued = self._queued_obsids()
+        rows = rows[~rows.index.duplicated() & ~rows.index.isin(queued)]
+        new = [{"OBSID": obsid,
+                "month": month,
+                "year": year,
+                "ra": ra,
+                "dec": dec}
+               for obsid, month, year, ra, dec in zip(
+                   rows.index,
+                   rows["TIME"].dt.strftime("%m"),
+                   rows["TIME"].dt.strftime("%Y"),
+                   rows["RA"].tolist(),
+                   rows["DEC"].tolist())]
+        self.queue.extend(new)
+        queued.update(rows.index)
+        return len(new)
+
     def sel_obs(self, enter):
         """
         Selects and queues up the obsid desired
         """
         selstate = True
-        queued_obsids = [i["OBSID"] for i in self.queue]
-        if enter in queued_obsids:
+        if enter in self._queued_obsids():
             logger.info(f"{enter} is already queued up... ignoring")
         else:
             try:
-                row = self.xti.loc[self.xti["OBSID"] == enter]
-                dt = row["TIME"]
-                row.reset_index(drop=True, inplace=True)
-                dt.reset_index(drop=True, inplace=True)
-                year = str(dt[0].year)
-                month = dt[0].month
-                # basic if else statement to fix single digit months
-                # not having a zero out front
-                if month < 10:
-                    month = "0" + str(month)
-                else:
-                    month = str(month)
-                sel_dict = {"OBSID": enter,
-                            "month": month,
-                            "year": year,
-                            "ra": row["RA"][0],
-                            "dec": row["DEC"][0]
-                            }
-                logger.info(f"Adding {enter}")
-                self.queue.append(sel_dict)
-                return selstate
+                row = self.xti.loc[[enter]]
             except KeyError:
                 logger.info(colored("OBSID NOT FOUND!", "red"))
                 selstate = False
                 return selstate
+            logger.info(f"Adding {enter}")
+            self._queue_rows(row)
+            return selstate
+
+    def bulk_sel(self, enter):
+        """
+        Queues up every OBSID matching all of the selections given
+
+        Selections (can be chained, i.e. cycle 2 exposure 1000):
+        cycle N [N ...]: OBSIDs from the given cycle(s)
+        date START END: OBSIDs observed from START through END (inclusive)
+        exposure MIN: OBSIDs with at least MIN seconds of exposure
+        range FIRST LAST: OBSIDs from FIRST through LAST
+
+        Returns:
+        int, number of OBSIDs added or None for an invalid selection
+        """
+        xti = self.xti
+        mask = np.ones(len(xti), dtype=bool)
+        tokens = [i for i in enter if i != ""]
+        try:
+            while tokens:
+                key = tokens.pop(0).lower()
+                if key == "cycle":
+                    cycles = []
+                    while tokens and tokens[0].lower() not in SELECTORS:
+                        cycles.append(int(float(tokens.pop(0))))
+                    mask &= xti["Cycle#"].isin(cycles).to_numpy()
+                elif key == "date":
+                    start = pd.Timestamp(tokens.pop(0))
+                    end = pd.Timestamp(tokens.pop(0))
+                    if end == end.normalize():
+                        end += pd.Timedelta(days=1)
+                    mask &= ((xti["TIME"] >= start) &
+                             (xti["TIME"] < end)).to_numpy()
+                elif key == "exposure":
+                    mask &= (xti["EXPOSURE"] >=
+                             float(tokens.pop(0))).to_numpy()
+                elif key == "range":
+                    first = int(tokens.pop(0))
+                    last = int(tokens.pop(0))
+                    obsids = xti["OBSID"].astype(np.int64)
+                    mask &= ((obsids >= first) & (obsids <= last)).to_numpy()
+                else:
+                    raise ValueError(key)
+        except (IndexError, ValueError, KeyError) as e:
+            logger.info(colored(f"Invalid selection: {e}", "red"))
+            return None
+        added = self._queue_rows(xti[mask])
+        logger.info(f"Adding {added} OBSIDs ({int(mask.sum()) - added} "
+                    "already queued up)")
+        return added
 
     def rm_obs(self, cmd):
         """
@@ -235,6 +337,7 @@ class AutoNICER(object):
                 sel_obsids = [i["OBSID"] for i in self.queue]
                 n = sel_obsids.index(cmd)
             del self.queue[n]
+        self._queued = {i["OBSID"] for i in self.queue}
 
     def commands(self, enter):
         if enter[0].lower() == "done":
@@ -265,12 +368,9 @@ class AutoNICER(object):
                 self.rm_obs("back")
             return True
 
-        elif enter[0].lower() == "cycle":
-            row = self.make_cycle().loc[
-                self.make_cycle()["Cycle#"] == float(enter[1])
-            ]
-            for i in row["OBSID"]:
-                self.sel_obs(i)
+        elif enter[0].lower() in SELECTORS:
+            # bulk selection by cycle, date, exposure and/or OBSID range
+            self.bulk_sel(enter)
             return True
 
         elif enter[0].lower() == "rm":
@@ -287,6 +387,16 @@ class AutoNICER(object):
                 logger.info(f"Log Name: {self.q_name}")
                 logger.info(f"Output Log: {self.q_set}")
             logger.info(f".gz compresion: {self.tar_sel}")
+            logger.info(f".gz level: {self.gz_level}")
+            logger.info(f"Download prefetch: {self.prefetch}")
+            logger.info(f"Parallel reductions: {self.jobs}")
+            logger.info(f"Incremental: {self.incremental}")
+            logger.info(f"Concurrent downloads: {self.downloader.files}")
+            if self.disk_budget is not None:
+                logger.info(f"Disk budget: {self.disk_budget}")
+                logger.info(f"Prune intermediates: {self.prune}")
+            if self.downloader.cache is not None:
+                logger.info(f"Download cache: {self.downloader.cache.path}")
 
         elif enter[0] == "exit":
             exit()
@@ -321,61 +431,106 @@ class AutoNICER(object):
                 self.commands(enter)
         return cmdstate
 
-    def nicer_compress(self):
+    def nicer_compress(self, path=None):
         """
         compresses .evt files
+
+        Each file is split into blocks compressed on gz_workers threads,
+        so a single large ufa.evt file uses every core
+
+        Parameters:
+        path: str, directory holding the .evt files (default: cwd)
         """
+        if path is None:
+            path = os.getcwd()
         logger.info(colored("##########  .gz compression  ##########",
                     "green"))
-
-        def gz_comp(file):
-            """
-            .gz compression of a single file and
-            removal of original file after compression
-            """
-            if file == "":
-                pass
-            else:
-                with open(file, "rb") as f_in:
-                    with gzip.open(f"{file}.gz", "wb") as f_out:
-                        shutil.copyfileobj(f_in, f_out)
-                os.remove(file)
+        workers = self.gz_workers or os.cpu_count() or 1
+
+        with concurrent.futures.ThreadPoolExecutor(workers) as executor:
+            def gz_comp(file):
+                """
+                .gz compression of a single file and
+                removal of original file after compression
+                """
+                with timed(self.metrics, "gzip",
+                           file=os.path.basename(file)) as rec:
+                    rec["bytes"] = os.path.getsize(file)
+                    gz = gzip_file(file, self.gz_level, executor, workers)
+                    rec["gz_bytes"] = os.path.getsize(gz)
+                    rec["ratio"] = round(rec["bytes"] /
+                                         max(rec["gz_bytes"], 1), 3)
                 return f"{file} -> {file}.gz"
 
-        logger.info("\nCompressing ufa.evt files")
-        logger.info("-" * 50)
-        # files and loop to compress the ufa files
-        files = glob.glob("*ufa.evt")
-        with concurrent.futures.ThreadPoolExecutor() as executor:
-            comps = [executor.submit(gz_comp, i) for i in files]
-
-            for j in concurrent.futures.as_completed(comps):
-                logger.info(j.result())
-
-        # compression of the non-bc mpu7_cl.evt file
-        # if barycenter correction is selected
-        if self.bc_sel.lower() == "y":
-            logger.info("\nCompressing cl.evt files")
+            logger.info("\nCompressing ufa.evt files")
             logger.info("-" * 50)
-            cl_file = glob.glob("ni*cl.evt")
-            for i in cl_file:
+            # files and loop to compress the ufa files
+            files = glob.glob(os.path.join(path, "*ufa.evt"))
+            for i in files:
                 logger.info(gz_comp(i))
 
+            # compression of the non-bc mpu7_cl.evt file
+            # if barycenter correction is selected
+            if self.bc_sel.lower() == "y":
+                logger.info("\nCompressing cl.evt files")
+                logger.info("-" * 50)
+                cl_file = glob.glob(os.path.join(path, "ni*cl.evt"))
+                for i in cl_file:
+                    logger.info(gz_comp(i))
+
+    def plan(self, data, base_dir):
+        """
+        Finds the first stage an OBSID still needs for incremental runs
+
+        The reduced event files are checked for the current CALDB version
+        (CALDBVER) and the output log for an entry of the OBSID, so an
+        OBSID is only downloaded and put through nicerl2 again when it
+        was never reduced or was reduced with an older CALDB.
+
+        Parameters:
+        data: dict, entry from AutoNICER.queue
+        base_dir: str, directory the OBSID datasets are in
+
+        Returns:
+        str, download, barycorr, compress, log or done
+        """
+        obsid = data["OBSID"]
+        event_cl = os.path.join(base_dir, obsid, "xti", "event_cl")
+        ni_cl = os.path.join(event_cl, f"ni{obsid}_0mpu7_cl.evt")
+        bc_cl = os.path.join(event_cl, f"bc{obsid}_0mpu7_cl.evt")
+        bc = self.bc_sel.lower() == "y"
+        if caldb_of(bc_cl if bc else ni_cl) != self.caldb_ver:
+            if bc and caldb_of(ni_cl) == self.caldb_ver:
+                return "barycorr"
+            return "download"
+        if self.tar_sel.lower() == "y" and (
+                glob.glob(os.path.join(event_cl, "*ufa.evt"))
+                or (bc and os.path.exists(ni_cl))):
+            return "compress"
+        if self.q_set == "y":
+            if self.q_path == 0:
+                return "log"
+            if self.ledger is None:
+                self.ledger = Ledger(self.q_path)
+            if not self.ledger.has(obsid, self.caldb_ver):
+                return "log"
+        return "done"
+
     def add2q(self, q, base_dir, obsid):
         """
-        Adds processed data to existing log
+        Adds processed data to the output log
+
+        Parameters:
+        q: ignored, the log used to be passed in as a DataFrame and is now
+           appended to through the ledger (kept for existing callers)
+        base_dir: str, directory the OBSID datasets live in
+        obsid: str, processed OBSID
         """
-        newline = pd.DataFrame(
-            {
-                "Input": [(f"{base_dir}/{obsid}/xti/"
-                           f"event_cl/bc{obsid}_0mpu7_cl.evt")],
-                "OBSID": [f"NI{obsid}"],
-                "CALDB": [f"{self.caldb_ver}"],
-                "DateTime": [f"{datetime.datetime.now()}"],
-            },
-        )
-        q = pd.concat([q, newline])
-        q.to_csv(self.q_path, index=False)
+        if self.ledger is None:
+            self.ledger = Ledger(self.q_path)
+        self.ledger.add((f"{base_dir}/{obsid}/xti/"
+                         f"event_cl/bc{obsid}_0mpu7_cl.evt"),
+                        obsid, f"{self.caldb_ver}")
 
     def _make_download_links(self, info: dict) -> dict:
         """
@@ -428,146 +583,151 @@ class AutoNICER(object):
         return {"small": [f"{base_url}{url}" for url in file_urls["small"]],
                 "big": [f"{base_url}{url}" for url in file_urls["big"]]}
 
-    def reduce(self, data):
+    async def areduce(self, data, env=None, log=None, echo=True,
+                      start="nicerl2", base_dir=None):
         """
         Performs standardized data reduction scheme calling
-        nicerl2 and barycorr if set
+        nicerl2 and barycorr if set, stopping at the first task that fails
+
+        Parameters:
+        data: dict, entry from AutoNICER.queue
+        env: dict, environment for the HEASoft tasks (default: inherited
+             with a PFILES dir of its own for this call)
+        log: file, binary file the task output is written to
+        echo: bool, also copy the task output to stdout
+        start: str, task to start from (nicerl2 or barycorr)
+        base_dir: str, directory the OBSID dataset is in (default: cwd)
+
+        Returns:
+        list, TaskResult of each task run
+
+        Raises:
+        TaskError, if nicerl2 or barycorr fails
         """
+        if env is None:
+            # reductions running at once in this process must not share
+            # .par files
+            with tempfile.TemporaryDirectory(
+                    prefix="autonicer_pfiles_") as pfiles:
+                return await self.areduce(data, pfiles_env(pfiles), log,
+                                          echo, start, base_dir)
         logger.info("\nStarting Data Reduction... \n")
-        sp.call(f"nicerl2 indir={data['OBSID']}/ clobber=yes", shell=True)
+        results = []
+        if start == "nicerl2":
+            results.append(await run_task(["nicerl2",
+                                           f"indir={data['OBSID']}/",
+                                           "clobber=yes"],
+                                          log=log, env=env, echo=echo,
+                                          cwd=base_dir))
         if self.bc_sel.lower() == "y":
-            sp.call(
-                (f"barycorr infile={data['OBSID']}/xti/event_cl/"
-                 f"ni{data['OBSID']}_0mpu7_cl.evt outfile={data['OBSID']}"
-                 f"/xti/event_cl/bc{data['OBSID']}_0mpu7_cl.evt "
-                 f"orbitfiles={data['OBSID']}/auxil/ni{data['OBSID']}.orb "
-                 f"refframe=ICRS ra={data['ra']} "
-                 f"dec={data['dec']} ephem=JPLEPH.430 clobber=yes"),
-                shell=True,
-            )
-
-    def pull_reduce(self):
+            results.append(await run_task(
+                ["barycorr",
+                 (f"infile={data['OBSID']}/xti/event_cl/"
+                  f"ni{data['OBSID']}_0mpu7_cl.evt"),
+                 (f"outfile={data['OBSID']}/xti/event_cl/"
+                  f"bc{data['OBSID']}_0mpu7_cl.evt"),
+                 f"orbitfiles={data['OBSID']}/auxil/ni{data['OBSID']}.orb",
+                 "refframe=ICRS",
+                 f"ra={data['ra']}",
+                 f"dec={data['dec']}",
+                 "ephem=JPLEPH.430",
+                 "clobber=yes"],
+                log=log, env=env, echo=echo, cwd=base_dir))
+        return results
+
+    def reduce(self, data, env=None, log=None, echo=True, base_dir=None):
+        """
+        Performs standardized data reduction scheme calling
+        nicerl2 and barycorr if set
+
+        Parameters:
+        data: dict, entry from AutoNICER.queue
+        env: dict, environment for the HEASoft tasks (default: inherited
+             with a PFILES dir of its own for this call)
+        log: file, binary file the task output is written to
+             (default: stdout only)
+        echo: bool, also copy the task output to stdout
+        base_dir: str, directory the OBSID dataset is in (default: cwd)
+
+        Raises:
+        TaskError, if nicerl2 or barycorr fails
+        """
+        # from inside a running event loop await areduce instead
+        return asyncio.run(self.areduce(data, env, log, echo,
+                                        base_dir=base_dir))
+
+    async def download(self, data, downloader=None, priority=0,
+                       base_dir=None, heads=None):
+        """
+        Downloads all the files that make up an OBSID dataset
+
+        Parameters:
+        data: dict, entry from AutoNICER.queue
+        downloader: Downloader, opened engine shared by the run
+                    (AutoNICER.downloader is opened for this call if
+                    not given)
+        priority: int, scheduling priority (lower goes first)
+        base_dir: str, directory the OBSID dataset is put in (default: cwd)
+        heads: dict, HEAD metadata of the files if already looked up
+               (see Downloader.heads)
+
+        Returns:
+        list, downloaded files (None for files not in the archive)
+        """
+        if downloader is None:
+            async with self.downloader as dl:
+                return await self.download(data, dl, priority, base_dir,
+                                           heads)
+        logger.info(f"\nDownloading files for {data['OBSID']}\n")
+        return await downloader.fetch_all(self.download_urls(data), base_dir,
+                                          priority=priority, heads=heads)
+
+    def download_urls(self, data) -> list:
+        """
+        Urls of every file of an OBSID dataset
+
+        Parameters:
+        data: dict, entry from AutoNICER.queue
+        """
+        urls = self._make_download_links(data)
+        # bg.pha shows up in both lists, only fetch it once
+        return list(dict.fromkeys(urls["big"] + urls["small"]))
+
+    def write_log(self, base_dir, obsid):
+        """
+        Writes a processed OBSID out to the output log if one is set
+        """
+        if self.q_set == "y" and self.q_path != 0:
+            self.add2q(None, base_dir, obsid)
+        elif self.q_set == "y" and self.q_path == 0:
+            self.q_path = f"{base_dir}/{self.q_name}.csv"
+            self.ledger = Ledger(self.q_path)
+            self.ledger.reset()
+            self.add2q(None, base_dir, obsid)
+        else:
+            pass
+
+    def pull_reduce(self, base_dir=None):
         """
         Downloads the NICER data
         Puts the retrieved data through a standardized data reduction scheme
+
+        OBSIDs are run through a staged pipeline so the next OBSID(s)
+        download while the current one is being reduced
+
+        Parameters:
+        base_dir: str, directory the OBSID datasets are put in
+                  (default: cwd)
         """
+        return asyncio.run(self.apull_reduce(base_dir))
 
-        for data in self.queue:
-            logger.info("")
-            logger.info("-" * 60)
-            logger.info((" " * 14) + "Prosessing OBSID: " +
-                        colored(str(data["OBSID"]), "cyan"))
-            logger.info("-" * 60)
-            # Download dataset
-            urls = self._make_download_links(data)
-            # Download big
-            logger.info("\nDownloading large files\n")
-            for url in urls["big"]:
-                asyncio.run(download_file(url))
-            # Download small
-            logger.info("\nDownloading small files\n")
-            asyncio.run(download_obsid(urls["small"]))
-
-            self.caldb_ver = get_caldb_ver()
-            self.reduce(data)
-
-            base_dir = os.getcwd()
-            os.chdir(f"{data['OBSID']}/xti/event_cl/")
-            if self.tar_sel.lower() == "y":
-                self.nicer_compress()
-            os.chdir(base_dir)
-            if self.q_set == "y" and self.q_path != 0:
-                read_q = pd.read_csv(self.q_path)
-                self.add2q(read_q, base_dir, data['OBSID'])
-            elif self.q_set == "y" and self.q_path == 0:
-                q = pd.DataFrame(
-                    {"Input": [], "OBSID": [], "CALDB": [], "DateTime": []}
-                )
-                self.q_path = f"{base_dir}/{self.q_name}.csv"
-                self.add2q(q, base_dir, data['OBSID'])
-            else:
-                pass
-
-
-def run(args=None):
-    p = ap.ArgumentParser(
-        description=("A program for piplining NICER data reduction. "
-                     "Run by just typing autonicer.")
-    )
-
-    p.add_argument(
-        "-src",
-        "--src",
-        help="Set the src from the command line",
-        type=str,
-    )
-
-    p.add_argument(
-        "-checkcal",
-        "--checkcal",
-        help=("Checks if mpu7_cl.evt are up to date "
-              "with latest NICER calibrations"),
-        action="store_true",
-        default=False,
-    )
-
-    p.add_argument(
-        "-reprocess",
-        "--reprocess",
-        help="Engages a reprocessing of calibrations ",
-        action="store_true",
-        default=False,
-    )
-
-    p.add_argument(
-        "-bc",
-        "--bc",
-        help=("Engages option for a barycenter correction "
-              "in data reduction procedure"),
-        action="store_true",
-        default=None,
-    )
-
-    p.add_argument(
-        "-compress",
-        "--compress",
-        help="Engages option for .gz compression of ufa.evt files",
-        action="store_true",
-        default=None,
-    )
-
-    p.add_argument(
-        "-i",
-        "--inlist",
-        dest="inlist",
-        help=(".csv or Unix style pathname pattern whhich lists paths "
-              "to OBSID dirs or mpu7_cl.evt "
-              "files for use with --reprocess and/or --checkcal"),
-        default=None,
-        nargs="+",
-    )
-
-    p.add_argument(
-        "--version",
-        action="version",
-        version=f"%(prog)s {VERSION}"
-    )
-
-    argp = p.parse_args(args)
-
-    level = logging.INFO
-    logging.basicConfig(stream=sys.stdout,
-                        level=level,
-                        format="")
-
-    if argp.checkcal is True or argp.reprocess is True:
-        if argp.inlist is None:
-            reprocess_check(argp)
-        else:
-            inlist(argp)
-    else:
-        logger.info(colored("##########  Auto NICER  ##########\n",
-                    "cyan"))
-        an = AutoNICER(argp.src, argp.bc, argp.compress)
-        an.call_nicer()
-        an.command_center()
+    async def apull_reduce(self, base_dir=None):
+        """
+        pull_reduce for use from a running event loop
+
+        Returns:
+        dict, OBSIDs that failed and the stage/reason they failed at
+        """
+        return await Pipeline(self, self.prefetch, self.jobs,
+                              self.incremental, base_dir, self.disk_budget,
+                              self.prune).run()
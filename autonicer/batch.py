@@ -0,0 +1,229 @@
+# AutoNICER
+# Copyright 2022-2025 Nicholas Kuechel
+# License Apache 2.0
+
+import os
+import sys
+import json
+import logging
+import asyncio
+from termcolor import colored
+from .autonicer import AutoNICER
+from .autonicer import SELECTORS
+from .caldb import get_caldb_ver
+from .cache import CatalogCache
+from .download import Downloader
+from .ledger import Ledger
+from .pipeline import Pipeline
+
+AUTONICER = os.path.basename(sys.argv[0])
+logger = logging.getLogger(AUTONICER)
+
+# options a manifest (or one of its targets) can set for AutoNICER
+OPTIONS = {"bc": False, "compress": False, "prefetch": 1, "jobs": 1,
+           "incremental": False, "gz_level": None, "gz_workers": None,
+           "disk_budget": None, "prune": False}
+
+
+class Batch:
+    """
+    Headless run of several targets from a manifest.
+
+    A manifest is a dict (or JSON file) such as
+        {"output": "campaign", "log": "campaign.csv", "bc": true,
+         "targets": [
+            {"src": "PSR_B0531+21", "dir": "crab",
+             "obsids": ["1013010112"], "cycles": [1, 2],
+             "dates": [["2019-01-01", "2019-06-30"]], "exposure": 500},
+            {"src": "Vela", "all": true, "compress": true}]}
+
+    Every target is queried (through the shared catalog cache, the next
+    target's query runs while the current one is processed), its
+    selections are queued up and it is run through the pipeline into
+    output/dir. The CALDB version is looked up once and one opened
+    Downloader, and so one connection pool, serves every target. bc,
+    compress, prefetch, jobs, incremental, gz_level, gz_workers,
+    disk_budget and prune can be set for the whole manifest or per
+    target. metrics (a Metrics)
+    collects the stage timings of every target.
+
+    Selections of a target (OR'd together):
+    obsids: list, OBSIDs
+    cycles: list, NICER cycles
+    dates: list, [start, end] windows (end inclusive)
+    exposure: float, minimum exposure for the cycle/date/all selections
+    select: list, selection commands as typed at the prompt
+    all: bool, every OBSID of the target
+    """
+
+    def __init__(self, manifest: dict, downloader=None, catalog=None,
+                 refresh=False, metrics=None, **settings):
+        self.manifest = manifest
+        if downloader is None:
+            downloader = Downloader()
+        self.downloader = downloader
+        if catalog is None:
+            catalog = CatalogCache()
+        self.catalog = catalog
+        self.refresh = refresh
+        self.metrics = metrics
+        self.settings = settings
+        self.output = os.path.abspath(manifest.get("output", os.getcwd()))
+        os.makedirs(self.output, exist_ok=True)
+        self.ledger = None
+        if manifest.get("log"):
+            self.ledger = Ledger(os.path.join(self.output, manifest["log"]))
+        self.results = {}
+        self._tables = {}
+
+    @classmethod
+    def from_file(cls, path, **kwargs):
+        """
+        Batch from a JSON manifest file
+        """
+        with open(path) as f:
+            return cls(json.load(f), **kwargs)
+
+    def _option(self, target: dict, key: str):
+        value = target.get(key, self.manifest.get(key))
+        if value is None:
+            value = self.settings.get(key)
+        if value is None:
+            value = OPTIONS[key]
+        return value
+
+    def _select(self, an, target: dict) -> int:
+        """
+        Queues up the selections of a target
+
+        Returns:
+        int, number of OBSIDs queued up
+        """
+        exposure = target.get("exposure")
+        extra = [] if exposure is None else ["exposure", str(exposure)]
+        if target.get("all") is True:
+            if extra:
+                an.bulk_sel(extra)
+            else:
+                an._queue_rows(an.xti)
+        for obsid in target.get("obsids", []):
+            an.sel_obs(str(obsid))
+        if target.get("cycles"):
+            an.bulk_sel(["cycle"] + [str(i) for i in target["cycles"]] +
+                        extra)
+        for start, end in target.get("dates", []):
+            an.bulk_sel(["date", str(start), str(end)] + extra)
+        for cmd in target.get("select", []):
+            enter = str(cmd).split()
+            if enter and enter[0].lower() in SELECTORS:
+                an.bulk_sel(enter)
+            elif enter:
+                an.sel_obs(enter[0])
+        return len(an.queue)
+
+    def prepare(self, target: dict, caldb: str):
+        """
+        Makes the AutoNICER instance of a target with its query results
+        and selections queued up
+
+        Returns:
+        AutoNICER, or None if the target couldn't be resolved
+        """
+        src = target["src"]
+        kwargs = {"prefetch": self._option(target, "prefetch"),
+                  "downloader": self.downloader,
+                  "jobs": self._option(target, "jobs"),
+                  "catalog": self.catalog,
+                  "incremental": self._option(target, "incremental"),
+                  "gz_workers": self._option(target, "gz_workers"),
+                  "metrics": self.metrics,
+                  "disk_budget": self._option(target, "disk_budget"),
+                  "prune": bool(self._option(target, "prune"))}
+        if self._option(target, "gz_level") is not None:
+            kwargs["gz_level"] = self._option(target, "gz_level")
+        an = AutoNICER(src, bool(self._option(target, "bc")),
+                       bool(self._option(target, "compress")), **kwargs)
+        an.caldb_ver = caldb
+        if self.ledger is not None:
+            an.q_set = "y"
+            an.q_path = self.ledger.csv_path
+            an.ledger = self.ledger
+        try:
+            if src in self._tables:
+                an._index_xti(self._tables[src].copy())
+            else:
+                an.call_nicer(self.refresh)
+                self._tables[src] = an.xti
+        except SystemExit:
+            return None
+        self._select(an, target)
+        return an
+
+    async def arun(self) -> dict:
+        """
+        Runs every target of the manifest
+
+        Returns:
+        dict, per target the OBSIDs queued, skipped and failed
+        """
+        loop = asyncio.get_running_loop()
+        caldb = await loop.run_in_executor(None, get_caldb_ver)
+        logger.info(f"NICER CALDB: {caldb}")
+        targets = self.manifest.get("targets", [])
+        async with self.downloader as downloader:
+            pending = None
+            if targets:
+                pending = loop.run_in_executor(None, self.prepare,
+                                               targets[0], caldb)
+            for n, target in enumerate(targets):
+                name = target.get("dir") or target["src"]
+                try:
+                    an = await pending
+                except Exception as e:
+                    an = None
+                    self.results[name] = {"error": str(e)}
+                if n + 1 < len(targets):
+                    # query the next target while this one is processed
+                    pending = loop.run_in_executor(None, self.prepare,
+                                                   targets[n + 1], caldb)
+                if an is None:
+                    self.results.setdefault(
+                        name, {"error": f"unable to resolve {target['src']}"})
+                    continue
+                logger.info("")
+                logger.info(colored(f"##########  {target['src']}: "
+                                    f"{len(an.queue)} OBSIDs  ##########",
+                                    "cyan"))
+                base_dir = os.path.join(self.output, target.get("dir", ""))
+                os.makedirs(base_dir, exist_ok=True)
+                pipe = Pipeline(an, an.prefetch, an.jobs, an.incremental,
+                                base_dir, an.disk_budget, an.prune)
+                failed = await pipe.run(downloader)
+                self.results[name] = {"queued": len(an.queue),
+                                      "skipped": len(pipe.skipped),
+                                      "failed": failed}
+        self.summarize()
+        return self.results
+
+    def run(self) -> dict:
+        """
+        Runs every target of the manifest (see Batch.arun)
+        """
+        return asyncio.run(self.arun())
+
+    def summarize(self):
+        """
+        Logs how each target of the batch went
+        """
+        logger.info("")
+        logger.info(colored("##########  Batch summary  ##########", "cyan"))
+        for name, result in self.results.items():
+            if "error" in result:
+                logger.info(colored(f"{name}: {result['error']}", "red"))
+                continue
+            done = result["queued"] - result["skipped"] - \
+                len(result["failed"])
+            color = "red" if result["failed"] else "green"
+            logger.info(colored(f"{name}: {done} processed, "
+                                f"{result['skipped']} up to date, "
+                                f"{len(result['failed'])} failed", color))
@@ -0,0 +1,179 @@
+# AutoNICER
+# Copyright 2022-2025 Nicholas Kuechel
+# License Apache 2.0
+
+import os
+import sys
+import glob
+import shutil
+import asyncio
+import logging
+from termcolor import colored
+from .cache import parse_size
+
+AUTONICER = os.path.basename(sys.argv[0])
+logger = logging.getLogger(AUTONICER)
+
+# bytes of event files nicerl2 writes (the uncompressed ufa.evt and
+# cl.evt) per byte of uf.evt.gz downloaded
+EXPANSION = 3.0
+
+
+class BudgetError(OSError):
+    """
+    Raised when an OBSID can't fit on disk even on its own
+    """
+
+
+def dir_size(path) -> int:
+    """
+    Bytes of all files under path
+    """
+    size = 0
+    for root, _, files in os.walk(path):
+        for i in files:
+            try:
+                size += os.path.getsize(os.path.join(root, i))
+            except OSError:
+                pass
+    return size
+
+
+def prune(obsid_dir) -> int:
+    """
+    Removes the intermediates of an OBSID that nicerl2 is done with, the
+    uf.evt(.gz) files of xti/event_uf and the .gz copies of the event_cl
+    files nicerl2 rewrote
+
+    Returns:
+    int, bytes freed
+    """
+    files = glob.glob(os.path.join(obsid_dir, "xti", "event_uf", "*uf.evt*"))
+    event_cl = os.path.join(obsid_dir, "xti", "event_cl")
+    files += [f"{i}.gz" for i in glob.glob(os.path.join(event_cl, "*.evt"))
+              if os.path.exists(f"{i}.gz")]
+    freed = 0
+    for i in files:
+        freed += os.path.getsize(i)
+        os.remove(i)
+    return freed
+
+
+class DiskBudget:
+    """
+    Admission control of OBSIDs against a cap on the disk a run takes up.
+
+    Every OBSID reserves its estimated footprint before it is downloaded
+    (the Content-Length of its files plus what nicerl2 will write out)
+    and is only admitted once the reservation fits under the cap and in
+    the free space of the volume. As its stages finish the reservation is
+    brought down to what the OBSID actually takes up, and once it is done
+    what it left on disk stays counted against the cap, so the cap bounds
+    the peak disk use of the whole run. When the OBSIDs that are done
+    have used up the cap the remaining ones fail with a BudgetError. An
+    OBSID larger than the cap runs on its own if nothing else of the run
+    is on disk yet.
+
+    Parameters:
+    cap: str or int, bytes the OBSIDs of the run may take up, e.g. 50G
+    path: str, directory on the volume the OBSIDs are written to
+    expansion: float, bytes written by nicerl2 per byte of uf.evt.gz
+    """
+
+    def __init__(self, cap, path, expansion=EXPANSION):
+        self.cap = parse_size(cap)
+        self.path = str(path)
+        self.expansion = expansion
+        self.reserved = {}
+        self.kept = 0
+        self.peak = 0
+        self._changed = None
+
+    @property
+    def used(self) -> int:
+        return self.kept + sum(self.reserved.values())
+
+    def estimate(self, sizes: dict) -> int:
+        """
+        Footprint of an OBSID while it is processed
+
+        Parameters:
+        sizes: dict, url: Content-Length of each file of the OBSID
+
+        Returns:
+        int, estimated bytes
+        """
+        events = sum(size for url, size in sizes.items()
+                     if url.endswith("_uf.evt.gz"))
+        return sum(sizes.values()) + int(self.expansion * events)
+
+    def free(self) -> int:
+        """
+        Free bytes of the volume (path may not be made yet)
+        """
+        path = os.path.abspath(self.path)
+        while not os.path.exists(path):
+            path = os.path.dirname(path)
+        return shutil.disk_usage(path).free
+
+    def _fits(self, size: int) -> bool:
+        if not self.reserved:
+            return True
+        if self.used + size > self.cap:
+            return False
+        # what's reserved may not be written yet
+        return size <= self.free() - sum(self.reserved.values())
+
+    async def acquire(self, obsid: str, size: int):
+        """
+        Waits until an OBSID of size bytes fits and reserves it
+
+        Raises:
+        BudgetError, if the OBSID doesn't fit in what is left of the cap
+        or in the free space of the volume with nothing else in flight
+        """
+        if self._changed is None:
+            self._changed = asyncio.Event()
+        while not self._fits(size):
+            self._changed.clear()
+            await self._changed.wait()
+        free = self.free()
+        if size > free:
+            raise BudgetError(f"needs about {size / 1024 ** 3:.2f}G, "
+                              f"{free / 1024 ** 3:.2f}G free")
+        if self.kept and self.kept + size > self.cap:
+            raise BudgetError(f"needs about {size / 1024 ** 3:.2f}G, "
+                              f"{(self.cap - self.kept) / 1024 ** 3:.2f}G "
+                              "of the disk budget is left")
+        if size > self.cap:
+            logger.info(colored(f"{obsid} needs about "
+                                f"{size / 1024 ** 3:.2f}G, more than the "
+                                "disk budget, running it on its own",
+                                "yellow"))
+        self.resize(obsid, size)
+
+    def resize(self, obsid: str, size: int):
+        """
+        Sets the reservation of an admitted OBSID to size bytes
+        """
+        self.reserved[obsid] = size
+        self.peak = max(self.peak, self.used)
+        self._notify()
+
+    def release(self, obsid: str, kept=0):
+        """
+        Ends the reservation of an OBSID that is done
+
+        Parameters:
+        obsid: str, OBSID that is done
+        kept: int, bytes it left on disk, counted against the cap for
+              the rest of the run
+        """
+        if self.reserved.pop(obsid, None) is not None:
+            self.kept += kept
+            self.peak = max(self.peak, self.used)
+            self._notify()
+
+    def _notify(self):
+        if self._changed is not None:
+            self._changed.set()
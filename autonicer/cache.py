@@ -0,0 +1,216 @@
+# AutoNICER
+# Copyright 2022-2025 Nicholas Kuechel
+# License Apache 2.0
+
+import os
+import sys
+import logging
+import hashlib
+import json
+import re
+import shutil
+import time
+from pathlib import Path
+
+AUTONICER = os.path.basename(sys.argv[0])
+logger = logging.getLogger(AUTONICER)
+
+UNITS = {"": 1, "K": 1024, "M": 1024 ** 2, "G": 1024 ** 3, "T": 1024 ** 4}
+
+
+def user_cache_dir() -> Path:
+    """
+    Directory autonicer keeps its caches in ($XDG_CACHE_HOME/autonicer)
+    """
+    base = os.environ.get("XDG_CACHE_HOME",
+                          os.path.join(os.path.expanduser("~"), ".cache"))
+    return Path(base) / "autonicer"
+
+
+def parse_size(size) -> int:
+    """
+    Parses a size such as 500M or 50G into bytes
+
+    Parameters:
+    size: str or int, size with an optional K, M, G or T suffix
+    """
+    if isinstance(size, int):
+        return size
+    size = str(size).strip().upper().rstrip("B")
+    unit = size[-1:] if size[-1:] in UNITS else ""
+    return int(float(size[:len(size) - len(unit)]) * UNITS[unit])
+
+
+def _place(src: Path, dest: Path) -> None:
+    """
+    Hard links src to dest, falling back to a copy across filesystems
+    """
+    tmp = dest.with_name(f"{dest.name}.{os.getpid()}.tmp")
+    try:
+        os.link(src, tmp)
+    except OSError:
+        shutil.copyfile(src, tmp)
+    os.replace(tmp, dest)
+
+
+class DownloadCache:
+    """
+    Persistent content cache for files downloaded from the archive.
+
+    Entries are keyed on the url plus the ETag/Last-Modified the server
+    reports, so a file changed in the archive is never served stale.
+    Each entry is a data file and a small .json sidecar whose mtime
+    records the last use; once the cache grows over max_size the least
+    recently used entries are evicted.
+    """
+
+    def __init__(self, path=None, max_size="50G"):
+        self.path = Path(path) if path is not None else \
+            user_cache_dir() / "downloads"
+        self.max_size = parse_size(max_size)
+        self.path.mkdir(parents=True, exist_ok=True)
+
+    def _entry(self, url: str, meta: dict):
+        """
+        Path to the cache entry for a url at its current version
+        or None if the server gave nothing to version it by
+        """
+        if not meta.get("etag") and not meta.get("modified"):
+            return None
+        version = f"{url}\n{meta.get('etag')}\n{meta.get('modified')}"
+        key = hashlib.sha256(version.encode()).hexdigest()
+        return self.path / key[:2] / key
+
+    def get(self, url: str, meta: dict, dest: Path) -> bool:
+        """
+        Places a cached copy of url at dest
+
+        Returns:
+        bool, True on a cache hit
+        """
+        entry = self._entry(url, meta)
+        if entry is None or not entry.exists():
+            return False
+        if meta.get("size", -1) >= 0 and \
+                entry.stat().st_size != meta["size"]:
+            return False
+        try:
+            _place(entry, dest)
+            os.utime(entry.with_suffix(".json"))
+        except FileNotFoundError:
+            # evicted by another process in the meantime
+            return False
+        return True
+
+    def put(self, url: str, meta: dict, file: Path) -> None:
+        """
+        Adds a freshly downloaded file to the cache
+        """
+        entry = self._entry(url, meta)
+        if entry is None:
+            return
+        entry.parent.mkdir(exist_ok=True)
+        _place(file, entry)
+        with open(entry.with_suffix(".json"), "w") as f:
+            json.dump({"url": url,
+                       "etag": meta.get("etag"),
+                       "modified": meta.get("modified")}, f)
+        self.evict()
+
+    def evict(self) -> int:
+        """
+        Removes least recently used entries until the cache fits max_size
+
+        Returns:
+        int, bytes removed from the cache
+        """
+        entries = []
+        total = 0
+        for side in self.path.glob("*/*.json"):
+            data = side.with_suffix("")
+            try:
+                size = data.stat().st_size
+                used = side.stat().st_mtime
+            except FileNotFoundError:
+                continue
+            entries.append((used, size, data, side))
+            total += size
+        removed = 0
+        for used, size, data, side in sorted(entries):
+            if total - removed <= self.max_size:
+                break
+            for f in (data, side):
+                try:
+                    f.unlink()
+                except FileNotFoundError:
+                    pass
+            removed += size
+        return removed
+
+
+class CatalogCache:
+    """
+    On disk cache of nicermastr query results, one file per target.
+
+    Tables are stored as parquet when pyarrow is installed (the cache
+    extra). pyarrow is left optional on purpose since it is a large
+    dependency for a few KB tables, so a default install stores pickles
+    instead. Entries younger than ttl seconds are used in place of a
+    live query; older ones are still available as a fallback when
+    HEASARC can't be reached. An entry that can't be read is treated as
+    not cached.
+    """
+
+    def __init__(self, path=None, ttl=24 * 3600):
+        self.path = Path(path) if path is not None else \
+            user_cache_dir() / "catalog"
+        self.ttl = ttl
+
+    def _file(self, target: str) -> Path:
+        name = re.sub(r"[^\w.+-]", "_", target.strip())
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            return self.path / f"{name}.pkl"
+        return self.path / f"{name}.parquet"
+
+    def load(self, target: str):
+        """
+        Reads the cached query results of a target
+
+        Returns:
+        tuple, (DataFrame, age in seconds) or None if nothing is cached
+        """
+        import pandas as pd
+        file = self._file(target)
+        try:
+            age = time.time() - file.stat().st_mtime
+        except OSError:
+            return None
+        try:
+            if file.suffix == ".parquet":
+                xti = pd.read_parquet(file)
+            else:
+                xti = pd.read_pickle(file)
+        except Exception as e:
+            # truncated or corrupt (UnpicklingError, EOFError, ArrowInvalid)
+            logger.info(f"Ignoring unreadable cached query results for "
+                        f"{target}: {e}")
+            return None
+        return xti, age
+
+    def save(self, target: str, xti) -> None:
+        """
+        Atomically writes the query results of a target
+        """
+        file = self._file(target)
+        tmp = file.with_name(f"{file.name}.{os.getpid()}.tmp")
+        try:
+            self.path.mkdir(parents=True, exist_ok=True)
+            if file.suffix == ".parquet":
+                xti.to_parquet(tmp, index=False)
+            else:
+                xti.to_pickle(tmp)
+            os.replace(tmp, file)
+        except (OSError, ValueError, TypeError) as e:
+            logger.info(f"Unable to cache query results for {target}: {e}")
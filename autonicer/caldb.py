@@ -0,0 +1,90 @@
+# AutoNICER
+# Copyright 2022-2025 Nicholas Kuechel
+# License Apache 2.0
+
+import subprocess as sp
+import os
+import json
+import datetime
+from .cache import user_cache_dir
+
+# CALDB version resolved in this process and what it was resolved against
+_resolved = {"signature": None, "version": None}
+
+
+def _caldb_signature():
+    """
+    Identifies the state of the CALDB install the version is read from
+
+    For a local CALDB this is the path and mtime of the NICER XTI index
+    file, so updating the CALDB changes it. A remote CALDB can't be
+    checked cheaply, so its signature changes once a day.
+    """
+    caldb = os.environ.get("CALDB")
+    if not caldb:
+        return None
+    if "://" in caldb:
+        return f"{caldb}@{datetime.date.today()}"
+    index = os.path.join(caldb, "data", "nicer", "xti", "caldb.indx")
+    try:
+        return f"{index}@{os.stat(index).st_mtime_ns}"
+    except OSError:
+        return None
+
+
+def _cache_file():
+    return user_cache_dir() / "caldb.json"
+
+
+def _read_cache(signature):
+    try:
+        with open(_cache_file()) as f:
+            cached = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if cached.get("signature") == signature:
+        return cached.get("version")
+    return None
+
+
+def _write_cache(signature, caldb_ver):
+    cache = _cache_file()
+    try:
+        cache.parent.mkdir(parents=True, exist_ok=True)
+        tmp = cache.with_name(f"{cache.name}.{os.getpid()}.tmp")
+        with open(tmp, "w") as f:
+            json.dump({"signature": signature, "version": caldb_ver}, f)
+        os.replace(tmp, cache)
+    except OSError:
+        pass
+
+
+def get_caldb_ver(refresh=False):
+    """
+    Gets most up to nicer caldb version
+
+    nicaldbver is only run when the CALDB install changed since the last
+    lookup. The version is kept for the rest of the process and on disk
+    keyed on the CALDB index file mtime.
+
+    Parameters:
+    refresh: bool, ignore the cached version and run nicaldbver
+    """
+    signature = _caldb_signature()
+    if (not refresh and _resolved["version"]
+            and _resolved["signature"] == signature):
+        return _resolved["version"]
+    caldb_ver = None
+    if not refresh and signature is not None:
+        caldb_ver = _read_cache(signature)
+    if not caldb_ver:
+        caldb = sp.run("nicaldbver", shell=True,
+                       capture_output=True, encoding="utf-8")
+        convo = str(caldb.stdout).split("\n")
+        caldb_ver = convo[0]
+        if caldb_ver and signature is not None:
+            _write_cache(signature, caldb_ver)
+    if caldb_ver:
+        _resolved["signature"] = signature
+        _resolved["version"] = caldb_ver
+    return caldb_ver
@@ -0,0 +1,318 @@
+# AutoNICER
+# Copyright 2022-2025 Nicholas Kuechel
+# License Apache 2.0
+
+import os
+import sys
+import logging
+import argparse as ap
+from termcolor import colored
+from importlib.metadata import version
+from .compress import LEVEL
+
+AUTONICER = os.path.basename(sys.argv[0])
+VERSION = version('autonicer')
+logger = logging.getLogger(AUTONICER)
+
+
+def run(args=None):
+    p = ap.ArgumentParser(
+        description=("A program for piplining NICER data reduction. "
+                     "Run by just typing autonicer.")
+    )
+
+    p.add_argument(
+        "-src",
+        "--src",
+        help="Set the src from the command line",
+        type=str,
+    )
+
+    p.add_argument(
+        "-checkcal",
+        "--checkcal",
+        help=("Checks if mpu7_cl.evt are up to date "
+              "with latest NICER calibrations"),
+        action="store_true",
+        default=False,
+    )
+
+    p.add_argument(
+        "-reprocess",
+        "--reprocess",
+        help="Engages a reprocessing of calibrations ",
+        action="store_true",
+        default=False,
+    )
+
+    p.add_argument(
+        "-gz_native",
+        "--gz-native",
+        dest="gz_native",
+        help=("With --reprocess, leave .gz event files compressed and only "
+              "compress the files nicerl2 writes"),
+        action="store_true",
+        default=False,
+    )
+
+    p.add_argument(
+        "-bc",
+        "--bc",
+        help=("Engages option for a barycenter correction "
+              "in data reduction procedure"),
+        action="store_true",
+        default=None,
+    )
+
+    p.add_argument(
+        "-compress",
+        "--compress",
+        help="Engages option for .gz compression of ufa.evt files",
+        action="store_true",
+        default=None,
+    )
+
+    p.add_argument(
+        "-decompress_inflight",
+        "--decompress-inflight",
+        dest="decompress_inflight",
+        help=("Max bytes being decompressed at once by --reprocess, "
+              "i.e. 500M or 4G (default: 2G)"),
+        default="2G",
+    )
+
+    p.add_argument(
+        "-batch",
+        "--batch",
+        dest="batch",
+        help=("JSON manifest of targets and OBSID selections to download "
+              "and reduce without prompts, sharing one catalog cache, CALDB "
+              "lookup and download pool (see autonicer.batch.Batch)"),
+        default=None,
+    )
+
+    p.add_argument(
+        "-i",
+        "--inlist",
+        dest="inlist",
+        help=(".csv or Unix style pathname pattern whhich lists paths "
+              "to OBSID dirs or mpu7_cl.evt "
+              "files for use with --reprocess and/or --checkcal"),
+        default=None,
+        nargs="+",
+    )
+
+    p.add_argument(
+        "-index",
+        "--index",
+        dest="index",
+        help=("SQLite archive index for --checkcal/--reprocess, datasets "
+              "from --inlist are (re)indexed when their files change, "
+              "--checkcal is answered from the index and --reprocess runs "
+              "on the stale datasets (filtered by --src if given)"),
+        default=None,
+    )
+
+    p.add_argument(
+        "-prefetch",
+        "--prefetch",
+        help=("Number of OBSIDs allowed to download ahead of the "
+              "OBSID being reduced (default: 1)"),
+        type=int,
+        default=1,
+    )
+
+    p.add_argument(
+        "-cache_dir",
+        "--cache-dir",
+        dest="cache_dir",
+        help=("Directory for a persistent cache of downloaded files, "
+              "repeat pulls of an OBSID are served from it"),
+        type=str,
+        default=None,
+    )
+
+    p.add_argument(
+        "-cache_size",
+        "--cache-size",
+        dest="cache_size",
+        help="Size cap of the download cache, e.g. 500M or 50G (default: 50G)",
+        type=str,
+        default="50G",
+    )
+
+    p.add_argument(
+        "-jobs",
+        "--jobs",
+        help=("Number of OBSIDs reduced in parallel, each with its own "
+              "PFILES dir and log file. With --inlist, number of datasets "
+              "checked/reprocessed in parallel (default: 1)"),
+        type=int,
+        default=1,
+    )
+
+    p.add_argument(
+        "-connections",
+        "--connections",
+        help="Number of files downloaded at once (default: 4)",
+        type=int,
+        default=4,
+    )
+
+    p.add_argument(
+        "-inflight",
+        "--inflight",
+        help=("Cap on the bytes of files being downloaded at once, "
+              "e.g. 500M or 2G (default: 2G)"),
+        type=str,
+        default="2G",
+    )
+
+    p.add_argument(
+        "-refresh",
+        "--refresh",
+        help=("Query HEASARC for the target even if cached query results "
+              "are available"),
+        action="store_true",
+        default=False,
+    )
+
+    p.add_argument(
+        "-catalog_ttl",
+        "--catalog-ttl",
+        dest="catalog_ttl",
+        help=("Hours cached query results are used for before HEASARC "
+              "is queried again (default: 24)"),
+        type=float,
+        default=24,
+    )
+
+    p.add_argument(
+        "-incremental",
+        "--incremental",
+        help=("Skip OBSIDs already reduced with the current CALDB and resume "
+              "partly processed ones at the stage they are missing"),
+        action="store_true",
+        default=False,
+    )
+
+    p.add_argument(
+        "-gz_level",
+        "--gz-level",
+        dest="gz_level",
+        help=f"Compression level (1-9) of .gz files (default: {LEVEL})",
+        type=int,
+        choices=range(1, 10),
+        default=LEVEL,
+    )
+
+    p.add_argument(
+        "-gz_workers",
+        "--gz-workers",
+        dest="gz_workers",
+        help="Threads used to compress .gz files (default: all cores)",
+        type=int,
+    )
+
+    p.add_argument(
+        "-disk_budget",
+        "--disk-budget",
+        dest="disk_budget",
+        help=("Cap on the disk taken up by the OBSIDs of the run, e.g. "
+              "50G. An OBSID is only downloaded once its estimated "
+              "footprint fits in what is left of the cap (OBSIDs that are "
+              "done count with what they left on disk) and in the free "
+              "space. OBSIDs resumed by --incremental count with what they "
+              "already take up, other files that were there before the "
+              "run aren't counted"),
+        default=None,
+    )
+
+    p.add_argument(
+        "-prune",
+        "--prune",
+        help=("Remove the uf event files of an OBSID (and the .gz copies of "
+              "files nicerl2 rewrote) once it is reduced (after nicerl2 "
+              "and barycorr)"),
+        action="store_true",
+        default=False,
+    )
+
+    p.add_argument(
+        "-metrics",
+        "--metrics",
+        help=("Append a JSON line per stage of every OBSID (catalog query, "
+              "each download, nicerl2, barycorr, compression, log write) "
+              "and a summary of the run to this file"),
+        default=None,
+    )
+
+    p.add_argument(
+        "--version",
+        action="version",
+        version=f"%(prog)s {VERSION}"
+    )
+
+    argp = p.parse_args(args)
+
+    level = logging.INFO
+    logging.basicConfig(stream=sys.stdout,
+                        level=level,
+                        format="")
+
+    if argp.checkcal is True or argp.reprocess is True:
+        # only what --checkcal/--reprocess need is imported for them
+        from .reprocess import reprocess_check
+        from .reprocess import inlist
+        from .reprocess import indexed
+        from .compress import Decompressor
+        if argp.index is not None:
+            indexed(argp)
+        elif argp.inlist is None:
+            with Decompressor(max_inflight=argp.decompress_inflight) as dc:
+                reprocess_check(argp, decompressor=dc)
+        else:
+            inlist(argp)
+    else:
+        from .autonicer import AutoNICER
+        from .download import Downloader
+        from .cache import DownloadCache
+        from .cache import CatalogCache
+        logger.info(colored("##########  Auto NICER  ##########\n",
+                    "cyan"))
+        metrics = None
+        if argp.metrics is not None:
+            from .metrics import Metrics
+            metrics = Metrics(argp.metrics)
+        cache = None
+        if argp.cache_dir is not None:
+            cache = DownloadCache(argp.cache_dir, argp.cache_size)
+        dl = Downloader(limit=2 * argp.connections, files=argp.connections,
+                        max_inflight=argp.inflight, cache=cache,
+                        metrics=metrics)
+        catalog = CatalogCache(ttl=argp.catalog_ttl * 3600)
+        try:
+            if argp.batch is not None:
+                from .batch import Batch
+                Batch.from_file(argp.batch, downloader=dl, catalog=catalog,
+                                refresh=argp.refresh, metrics=metrics,
+                                bc=argp.bc, compress=argp.compress,
+                                prefetch=argp.prefetch, jobs=argp.jobs,
+                                incremental=argp.incremental,
+                                gz_level=argp.gz_level,
+                                gz_workers=argp.gz_workers,
+                                disk_budget=argp.disk_budget,
+                                prune=argp.prune).run()
+                return
+            an = AutoNICER(argp.src, argp.bc, argp.compress,
+                           prefetch=argp.prefetch, downloader=dl,
+                           jobs=argp.jobs, catalog=catalog,
+                           incremental=argp.incremental,
+                           gz_level=argp.gz_level,
+                           gz_workers=argp.gz_workers, metrics=metrics,
+                           disk_budget=argp.disk_budget, prune=argp.prune)
+            an.call_nicer(argp.refresh)
+            an.command_center()
+        finally:
+            if metrics is not None:
+                metrics.close()
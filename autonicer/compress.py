@@ -0,0 +1,276 @@
+# AutoNICER
+# Copyright 2022-2025 Nicholas Kuechel
+# License Apache 2.0
+
+import os
+import zlib
+import gzip
+import shutil
+import struct
+import tarfile
+import threading
+import concurrent.futures
+from .cache import parse_size
+
+BLOCK_SIZE = 1024 ** 2
+# deflate window, the tail of each block primes the next block's compressor
+WINDOW = 32 * 1024
+# gzip.open's level, what .gz files were always written with
+LEVEL = 9
+# compression ratio assumed when sizing a .gz whose ISIZE may have wrapped
+GZ_RATIO = 4
+
+
+def _deflate_block(block, dictionary, level, last):
+    """
+    Raw deflates one block, ending it on a byte boundary so the blocks
+    can be concatenated into a single deflate stream
+    """
+    if dictionary:
+        comp = zlib.compressobj(level, zlib.DEFLATED, -15, zdict=dictionary)
+    else:
+        comp = zlib.compressobj(level, zlib.DEFLATED, -15)
+    out = comp.compress(block)
+    return out + comp.flush(zlib.Z_FINISH if last else zlib.Z_SYNC_FLUSH)
+
+
+def _header(name, mtime, level):
+    xfl = 2 if level == 9 else 4 if level == 1 else 0
+    return (b"\x1f\x8b\x08\x08" + struct.pack("<I", int(mtime)) +
+            bytes([xfl, 3]) + os.path.basename(name).encode("latin-1",
+                                                            "replace") +
+            b"\x00")
+
+
+def gzip_stream(f_in, f_out, level=LEVEL, executor=None, workers=None,
+                block_size=BLOCK_SIZE, name="", mtime=0):
+    """
+    Block-parallel gzip of an open file (pigz-style)
+
+    The input is split into blocks that are deflated on a thread pool
+    and written out in order as one standard gzip member, so anything
+    that reads .gz can read the output. Only a few blocks per worker are
+    held in memory at once.
+
+    Parameters:
+    f_in: file, binary file to compress
+    f_out: file, binary file the gzip stream is written to
+    level: int, compression level 1-9
+    executor: concurrent.futures.Executor, pool to compress blocks on
+    workers: int, threads compressing blocks (default: all cores)
+    block_size: int, bytes per independently compressed block
+    name: str, original file name stored in the gzip header
+    mtime: float, modification time stored in the gzip header
+
+    Returns:
+    int, bytes read from f_in
+    """
+    workers = workers or os.cpu_count() or 1
+    own = executor is None
+    if own:
+        executor = concurrent.futures.ThreadPoolExecutor(workers)
+    window = 2 * workers
+    crc = 0
+    size = 0
+    pending = []
+    try:
+        f_out.write(_header(name, mtime, level))
+        dictionary = b""
+        block = f_in.read(block_size)
+        while True:
+            following = f_in.read(block_size) if block else b""
+            last = not following
+            crc = zlib.crc32(block, crc)
+            size += len(block)
+            pending.append(executor.submit(_deflate_block, block,
+                                           dictionary, level, last))
+            if last:
+                break
+            dictionary = block[-WINDOW:]
+            block = following
+            while len(pending) >= window:
+                f_out.write(pending.pop(0).result())
+        for future in pending:
+            f_out.write(future.result())
+        f_out.write(struct.pack("<II", crc, size & 0xFFFFFFFF))
+    finally:
+        for future in pending:
+            future.cancel()
+        if own:
+            executor.shutdown()
+    return size
+
+
+def gzip_file(file, level=LEVEL, executor=None, workers=None,
+              block_size=BLOCK_SIZE, keep=False):
+    """
+    Compresses file to file.gz with gzip_stream
+
+    The .gz is written aside and moved into place, so a .gz hard linked
+    from the download cache is replaced rather than truncated, and the
+    original is removed once the .gz is complete.
+
+    Parameters:
+    file: str, file to compress
+    level: int, compression level 1-9
+    executor: concurrent.futures.Executor, pool to compress blocks on
+    workers: int, threads compressing blocks (default: all cores)
+    block_size: int, bytes per independently compressed block
+    keep: bool, keep the original file
+
+    Returns:
+    str, path of the .gz file
+    """
+    dest = f"{file}.gz"
+    tmp = f"{dest}.tmp"
+    try:
+        with open(file, "rb") as f_in, open(tmp, "wb") as f_out:
+            gzip_stream(f_in, f_out, level, executor, workers, block_size,
+                        name=os.path.basename(file),
+                        mtime=os.fstat(f_in.fileno()).st_mtime)
+        os.replace(tmp, dest)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    if not keep:
+        os.remove(file)
+    return dest
+
+
+def gz_size(file):
+    """
+    Bytes a .gz file is charged for while it decompresses
+
+    ISIZE in the trailer is the uncompressed size modulo 4 GiB, so a
+    multi-GB file can report far less than it holds. It is stepped up
+    past the size of the .gz itself (less the few bytes deflate adds to
+    incompressible data), and never taken as less than GZ_RATIO times
+    the .gz, so a wrapped ISIZE doesn't undercount the large files the
+    --decompress-inflight cap is meant to bound.
+    """
+    size = os.path.getsize(file)
+    if size < 18:
+        return size
+    with open(file, "rb") as f:
+        f.seek(-4, os.SEEK_END)
+        isize = struct.unpack("<I", f.read(4))[0]
+    while isize + size // 100 + 1024 < size:
+        isize += 2 ** 32
+    return max(isize, GZ_RATIO * size)
+
+
+def extract_gz(file, dest=None):
+    """
+    Streams file.gz out to file (or dest) and removes the .gz once
+    the decompressed file is complete
+    """
+    if dest is None:
+        dest = str(file).split(".gz")[0]
+    tmp = f"{dest}.tmp"
+    try:
+        with gzip.open(file, "rb") as gz_in, open(tmp, "wb") as orig_out:
+            shutil.copyfileobj(gz_in, orig_out, BLOCK_SIZE)
+        os.replace(tmp, dest)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    os.remove(file)
+    return f"{file} -> {dest}"
+
+
+def extract_tar(file, dest=None):
+    """
+    Streams the members of a .tar.gz out into dest (default: the dir
+    the archive is in) one at a time and removes the archive after
+
+    Members that aren't regular files or directories, or that would land
+    outside of dest, are skipped.
+    """
+    if dest is None:
+        dest = os.path.dirname(os.path.abspath(file))
+    root = os.path.realpath(dest)
+    with tarfile.open(file, "r|gz") as tar:
+        for member in tar:
+            path = os.path.realpath(os.path.join(root, member.name))
+            if os.path.commonpath([root, path]) != root:
+                continue
+            if member.isdir():
+                os.makedirs(path, exist_ok=True)
+            elif member.isfile():
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                tmp = f"{path}.tmp"
+                with tar.extractfile(member) as f_in, open(tmp, "wb") as out:
+                    shutil.copyfileobj(f_in, out, BLOCK_SIZE)
+                os.replace(tmp, path)
+    os.remove(file)
+    return f"{file} extracted"
+
+
+class Decompressor:
+    """
+    Shared pool for decompressing .gz and extracting .tar.gz files.
+
+    One pool is meant to serve a whole --inlist sweep. Every archive is
+    streamed to disk and only removed once its contents are complete, so
+    while it runs both take up space; max_inflight caps the bytes being
+    written at once (an archive larger than the cap runs on its own).
+    """
+
+    def __init__(self, workers=None, max_inflight="2G"):
+        self.workers = workers or os.cpu_count() or 1
+        self.max_inflight = parse_size(max_inflight)
+        self.inflight = 0
+        self._cond = threading.Condition()
+        self._executor = concurrent.futures.ThreadPoolExecutor(self.workers)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self._executor.shutdown()
+
+    def _acquire(self, size):
+        with self._cond:
+            while self.inflight and self.inflight + size > self.max_inflight:
+                self._cond.wait()
+            self.inflight += size
+
+    def _release(self, size):
+        with self._cond:
+            self.inflight -= size
+            self._cond.notify_all()
+
+    def submit(self, file):
+        """
+        Queues up a .gz or .tar.gz file, blocking while the in-flight
+        byte cap is used up
+
+        Returns:
+        concurrent.futures.Future, the result message of the extraction
+        """
+        size = gz_size(file)
+        self._acquire(size)
+        job = extract_tar if str(file).endswith(".tar.gz") else extract_gz
+        try:
+            future = self._executor.submit(job, file)
+        except BaseException:
+            self._release(size)
+            raise
+        future.add_done_callback(lambda f: self._release(size))
+        return future
+
+    def run(self, files):
+        """
+        Decompresses/extracts all files
+
+        Returns:
+        generator, result message of each file as it completes
+        """
+        futures = [self.submit(i) for i in files]
+        for j in concurrent.futures.as_completed(futures):
+            yield j.result()
@@ -0,0 +1,586 @@
+# AutoNICER
+# Copyright 2022-2025 Nicholas Kuechel
+# License Apache 2.0
+
+import os
+import sys
+import logging
+import asyncio
+import aiohttp
+import json
+import heapq
+import itertools
+import random
+import time
+import concurrent.futures
+from urllib.parse import urlsplit
+from pathlib import Path
+from tqdm import tqdm
+from termcolor import colored
+from .cache import parse_size
+
+AUTONICER = os.path.basename(sys.argv[0])
+logger = logging.getLogger(AUTONICER)
+
+WRITE_SIZE = 1024 ** 2
+SEGMENT_SIZE = 8 * 1024 ** 2
+# S3 answers 403 rather than 404 for keys that do not exist
+MISSING = (403, 404)
+
+
+class DownloadError(Exception):
+    """
+    Raised when a file could not be fully downloaded
+    """
+
+
+class TransientError(DownloadError):
+    """
+    Raised for failures worth retrying (5xx responses, short reads)
+    """
+
+
+def _load_state(state_file: Path):
+    """
+    Reads the resume state of a partial download
+    """
+    try:
+        with open(state_file) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _save_state(state_file: Path, state: dict) -> None:
+    """
+    Atomically writes the resume state of a partial download
+    """
+    tmp = state_file.with_name(f"{state_file.name}.tmp")
+    with open(tmp, "w") as f:
+        json.dump(state, f)
+    os.replace(tmp, state_file)
+
+
+def _preallocate(part: Path, size: int) -> None:
+    """
+    Creates part with size bytes reserved on disk up front
+    """
+    with open(part, "wb") as fd:
+        if size > 0:
+            try:
+                os.posix_fallocate(fd.fileno(), 0, size)
+            except (AttributeError, OSError):
+                # not supported by the platform or filesystem
+                fd.truncate(size)
+
+
+def _write_at(fd, offset: int, data: bytes) -> None:
+    """
+    Writes data at offset of an open file
+    """
+    fd.seek(offset)
+    fd.write(data)
+
+
+async def _done(result):
+    return result
+
+
+async def _failed(exc):
+    raise exc
+
+
+async def _cancel(tasks: list) -> None:
+    """
+    Cancels and reaps tasks so none of them keep writing to a file
+    """
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+
+def local_path(url: str, base_dir=None) -> Path:
+    """
+    Maps a HEASARC S3 url onto its path in a local OBSID dataset
+
+    Parameters:
+    url: str, url of a file in the NICER archive
+    base_dir: str, directory the OBSID datasets live in (default: cwd)
+
+    Returns:
+    Path, where the file lives locally (i.e. OBSID/xti/event_cl/...)
+    """
+    split_url = url.split("/")
+    file = Path('/'.join(split_url[7:]))
+    if base_dir is not None:
+        file = Path(base_dir) / file
+    return file
+
+
+class _HostQueue:
+    """
+    Admission queue for the files downloaded from a single host.
+
+    At most max_files files and max_bytes bytes are in flight at once (a
+    file bigger than max_bytes still runs, but on its own). Waiting files
+    are admitted in priority order and largest first within a priority.
+    """
+
+    def __init__(self, max_files, max_bytes):
+        self.max_files = max_files
+        self.max_bytes = max_bytes
+        self.active = 0
+        self.inflight = 0
+        self.waiting = []
+        self._seq = itertools.count()
+
+    def enqueue(self, size: int, priority=0) -> asyncio.Future:
+        """
+        Queues up a file and returns the future that admits it
+        """
+        ticket = asyncio.get_running_loop().create_future()
+        heapq.heappush(self.waiting,
+                       (priority, -size, next(self._seq), size, ticket))
+        return ticket
+
+    def dispatch(self) -> None:
+        """
+        Admits as many waiting files as the limits allow
+        """
+        while self.waiting:
+            size, ticket = self.waiting[0][3:]
+            if ticket.cancelled():
+                heapq.heappop(self.waiting)
+                continue
+            if self.active >= self.max_files:
+                break
+            if self.inflight > 0 and self.inflight + size > self.max_bytes:
+                break
+            heapq.heappop(self.waiting)
+            self.active += 1
+            self.inflight += size
+            ticket.set_result(None)
+
+    def release(self, size: int) -> None:
+        """
+        Frees the slot and bytes of a finished file
+        """
+        self.active -= 1
+        self.inflight -= size
+        self.dispatch()
+
+
+class Downloader:
+    """
+    Download engine that owns a single long lived aiohttp session.
+
+    The session keeps connections alive and caches DNS lookups so the
+    connection setup to the S3 bucket is paid once per run rather than
+    once per file. Use as an async context manager inside the event loop
+    that runs all downloads.
+
+    Files are scheduled across every fetch_all call sharing the
+    Downloader: per host at most files downloads and max_inflight bytes
+    run at once, lower priority values (earlier OBSIDs) go first and the
+    largest files go first within a priority. Connection errors, 5xx
+    responses and short reads are retried with exponential backoff.
+    With metrics set, bytes, time spent queued and transferring and the
+    retries of every file are recorded to it.
+    """
+
+    def __init__(self, limit=8, dns_ttl=300, keepalive=60, segments=4,
+                 min_segment=SEGMENT_SIZE, retries=5, backoff=1.0,
+                 cache=None, write_size=WRITE_SIZE, progress=True, files=4,
+                 max_inflight="2G", metrics=None):
+        self.limit = limit
+        self.dns_ttl = dns_ttl
+        self.keepalive = keepalive
+        self.segments = segments
+        self.min_segment = min_segment
+        self.retries = retries
+        self.backoff = backoff
+        self.files = files
+        self.max_inflight = parse_size(max_inflight)
+        self.cache = cache
+        self.write_size = write_size
+        self.show_progress = progress
+        self.metrics = metrics
+        self.session = None
+        self.progress = None
+        self._io = None
+        self._hosts = {}
+
+    async def __aenter__(self):
+        await self.open()
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    async def open(self):
+        """
+        Opens the pooled session
+        """
+        if self.session is None:
+            connector = aiohttp.TCPConnector(
+                limit=self.limit,
+                limit_per_host=self.limit,
+                ttl_dns_cache=self.dns_ttl,
+                keepalive_timeout=self.keepalive,
+            )
+            # no cap on the total time of a big segment, only on stalls
+            timeout = aiohttp.ClientTimeout(total=None, sock_connect=30,
+                                            sock_read=60)
+            self.session = aiohttp.ClientSession(connector=connector,
+                                                 timeout=timeout)
+            # disk writes are done here to keep them off the event loop
+            self._io = concurrent.futures.ThreadPoolExecutor(
+                max_workers=4, thread_name_prefix="autonicer-io")
+            # one throttled bar for every file in flight
+            self.progress = tqdm(total=0, desc="Downloading", unit="B",
+                                 unit_scale=True, mininterval=0.5,
+                                 leave=False,
+                                 disable=not self.show_progress)
+
+    async def close(self):
+        """
+        Closes the pooled session and all of its connections
+        """
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+            self._io.shutdown(wait=True)
+            self.progress.close()
+            self._hosts.clear()
+
+    def _host(self, url: str) -> _HostQueue:
+        """
+        Admission queue of the host serving url
+        """
+        host = urlsplit(url).netloc
+        if host not in self._hosts:
+            self._hosts[host] = _HostQueue(self.files, self.max_inflight)
+        return self._hosts[host]
+
+    def _delay(self, attempt: int) -> float:
+        """
+        Exponential backoff with jitter before retry number attempt
+        """
+        return min(self.backoff * 2 ** attempt, 60) * random.uniform(0.5, 1)
+
+    async def _head(self, url: str) -> dict:
+        """
+        Gets the size, range support and version of a remote file
+
+        Returns:
+        dict, size (-1 if unknown), ranges, etag and modified of the file
+              or None if the file is not in the archive
+        """
+        for attempt in range(self.retries + 1):
+            try:
+                async with self.session.head(url,
+                                             allow_redirects=True) as resp:
+                    if resp.status in MISSING:
+                        return None
+                    if resp.status >= 500:
+                        raise TransientError(f"HEAD {url} failed "
+                                             f"with code: {resp.status}")
+                    if resp.status != 200:
+                        raise DownloadError(f"HEAD {url} failed "
+                                            f"with code: {resp.status}")
+                    return {
+                        "size": int(resp.headers.get("Content-Length", -1)),
+                        "ranges": resp.headers.get("Accept-Ranges") ==
+                        "bytes",
+                        "etag": resp.headers.get("ETag"),
+                        "modified": resp.headers.get("Last-Modified"),
+                    }
+            except (aiohttp.ClientError, asyncio.TimeoutError,
+                    TransientError) as e:
+                if attempt == self.retries:
+                    raise DownloadError(f"HEAD {url} failed: {e}") from e
+                await asyncio.sleep(self._delay(attempt))
+
+    async def heads(self, urls: list) -> dict:
+        """
+        Looks files up without downloading them, the result can be
+        handed to fetch_all so they aren't looked up again
+
+        Returns:
+        dict, url: HEAD metadata (size, ranges, etag, modified) of each
+              file or None if it is not in the archive
+        """
+        metas = await asyncio.gather(*[self._head(url) for url in urls])
+        return dict(zip(urls, metas))
+
+    def _plan(self, size: int, ranges: bool) -> list:
+        """
+        Splits a file of size bytes into [start, end, written] segments
+        """
+        if size < 0:
+            return [[0, None, 0]]
+        if not ranges or size < 2 * self.min_segment:
+            return [[0, size - 1, 0]]
+        n = min(self.segments, size // self.min_segment)
+        step = -(-size // n)
+        return [[start, min(start + step, size) - 1, 0]
+                for start in range(0, size, step)]
+
+    async def _flush(self, fd, seg, offset, data) -> None:
+        """
+        Writes a buffer of a segment to disk off of the event loop and
+        only then counts it as written
+        """
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self._io, _write_at, fd, offset, data)
+        seg[2] += len(data)
+        self.progress.update(len(data))
+
+    async def _fetch_segment(self, url, part, seg) -> None:
+        """
+        Downloads one [start, end, written] segment of a file into part,
+        picking up from where the segment was last interrupted
+
+        Network reads are gathered into write_size buffers, each written
+        out while the next one is being received.
+        """
+        start, end, written = seg
+        if end is not None and start + written > end:
+            return
+        headers = {}
+        if end is not None:
+            headers["Range"] = f"bytes={start + written}-{end}"
+        async with self.session.get(url, headers=headers) as resp:
+            if resp.status == 200 and start > 0:
+                raise DownloadError(f"GET {url} ignored the range request")
+            elif resp.status == 200 and written > 0:
+                # server ignored the range, start the segment over
+                self.progress.update(-written)
+                seg[2] = written = 0
+            elif resp.status >= 500:
+                raise TransientError(f"GET {url} failed "
+                                     f"with code: {resp.status}")
+            elif resp.status not in (200, 206):
+                raise DownloadError(f"GET {url} failed "
+                                    f"with code: {resp.status}")
+            offset = start + written
+            buf = bytearray()
+            pending = None
+            with open(part, "r+b", buffering=0) as fd:
+                try:
+                    async for chunk in resp.content.iter_any():
+                        buf += chunk
+                        if len(buf) < self.write_size:
+                            continue
+                        if pending is not None:
+                            await pending
+                        pending = asyncio.ensure_future(
+                            self._flush(fd, seg, offset, bytes(buf)))
+                        offset += len(buf)
+                        buf.clear()
+                    if pending is not None:
+                        await pending
+                    pending = None
+                    if buf:
+                        await self._flush(fd, seg, offset, bytes(buf))
+                except (aiohttp.ClientError, asyncio.TimeoutError):
+                    # keep what did arrive so a resume picks up from there
+                    if pending is not None:
+                        await pending
+                        pending = None
+                    if buf:
+                        await self._flush(fd, seg, offset, bytes(buf))
+                    raise
+                finally:
+                    if pending is not None:
+                        await asyncio.gather(pending, return_exceptions=True)
+        if end is not None and seg[2] != end - start + 1:
+            raise TransientError(f"{url} ended after {seg[2]} of "
+                                 f"{end - start + 1} bytes")
+
+    async def _prepare(self, url: str, base_dir=None, heads=None) -> tuple:
+        """
+        Looks a file up (unless it is in heads) and places it from disk
+        or the cache if possible
+
+        Returns:
+        tuple, (local file, HEAD metadata or None, whether it still
+               needs downloading)
+        """
+        file = local_path(url, base_dir)
+        file.parent.mkdir(exist_ok=True, parents=True)
+        if heads is not None and url in heads:
+            meta = heads[url]
+        else:
+            meta = await self._head(url)
+        if meta is None:
+            logger.info(f"Download: {file.name} not found in archive\n")
+            return file, None, False
+        part = file.with_name(f"{file.name}.part")
+        if (file.exists() and not part.exists()
+                and file.stat().st_size == meta["size"]):
+            logger.info(f"{file.name} already downloaded")
+            self._record(url, file, "disk")
+            return file, meta, False
+        if self.cache is not None and self.cache.get(url, meta, file):
+            logger.info(f"{file.name} found in download cache")
+            self._record(url, file, "cache")
+            return file, meta, False
+        return file, meta, True
+
+    def _record(self, url, file, source, seconds=None, **fields):
+        """
+        Adds a file to the metrics of the run if they are kept
+        """
+        if self.metrics is not None:
+            self.metrics.record("file", seconds, file=file.name, url=url,
+                                source=source, **fields)
+
+    async def _download(self, url: str, file: Path, meta: dict,
+                        ticket: asyncio.Future) -> Path:
+        """
+        Downloads a file once the scheduler admits it
+
+        Large files are split into segments fetched in parallel with HTTP
+        Range requests. Data is written to a .part file that is only
+        moved into place once every byte has arrived, and an interrupted
+        download resumes from where each segment left off, both within
+        a run (after a backoff) and across runs.
+        """
+        host = self._host(url)
+        size = max(meta["size"], 0)
+        queued = time.perf_counter()
+        try:
+            await ticket
+        except asyncio.CancelledError:
+            if ticket.done() and not ticket.cancelled():
+                host.release(size)
+            raise
+        queued = time.perf_counter() - queued
+        try:
+            return await self._transfer(url, file, meta, queued)
+        finally:
+            host.release(size)
+
+    async def _transfer(self, url: str, file: Path, meta: dict,
+                        queued=0.0) -> Path:
+        """
+        Moves the bytes of an admitted file into place
+        """
+        start = time.perf_counter()
+        size = meta["size"]
+        part = file.with_name(f"{file.name}.part")
+        state_file = file.with_name(f"{file.name}.part.json")
+        state = _load_state(state_file)
+        if (state is None or not part.exists() or not meta["ranges"]
+                or state["size"] != size or state["etag"] != meta["etag"]):
+            state = {"url": url,
+                     "size": size,
+                     "etag": meta["etag"],
+                     "segments": self._plan(size, meta["ranges"])}
+            await asyncio.get_running_loop().run_in_executor(
+                self._io, _preallocate, part, size)
+        written = sum(seg[2] for seg in state["segments"])
+        if written > 0:
+            logger.info(f"Resuming {file.name} from {written} bytes")
+
+        self.progress.total += max(size, 0)
+        self.progress.update(written)
+        resumed = written
+        for attempt in range(self.retries + 1):
+            tasks = [asyncio.ensure_future(
+                     self._fetch_segment(url, part, seg))
+                     for seg in state["segments"]]
+            try:
+                await asyncio.gather(*tasks)
+                break
+            except (aiohttp.ClientError, asyncio.TimeoutError,
+                    TransientError) as e:
+                await _cancel(tasks)
+                _save_state(state_file, state)
+                if attempt == self.retries:
+                    self._record(url, file, "network",
+                                 time.perf_counter() - start,
+                                 status="failed", retries=attempt,
+                                 queued=round(queued, 4), error=str(e))
+                    raise DownloadError(f"Download: {file.name} "
+                                        f"failed: {e}") from e
+                delay = self._delay(attempt)
+                logger.info(f"Download: {file.name} interrupted "
+                            f"({e}), resuming in {delay:.1f}s...")
+                await asyncio.sleep(delay)
+            except BaseException:
+                await _cancel(tasks)
+                _save_state(state_file, state)
+                raise
+        os.replace(part, file)
+        if state_file.exists():
+            state_file.unlink()
+        self._record(url, file, "network", time.perf_counter() - start,
+                     bytes=sum(seg[2] for seg in state["segments"]) -
+                     resumed, retries=attempt, queued=round(queued, 4))
+        if self.cache is not None:
+            self.cache.put(url, meta, file)
+        return file
+
+    async def fetch(self, url: str, base_dir=None) -> Path:
+        """
+        Downloads data file from a specified url
+
+        Parameters:
+        url: str, url to fetch data from
+        base_dir: str, directory the OBSID datasets live in (default: cwd)
+
+        Returns:
+        Path, the downloaded file or None if it is not in the archive
+        """
+        return (await self.fetch_all([url], base_dir))[0]
+
+    async def fetch_all(self, urls: list, base_dir=None,
+                        priority=0, heads=None) -> list:
+        """
+        Downloads all files from urls over the pooled session
+
+        Every file is looked up first, so the whole batch is queued
+        before the largest of them is admitted.
+
+        Parameters:
+        urls: list, urls to fetch
+        base_dir: str, directory the OBSID datasets live in (default: cwd)
+        priority: int, lower values are downloaded first
+                  (AutoNICER queue position of the OBSID)
+        heads: dict, metadata of files already looked up (see heads)
+
+        Returns:
+        list, downloaded files (None for files not in the archive)
+
+        Raises:
+        DownloadError, if any file could not be fully downloaded
+        """
+        prepared = await asyncio.gather(
+            *[self._prepare(url, base_dir, heads) for url in urls],
+            return_exceptions=True)
+        tasks = []
+        for url, prep in zip(urls, prepared):
+            if isinstance(prep, BaseException):
+                tasks.append(_failed(prep))
+                continue
+            file, meta, needed = prep
+            if not needed:
+                tasks.append(_done(file if meta is not None else None))
+                continue
+            ticket = self._host(url).enqueue(max(meta["size"], 0), priority)
+            tasks.append(self._download(url, file, meta, ticket))
+        for host in self._hosts.values():
+            host.dispatch()
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+        for res in results:
+            if isinstance(res, BaseException):
+                if not isinstance(res, DownloadError):
+                    raise res
+                logger.error(colored(f"ERROR: {res}", "red"))
+        failed = [res for res in results if isinstance(res, DownloadError)]
+        if failed:
+            raise DownloadError(f"{len(failed)} of {len(urls)} "
+                                "files failed to download")
+        return results
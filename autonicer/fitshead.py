@@ -0,0 +1,136 @@
+# AutoNICER
+# Copyright 2022-2025 Nicholas Kuechel
+# License Apache 2.0
+
+import os
+import gzip
+
+BLOCK = 2880
+CARD = 80
+
+
+def _value(raw: str):
+    """
+    Parses the value field of a header card
+    """
+    raw = raw.strip()
+    if raw.startswith("'"):
+        # quoted string, '' is an escaped quote
+        out = []
+        i = 1
+        while i < len(raw):
+            if raw[i] == "'":
+                if raw[i + 1:i + 2] == "'":
+                    out.append("'")
+                    i += 2
+                    continue
+                break
+            out.append(raw[i])
+            i += 1
+        return "".join(out).rstrip()
+    raw = raw.split("/")[0].strip()
+    if raw == "T":
+        return True
+    if raw == "F":
+        return False
+    try:
+        return int(raw)
+    except ValueError:
+        pass
+    try:
+        return float(raw.replace("D", "E"))
+    except ValueError:
+        return raw
+
+
+def _read_header(f) -> dict:
+    """
+    Reads header blocks from f up to and including the END card
+    """
+    header = {}
+    while True:
+        block = f.read(BLOCK)
+        if len(block) < BLOCK:
+            raise IndexError("no more HDUs")
+        text = block.decode("ascii", errors="replace")
+        for i in range(0, BLOCK, CARD):
+            card = text[i:i + CARD]
+            key = card[:8].strip()
+            if key == "END":
+                return header
+            if card[8:10] == "= " and key not in header:
+                header[key] = _value(card[10:])
+
+
+def _data_size(header: dict) -> int:
+    """
+    Bytes of data (padded to whole blocks) following a header
+    """
+    naxis = header.get("NAXIS", 0)
+    if naxis == 0:
+        return 0
+    size = 1
+    for i in range(1, naxis + 1):
+        size *= header.get(f"NAXIS{i}", 0)
+    size = abs(header.get("BITPIX", 8)) // 8 * header.get("GCOUNT", 1) * \
+        (header.get("PCOUNT", 0) + size)
+    return -(-size // BLOCK) * BLOCK
+
+
+def read_headers(path, hdus=2) -> list:
+    """
+    Reads the headers of the first HDUs of a FITS file (.gz too)
+    without reading any of the data
+
+    Only the 2880 byte header blocks are parsed, data in between is
+    seeked over (or, for .gz files, decompressed and dropped up to the
+    last header wanted).
+
+    Parameters:
+    path: str, FITS file
+    hdus: int, number of HDUs to read the headers of
+
+    Returns:
+    list, dict of keyword: value for each HDU found
+
+    Raises:
+    OSError, if the file can't be read or isn't FITS
+    """
+    path = str(path)
+    with open(path, "rb") as raw:
+        compressed = raw.read(2) == b"\x1f\x8b"
+        raw.seek(0)
+        f = gzip.GzipFile(fileobj=raw) if compressed else raw
+        headers = []
+        try:
+            for n in range(hdus):
+                try:
+                    header = _read_header(f)
+                except IndexError:
+                    if n == 0:
+                        raise OSError(f"{path} is not a FITS file")
+                    break
+                if n == 0 and "SIMPLE" not in header:
+                    raise OSError(f"{path} is not a FITS file")
+                headers.append(header)
+                if n + 1 < hdus:
+                    f.seek(_data_size(header), os.SEEK_CUR)
+        except (EOFError, gzip.BadGzipFile) as e:
+            raise OSError(f"{path}: {e}") from e
+        finally:
+            if f is not raw:
+                f.close()
+    return headers
+
+
+def getval(path, key: str, ext=0):
+    """
+    Value of a header keyword of a FITS file (.gz too)
+
+    Raises:
+    OSError, if the file can't be read
+    IndexError, if the file has no HDU ext
+    KeyError, if the keyword isn't in the header
+    """
+    headers = read_headers(path, ext + 1)
+    return headers[ext][key]
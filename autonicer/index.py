@@ -0,0 +1,212 @@
+# AutoNICER
+# Copyright 2022-2025 Nicholas Kuechel
+# License Apache 2.0
+
+import os
+import json
+import time
+import sqlite3
+from .fitshead import read_headers
+
+SCHEMA = ("CREATE TABLE IF NOT EXISTS datasets ("
+          "path TEXT PRIMARY KEY, obsid TEXT, target TEXT, caldb TEXT, "
+          "bc INTEGER, compressed INTEGER, mtime REAL, files TEXT, "
+          "indexed REAL, error TEXT)")
+
+
+def _listing(event_cl: str) -> dict:
+    """
+    Name: (mtime_ns, size) of every .evt/.evt.gz/.tar.gz in event_cl
+    """
+    files = {}
+    with os.scandir(event_cl) as it:
+        for entry in it:
+            if entry.name.endswith((".evt", ".evt.gz", ".tar.gz")):
+                st = entry.stat()
+                files[entry.name] = [st.st_mtime_ns, st.st_size]
+    return files
+
+
+def scan_dataset(path: str, files=None) -> dict:
+    """
+    Reads the calibration state of one OBSID dataset from the headers
+    of its cl.evt files
+
+    Parameters:
+    path: str, OBSID dir
+    files: dict, listing of xti/event_cl (default: listed here)
+
+    Returns:
+    dict, row of the archive index
+    """
+    event_cl = os.path.join(path, "xti", "event_cl")
+    if files is None:
+        files = _listing(event_cl)
+    row = {"path": path, "obsid": None, "target": None, "caldb": None,
+           "bc": 0, "compressed": 0, "mtime": 0.0,
+           "files": json.dumps(files, sort_keys=True),
+           "indexed": time.time(), "error": None}
+    cl = sorted(i for i in files if i.endswith(("cl.evt", "cl.evt.gz")))
+    row["bc"] = int(any(i.startswith("bc") for i in cl))
+    row["compressed"] = int(any(i.endswith(".gz") for i in files))
+    if files:
+        row["mtime"] = max(i[0] for i in files.values()) / 1e9
+    if not cl:
+        row["error"] = "no cl.evt files"
+        return row
+    # the final product is the barycenter corrected file if there is one
+    main = sorted(cl, key=lambda i: (not i.startswith("bc"),
+                                     i.endswith(".gz")))[0]
+    try:
+        hdrs = read_headers(os.path.join(event_cl, main))
+    except OSError as e:
+        row["error"] = str(e)
+        return row
+    primary = hdrs[0]
+    events = hdrs[1] if len(hdrs) > 1 else {}
+    row["obsid"] = primary.get("OBS_ID", events.get("OBS_ID"))
+    row["target"] = primary.get("OBJECT", events.get("OBJECT"))
+    row["caldb"] = events.get("CALDBVER")
+    if row["caldb"] is None:
+        row["error"] = f"no CALDBVER in {main}"
+    return row
+
+
+class ArchiveIndex:
+    """
+    SQLite index of the OBSID datasets of a data archive.
+
+    Stores the OBSID, target, CALDB version, barycenter correction and
+    compression state of each dataset along with the size/mtime of its
+    event files. refresh() only reads headers again for datasets whose
+    event files changed, so checkcal/stale queries over a large archive
+    don't have to touch the data.
+    """
+
+    def __init__(self, path):
+        self.path = str(path)
+        with self._connect() as con:
+            con.execute(SCHEMA)
+            con.execute("CREATE INDEX IF NOT EXISTS datasets_obsid "
+                        "ON datasets (obsid)")
+
+    def _connect(self):
+        con = sqlite3.connect(self.path, timeout=60.0)
+        con.row_factory = sqlite3.Row
+        return _Connection(con)
+
+    def refresh(self, dirs) -> int:
+        """
+        Brings the index up to date for OBSID dirs, rereading only the
+        datasets whose event files changed since they were indexed.
+        Datasets that no longer exist are dropped from the index.
+
+        Parameters:
+        dirs: list, OBSID dirs
+
+        Returns:
+        int, number of datasets (re)read
+        """
+        dirs = [os.path.abspath(i) for i in dirs]
+        with self._connect() as con:
+            known = dict(con.execute("SELECT path, files FROM datasets"))
+        rows = []
+        gone = []
+        for path in dirs:
+            try:
+                files = _listing(os.path.join(path, "xti", "event_cl"))
+            except (FileNotFoundError, NotADirectoryError):
+                if path in known:
+                    gone.append((path,))
+                continue
+            if known.get(path) == json.dumps(files, sort_keys=True):
+                continue
+            rows.append(scan_dataset(path, files))
+        wanted = set(dirs)
+        gone += [(i,) for i in known if i not in wanted
+                 and not os.path.isdir(i)]
+        with self._connect() as con:
+            con.executemany("INSERT OR REPLACE INTO datasets VALUES "
+                            "(:path, :obsid, :target, :caldb, :bc, "
+                            ":compressed, :mtime, :files, :indexed, "
+                            ":error)", rows)
+            con.executemany("DELETE FROM datasets WHERE path = ?", gone)
+        return len(rows)
+
+    def _query(self, where="", args=(), target=None, paths=None):
+        sql = "SELECT * FROM datasets WHERE 1=1" + where
+        args = list(args)
+        if target is not None:
+            sql += " AND target LIKE ?"
+            args.append(f"%{target}%")
+        sql += " ORDER BY obsid, path"
+        with self._connect() as con:
+            rows = [dict(i) for i in con.execute(sql, args)]
+        if paths is not None:
+            paths = {os.path.abspath(i) for i in paths}
+            rows = [i for i in rows if i["path"] in paths]
+        return rows
+
+    def datasets(self, target=None, paths=None) -> list:
+        """
+        Indexed datasets, optionally only those of a target (matched
+        against OBJECT) or within paths
+
+        Returns:
+        list, dict rows of the index
+        """
+        return self._query(target=target, paths=paths)
+
+    def stale(self, caldb: str, target=None, paths=None) -> list:
+        """
+        Datasets reduced with a CALDB other than caldb
+
+        Returns:
+        list, OBSID dirs of the stale datasets
+        """
+        rows = self._query(" AND error IS NULL AND caldb != ?", (caldb,),
+                           target, paths)
+        return [i["path"] for i in rows]
+
+    def status(self, caldb: str, target=None, paths=None) -> list:
+        """
+        Calibration status of the indexed datasets in the form of the
+        --inlist summary
+
+        Returns:
+        list, summary row (Dataset, OBSID, CALDB, Status, Message) each
+        """
+        out = []
+        for i in self._query(target=target, paths=paths):
+            if i["error"] is not None:
+                state = "error"
+            elif i["caldb"] == caldb:
+                state = "up to date"
+            else:
+                state = "stale"
+            out.append({"Dataset": i["path"], "OBSID": i["obsid"] or "",
+                        "CALDB": i["caldb"] or "", "Status": state,
+                        "Message": i["error"] or ""})
+        return out
+
+
+class _Connection:
+    """
+    Commits (or rolls back) and closes a connection at the end of a
+    with block
+    """
+
+    def __init__(self, con):
+        self.con = con
+
+    def __enter__(self):
+        return self.con
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            if exc_type is None:
+                self.con.commit()
+            else:
+                self.con.rollback()
+        finally:
+            self.con.close()
@@ -0,0 +1,146 @@
+# AutoNICER
+# Copyright 2022-2025 Nicholas Kuechel
+# License Apache 2.0
+
+import os
+import csv
+import sqlite3
+import datetime
+
+COLUMNS = ["Input", "OBSID", "CALDB", "DateTime"]
+
+
+class Ledger:
+    """
+    SQLite backed log of the OBSIDs processed by autonicer.
+
+    Every processed OBSID is a single INSERT, so adding to the log costs
+    the same no matter how large it gets. Alongside the database the
+    same rows are appended to a csv (Input, OBSID, CALDB, DateTime) that
+    can be passed straight to --inlist. Writers take the database lock
+    before touching either file, so several runs can share one log.
+    """
+
+    def __init__(self, csv_path, db_path=None, timeout=60.0):
+        self.csv_path = str(csv_path)
+        if db_path is None:
+            db_path = f"{os.path.splitext(self.csv_path)[0]}.sqlite"
+        self.db_path = str(db_path)
+        self.timeout = timeout
+        with self._connect() as con:
+            con.execute("CREATE TABLE IF NOT EXISTS processed ("
+                        "input TEXT, obsid TEXT, caldb TEXT, "
+                        "datetime TEXT)")
+            con.execute("CREATE INDEX IF NOT EXISTS processed_obsid "
+                        "ON processed (obsid)")
+        self._import_csv()
+
+    def _connect(self):
+        con = sqlite3.connect(self.db_path, timeout=self.timeout,
+                              isolation_level=None)
+        con.execute("PRAGMA journal_mode=WAL")
+        return _Transaction(con)
+
+    def _import_csv(self):
+        """
+        Loads the rows of an existing csv log into a new ledger
+        """
+        if not os.path.exists(self.csv_path):
+            return
+        with self._connect() as con:
+            if con.execute("SELECT 1 FROM processed LIMIT 1").fetchone():
+                return
+            with open(self.csv_path, newline="") as f:
+                rows = [[row.get(i, "") for i in COLUMNS]
+                        for row in csv.DictReader(f)]
+            con.executemany("INSERT INTO processed VALUES (?, ?, ?, ?)",
+                            rows)
+
+    def _append_csv(self, row):
+        with open(self.csv_path, "a", newline="") as f:
+            writer = csv.writer(f)
+            if f.tell() == 0:
+                writer.writerow(COLUMNS)
+            writer.writerow(row)
+
+    def add(self, path, obsid, caldb):
+        """
+        Records a processed OBSID
+
+        Parameters:
+        path: str, path to the reduced event file
+        obsid: str, OBSID that was processed
+        caldb: str, CALDB version it was processed with
+        """
+        row = [path, f"NI{obsid}", caldb, f"{datetime.datetime.now()}"]
+        with self._connect() as con:
+            con.execute("INSERT INTO processed VALUES (?, ?, ?, ?)", row)
+            self._append_csv(row)
+
+    def has(self, obsid, caldb):
+        """
+        Whether an OBSID was logged as processed with a CALDB version
+
+        Parameters:
+        obsid: str, OBSID to look up
+        caldb: str, CALDB version it should have been processed with
+        """
+        with self._connect() as con:
+            return con.execute("SELECT 1 FROM processed WHERE obsid = ? "
+                               "AND caldb = ? LIMIT 1",
+                               (f"NI{obsid}", caldb)).fetchone() is not None
+
+    def reset(self):
+        """
+        Clears the ledger and its csv to start a new log
+        """
+        with self._connect() as con:
+            con.execute("DELETE FROM processed")
+            open(self.csv_path, "w").close()
+
+    def rows(self):
+        """
+        All rows of the ledger in the order they were added
+
+        Returns:
+        list, (Input, OBSID, CALDB, DateTime) tuples
+        """
+        with self._connect() as con:
+            return con.execute("SELECT * FROM processed "
+                               "ORDER BY rowid").fetchall()
+
+    def export(self, path=None):
+        """
+        Atomically writes the whole ledger out as a csv log
+
+        Parameters:
+        path: str, csv to write (default: the ledger csv)
+        """
+        path = self.csv_path if path is None else str(path)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with self._connect() as con:
+            with open(tmp, "w", newline="") as f:
+                writer = csv.writer(f)
+                writer.writerow(COLUMNS)
+                writer.writerows(con.execute("SELECT * FROM processed "
+                                             "ORDER BY rowid"))
+            os.replace(tmp, path)
+
+
+class _Transaction:
+    """
+    Holds the write lock of the ledger for the length of a with block
+    """
+
+    def __init__(self, con):
+        self.con = con
+
+    def __enter__(self):
+        self.con.execute("BEGIN IMMEDIATE")
+        return self.con
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            self.con.execute("ROLLBACK" if exc_type else "COMMIT")
+        finally:
+            self.con.close()
@@ -0,0 +1,137 @@
+# AutoNICER
+# Copyright 2022-2025 Nicholas Kuechel
+# License Apache 2.0
+
+import json
+import time
+import threading
+import contextlib
+
+MB = 1024 ** 2
+
+
+class Metrics:
+    """
+    JSON lines record of where the time of a run went.
+
+    Every record is one line holding the stage, the wall time and
+    whatever counters the stage has (bytes, retries, ratio, exit code),
+    written as soon as the stage ends so a long run can be followed
+    with tail -f. Per stage totals are kept along the way and written
+    out as a last "summary" record on close.
+
+    Stages recorded by autonicer:
+    catalog: nicermastr query of a target (source, rows)
+    admit: an OBSID admitted under --disk-budget (estimate, used)
+    file: one downloaded (or cached) file (bytes, queued, retries)
+    download: all files of an OBSID
+    nicerl2, barycorr: HEASoft task of an OBSID (returncode)
+    gzip: one compressed file (bytes, gz_bytes, ratio)
+    compress: compression of an OBSID
+    log: output log write of an OBSID
+    obsid: an OBSID from the start of its download to the end of its
+           last stage (status, failed stage if any)
+    """
+
+    def __init__(self, path):
+        self.path = str(path)
+        self._f = open(self.path, "a", buffering=1)
+        self._lock = threading.Lock()
+        self.totals = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def record(self, stage: str, seconds=None, **fields):
+        """
+        Writes out one record
+
+        Parameters:
+        stage: str, stage the record is of
+        seconds: float, wall time of the stage
+        fields: counters of the stage (bytes, obsid, retries, ...)
+        """
+        rec = {"time": round(time.time(), 3), "stage": stage}
+        if seconds is not None:
+            rec["seconds"] = round(seconds, 4)
+        rec.update(fields)
+        line = json.dumps(rec, default=str)
+        with self._lock:
+            if self._f is None:
+                return
+            self._f.write(f"{line}\n")
+            total = self.totals.setdefault(
+                stage, {"count": 0, "seconds": 0.0, "max_seconds": 0.0,
+                        "bytes": 0})
+            total["count"] += 1
+            if seconds is not None:
+                total["seconds"] += seconds
+                total["max_seconds"] = max(total["max_seconds"], seconds)
+            total["bytes"] += fields.get("bytes") or 0
+
+    @contextlib.contextmanager
+    def timer(self, stage: str, **fields):
+        """
+        Records the wall time of a with block, counters can be added to
+        the dict it yields
+        """
+        start = time.perf_counter()
+        try:
+            yield fields
+        except BaseException as e:
+            fields.setdefault("status", "failed")
+            fields.setdefault("error", str(e))
+            raise
+        finally:
+            self.record(stage, time.perf_counter() - start, **fields)
+
+    def summary(self) -> dict:
+        """
+        Count, total/mean/max wall time and bytes of each stage
+
+        Returns:
+        dict, stage: totals
+        """
+        out = {}
+        with self._lock:
+            for stage, total in self.totals.items():
+                out[stage] = dict(total)
+                out[stage]["seconds"] = round(total["seconds"], 4)
+                out[stage]["max_seconds"] = round(total["max_seconds"], 4)
+                out[stage]["mean_seconds"] = round(
+                    total["seconds"] / total["count"], 4)
+                if total["bytes"] and total["seconds"]:
+                    out[stage]["mb_s"] = round(
+                        total["bytes"] / MB / total["seconds"], 3)
+        return out
+
+    def close(self):
+        """
+        Writes the summary record and closes the file
+        """
+        if self._f is None:
+            return
+        line = json.dumps({"time": round(time.time(), 3),
+                           "stage": "summary", "stages": self.summary()})
+        with self._lock:
+            self._f.write(f"{line}\n")
+            self._f.close()
+            self._f = None
+
+
+def timed(metrics, stage: str, **fields):
+    """
+    Metrics.timer of metrics, or a no-op with the same dict to add
+    counters to if no metrics are kept
+
+    Parameters:
+    metrics: Metrics or None, metrics of the run
+    stage: str, stage the record is of
+    fields: counters of the stage
+    """
+    if metrics is None:
+        return contextlib.nullcontext(fields)
+    return metrics.timer(stage, **fields)
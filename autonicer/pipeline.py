@@ -0,0 +1,381 @@
+# AutoNICER
+# Copyright 2022-2025 Nicholas Kuechel
+# License Apache 2.0
+
+import autonicer
+import os
+import sys
+import glob
+import logging
+import asyncio
+import shutil
+import sqlite3
+import tempfile
+import time
+from termcolor import colored
+from .budget import DiskBudget
+from .budget import dir_size
+from .budget import prune
+from .download import DownloadError
+from .metrics import timed
+from .tasks import TaskError
+from .tasks import pfiles_env
+
+AUTONICER = os.path.basename(sys.argv[0])
+logger = logging.getLogger(AUTONICER)
+
+
+class Pipeline:
+    """
+    Staged download -> reduce -> compress -> log pipeline for the
+    OBSIDs queued up in an AutoNICER instance.
+
+    Stages are joined by bounded queues so the next OBSID downloads while
+    the current one is reduced. prefetch sets how many OBSIDs may be
+    downloaded (or downloading) ahead of the one being reduced.
+
+    HEASoft tasks run as asyncio subprocesses in the same event loop as
+    the downloads, their output going to OBSID/log/niOBSID_autonicer.log
+    (and stdout when jobs is 1). With jobs > 1 that many OBSIDs are
+    reduced at once, each worker with its own PFILES dir.
+
+    A failure in any stage of an OBSID drops that OBSID from the rest of
+    the pipeline while the other OBSIDs keep going; failures are kept in
+    Pipeline.failed and task exit codes/wall times in Pipeline.results.
+
+    With incremental set each OBSID is checked against the current CALDB
+    before it is downloaded (see AutoNICER.plan), OBSIDs that are
+    already done are skipped and partly processed ones start at the
+    first stage they are missing.
+
+    If AutoNICER.metrics is set, the wall time of every stage of every
+    OBSID is recorded to it (see autonicer.metrics.Metrics).
+
+    With a disk budget an OBSID is only downloaded (or resumed) once its
+    estimated footprint fits in what is left of the budget (the OBSIDs
+    of the run that are done count with what they left on disk) and in
+    the free space (see autonicer.budget.DiskBudget). With prune set its
+    uf event files are removed once it is reduced (after nicerl2 and
+    barycorr).
+    """
+
+    def __init__(self, an, prefetch=1, jobs=1, incremental=False,
+                 base_dir=None, budget=None, prune=False):
+        self.an = an
+        self.prefetch = max(1, int(prefetch))
+        self.jobs = max(1, int(jobs))
+        self.incremental = incremental
+        if base_dir is None:
+            base_dir = os.getcwd()
+        self.base_dir = os.path.abspath(base_dir)
+        self.budget = None
+        if budget is not None:
+            self.budget = DiskBudget(budget, self.base_dir)
+        self.prune = prune
+        self._heads = {}
+        self.failed = {}
+        self.results = {}
+        self.stages = {}
+        self.skipped = []
+        self.started = {}
+
+    def _record(self, stage, data, seconds=None, **fields):
+        """
+        Adds a stage of an OBSID to the metrics of the run if they are kept
+        """
+        if self.an.metrics is not None:
+            self.an.metrics.record(stage, seconds, obsid=data["OBSID"],
+                                   **fields)
+
+    def _done(self, data, status="ok", **fields):
+        """
+        Records the time an OBSID took from the start of its first stage
+        and ends its disk reservation
+        """
+        if self.budget is not None and data["OBSID"] in self.budget.reserved:
+            # what the OBSID left on disk stays counted against the budget
+            self.budget.release(data["OBSID"], dir_size(
+                os.path.join(self.base_dir, data["OBSID"])))
+        start = self.started.pop(data["OBSID"], None)
+        if start is not None:
+            self._record("obsid", data, time.perf_counter() - start,
+                         status=status, **fields)
+
+    def _fail(self, data, stage, err):
+        """
+        Records that an OBSID dropped out of the pipeline at stage
+        """
+        self._done(data, "failed", failed_stage=stage, error=str(err))
+        self.failed[data["OBSID"]] = f"{stage}: {err}"
+        logger.info(colored(f"{stage} of {data['OBSID']} failed ({err}), "
+                            f"skipping the rest of {data['OBSID']}", "red"))
+
+    async def _plan(self, data):
+        """
+        Works out which stage an OBSID starts at
+        """
+        if not self.incremental:
+            return "download"
+        loop = asyncio.get_running_loop()
+        if not self.an.caldb_ver:
+            self.an.caldb_ver = await loop.run_in_executor(
+                None, autonicer.get_caldb_ver)
+        stage = await loop.run_in_executor(None, self.an.plan, data,
+                                           self.base_dir)
+        self.stages[data["OBSID"]] = stage
+        if stage == "done":
+            self.skipped.append(data["OBSID"])
+            logger.info(f"{data['OBSID']} is up to date with "
+                        f"{self.an.caldb_ver}... skipping")
+        elif stage != "download":
+            logger.info(f"Resuming {data['OBSID']} at {stage}")
+        return stage
+
+    async def _download(self, out_q, slots, downloader):
+        for n, data in enumerate(self.an.queue):
+            stage = await self._plan(data)
+            if stage == "done":
+                continue
+            if self.budget is not None:
+                try:
+                    await self._admit(data, downloader, stage)
+                except (DownloadError, OSError) as e:
+                    self._heads.pop(data["OBSID"], None)
+                    self._fail(data, "Disk budget", e)
+                    continue
+            await slots.acquire()
+            self.started[data["OBSID"]] = time.perf_counter()
+            if stage != "download":
+                await out_q.put(data)
+                continue
+            logger.info("")
+            logger.info("-" * 60)
+            logger.info((" " * 14) + "Downloading OBSID: " +
+                        colored(str(data["OBSID"]), "cyan"))
+            logger.info("-" * 60)
+            try:
+                with timed(self.an.metrics, "download",
+                           obsid=data["OBSID"]) as rec:
+                    files = await self.an.download(
+                        data, downloader, n, self.base_dir,
+                        self._heads.pop(data["OBSID"], None))
+                    files = [i for i in files or [] if i is not None]
+                    rec["files"] = len(files)
+                    rec["bytes"] = sum(os.path.getsize(i) for i in files)
+            except (DownloadError, OSError) as e:
+                # never hand an incomplete dataset to nicerl2
+                self._fail(data, "Download", e)
+                slots.release()
+                continue
+            await out_q.put(data)
+        await out_q.put(None)
+
+    async def _admit(self, data, downloader, stage="download"):
+        """
+        Waits for the estimated footprint of an OBSID to fit the budget
+        """
+        if stage == "download":
+            heads = await downloader.heads(self.an.download_urls(data))
+            # kept for the download so the files aren't looked up twice
+            self._heads[data["OBSID"]] = heads
+            need = self.budget.estimate({url: max(meta["size"], 0)
+                                         for url, meta in heads.items()
+                                         if meta is not None})
+        else:
+            loop = asyncio.get_running_loop()
+            need = await loop.run_in_executor(None, self._resumed_size,
+                                              data, stage)
+        if self.budget.reserved and \
+                self.budget.used + need > self.budget.cap:
+            logger.info(f"Waiting for disk budget to {stage} "
+                        f"{data['OBSID']} ({need / 1024 ** 3:.2f}G)")
+        await self.budget.acquire(data["OBSID"], need)
+        self._record("admit", data, estimate=need, used=self.budget.used)
+
+    def _resumed_size(self, data, stage) -> int:
+        """
+        Footprint of an OBSID --incremental resumes at stage, what it
+        takes up now plus the bc cl.evt barycorr writes and the .gz
+        copies compression writes next to the event files
+        """
+        obs_dir = os.path.join(self.base_dir, data["OBSID"])
+        event_cl = os.path.join(obs_dir, "xti", "event_cl")
+        size = dir_size(obs_dir)
+        new = 0
+        if stage == "barycorr":
+            ni_cl = os.path.join(event_cl, f"ni{data['OBSID']}_0mpu7_cl.evt")
+            if os.path.exists(ni_cl):
+                new = os.path.getsize(ni_cl)
+        if stage in ("barycorr", "compress") and \
+                self.an.tar_sel.lower() == "y":
+            # a .gz is no larger than its event file and both exist
+            # until it is complete
+            size += new + sum(os.path.getsize(i) for i in
+                              glob.glob(os.path.join(event_cl, "*.evt")))
+        return size + new
+
+    async def _measure(self, data):
+        """
+        Brings the disk reservation of an OBSID down to what it takes up
+        """
+        if self.budget is None:
+            return
+        loop = asyncio.get_running_loop()
+        size = await loop.run_in_executor(
+            None, dir_size, os.path.join(self.base_dir, data["OBSID"]))
+        if data["OBSID"] in self.budget.reserved:
+            self.budget.resize(data["OBSID"], size)
+
+    async def _reduce(self, in_q, out_q, slots, pfiles=None):
+        loop = asyncio.get_running_loop()
+        env = None if pfiles is None else pfiles_env(pfiles)
+        while True:
+            data = await in_q.get()
+            if data is None:
+                # let the other workers see the end of the queue too
+                await in_q.put(None)
+                break
+            # frees a download slot as soon as reduction of this OBSID starts
+            slots.release()
+            stage = self.stages.get(data["OBSID"], "download")
+            if stage in ("compress", "log"):
+                await out_q.put(data)
+                continue
+            logger.info("")
+            logger.info("-" * 60)
+            logger.info((" " * 14) + "Prosessing OBSID: " +
+                        colored(str(data["OBSID"]), "cyan"))
+            logger.info("-" * 60)
+            self.an.caldb_ver = await loop.run_in_executor(
+                None, autonicer.get_caldb_ver)
+            log_path = os.path.join(self.base_dir, data["OBSID"], "log",
+                                    f"ni{data['OBSID']}_autonicer.log")
+            os.makedirs(os.path.dirname(log_path), exist_ok=True)
+            logger.info(f"Reduction output for {data['OBSID']} "
+                        f"in {log_path}")
+            try:
+                # resuming at barycorr keeps the nicerl2 output in the log
+                mode = "ab" if stage == "barycorr" else "wb"
+                with open(log_path, mode) as log:
+                    self.results[data["OBSID"]] = await self.an.areduce(
+                        data, env, log, echo=self.jobs == 1,
+                        start="barycorr" if stage == "barycorr"
+                        else "nicerl2", base_dir=self.base_dir)
+            except (TaskError, OSError) as e:
+                if isinstance(e, TaskError):
+                    self.results[data["OBSID"]] = [e.result]
+                    self._record(e.result.name, data, e.result.seconds,
+                                 returncode=e.result.returncode)
+                self._fail(data, "Reduction", e)
+                continue
+            for i in self.results[data["OBSID"]]:
+                self._record(i.name, data, i.seconds,
+                             returncode=i.returncode)
+            if self.prune:
+                try:
+                    freed = await loop.run_in_executor(
+                        None, prune,
+                        os.path.join(self.base_dir, data["OBSID"]))
+                except OSError as e:
+                    self._fail(data, "Prune", e)
+                    continue
+                logger.info(f"Pruned {freed / 1024 ** 2:.1f}M of "
+                            f"intermediates from {data['OBSID']}")
+            await self._measure(data)
+            await out_q.put(data)
+
+    async def _reduce_all(self, in_q, out_q, slots):
+        if self.jobs == 1:
+            await self._reduce(in_q, out_q, slots)
+        else:
+            dirs = [tempfile.mkdtemp(prefix="autonicer_pfiles_")
+                    for _ in range(self.jobs)]
+            try:
+                await asyncio.gather(*[self._reduce(in_q, out_q, slots, d)
+                                       for d in dirs])
+            finally:
+                for d in dirs:
+                    shutil.rmtree(d, ignore_errors=True)
+        await out_q.put(None)
+
+    async def _compress(self, in_q, out_q):
+        loop = asyncio.get_running_loop()
+        while True:
+            data = await in_q.get()
+            if data is None:
+                break
+            if (self.an.tar_sel.lower() == "y" and
+                    self.stages.get(data["OBSID"]) != "log"):
+                event_cl = os.path.join(self.base_dir, data["OBSID"],
+                                        "xti", "event_cl")
+                try:
+                    with timed(self.an.metrics, "compress",
+                               obsid=data["OBSID"]):
+                        await loop.run_in_executor(
+                            None, self.an.nicer_compress, event_cl)
+                except OSError as e:
+                    self._fail(data, "Compression", e)
+                    continue
+                await self._measure(data)
+            await out_q.put(data)
+        await out_q.put(None)
+
+    async def _log(self, in_q):
+        loop = asyncio.get_running_loop()
+        while True:
+            data = await in_q.get()
+            if data is None:
+                break
+            try:
+                with timed(self.an.metrics, "log", obsid=data["OBSID"]):
+                    await loop.run_in_executor(None, self.an.write_log,
+                                               self.base_dir, data["OBSID"])
+            except (OSError, sqlite3.Error) as e:
+                self._fail(data, "Log write", e)
+                continue
+            self._done(data)
+
+    async def _stages(self, downloader):
+        slots = asyncio.Semaphore(self.prefetch)
+        downloaded = asyncio.Queue(maxsize=self.prefetch)
+        reduced = asyncio.Queue(maxsize=1)
+        compressed = asyncio.Queue(maxsize=1)
+        await asyncio.gather(
+            self._download(downloaded, slots, downloader),
+            self._reduce_all(downloaded, reduced, slots),
+            self._compress(reduced, compressed),
+            self._log(compressed),
+        )
+
+    async def run(self, downloader=None):
+        """
+        Runs every queued OBSID through all stages of the pipeline
+
+        Parameters:
+        downloader: Downloader, opened engine to download with
+                    (AutoNICER.downloader is opened for the run if not
+                    given)
+
+        Returns:
+        dict, OBSIDs that failed and the stage/reason they failed at
+        """
+        if downloader is None:
+            # one pooled session serves every OBSID in the queue
+            async with self.an.downloader as downloader:
+                await self._stages(downloader)
+        else:
+            await self._stages(downloader)
+        if self.skipped:
+            logger.info(f"{len(self.skipped)} of {len(self.an.queue)} "
+                        f"OBSIDs were already up to date")
+        if self.budget is not None:
+            logger.info(f"Peak disk use of the OBSIDs of this run: "
+                        f"{self.budget.peak / 1024 ** 3:.2f}G of "
+                        f"{self.budget.cap / 1024 ** 3:.2f}G")
+        if self.failed:
+            logger.info(colored(f"\n{len(self.failed)} of "
+                                f"{len(self.an.queue)} OBSIDs failed:",
+                                "red"))
+            for obsid, reason in self.failed.items():
+                logger.info(colored(f"{obsid}: {reason}", "red"))
+        return self.failed
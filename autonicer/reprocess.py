@@ -5,43 +5,34 @@
 import autonicer
 import os
 import logging
-import shutil
-import gzip
-import tarfile
-import pandas as pd
-from astropy.io import fits
+import csv
 from termcolor import colored
 import sys
 import glob
+import asyncio
+import tempfile
+import collections
 import concurrent.futures
+from .tasks import TaskError
+from .compress import Decompressor
+from .fitshead import read_headers
+from .cache import parse_size
+from .tasks import pfiles_env
+from .index import ArchiveIndex
 
 AUTONICER = os.path.basename(sys.argv[0])
 logger = logging.getLogger(AUTONICER)
 
 
-def extract_gz(file) -> str:
-    with gzip.open(file, "rb") as gz_in:
-        fname = str(file).split(".gz")
-        with open(fname[0], "wb") as orig_out:
-            shutil.copyfileobj(gz_in, orig_out)
-    os.remove(file)
-    return f"{file} -> {fname[0]}"
-
-
-def extract_tar(file) -> str:
-    with tarfile.open(file, "r:gz") as tfile:
-        tfile.extractall()
-    os.remove(file)
-    return f"{file} extracted"
-
-
 class Reprocess:
-    def __init__(self, cals=None):
+    def __init__(self, cals=None, decompressor=None, base_dir=None):
         if cals is None:
             self.curr_caldb = autonicer.get_caldb_ver()
         else:
             self.curr_caldb = cals
-        self.base_dir = os.getcwd()
+        if base_dir is None:
+            base_dir = os.getcwd()
+        self.base_dir = os.path.abspath(base_dir)
         self.last_caldb = None
         self.calstate = None
         self.src = False
@@ -51,37 +42,60 @@ class Reprocess:
         self.bc_det = False
         self.comp_det = False
         self.reprocess_err = None
+        self.decompressor = decompressor
+        self.headers = {}
+        self.reprocessed = False
+        self.err_msg = None
         self.clevts = self.get_clevts()
 
     def get_clevts(self):
         """
         Gets all cl.evt files associated with an existing NICER dataset
+
+        The .evt.gz files are only read when the dataset has no
+        uncompressed cl.evt files at all. The barycenter corrected file
+        is listed last so it decides the checkcal state.
         """
-        os.chdir("xti/event_cl/")
-        files = glob.glob("*cl.evt")
+        event_cl = f"{self.base_dir}/xti/event_cl/"
+        files = glob.glob(f"{event_cl}*cl.evt")
+        if len(files) == 0:
+            files = glob.glob(f"{event_cl}*cl.evt.gz")
+        files = sorted((os.path.basename(i) for i in files),
+                       key=lambda i: (i.startswith("bc"), i))
         for i in files:
             self.get_meta(i)
-        if f"bc{self.obsid}_0mpu7_cl.evt" in files:
+        if f"bc{self.obsid}_0mpu7_cl.evt" in files or \
+                f"bc{self.obsid}_0mpu7_cl.evt.gz" in files:
             self.bc_det = True
-        os.chdir(self.base_dir)
         return files
 
     def get_meta(self, infile):
         """
         Gets relevant metadata for reprocessing from NICER dataset
+
+        Only the headers of the first two HDUs are read, they are kept
+        for checkcal
         """
-        hdul = fits.open(infile)
         try:
-            self.obsid = hdul[0].header["OBS_ID"]
+            hdrs = read_headers(f"{self.base_dir}/xti/event_cl/{infile}")
+        except OSError as e:
+            logger.info(colored(f"Unable to read {infile}: {e}", "red"))
+            self.reprocess_err = True
+            self.err_msg = f"unable to read {infile}"
+            return self.reprocess_err
+        self.headers[infile] = hdrs
+        try:
+            self.obsid = hdrs[0]["OBS_ID"]
         except KeyError:
             try:
-                self.obsid = hdul[1].header["OBS_ID"]
-            except KeyError:
+                self.obsid = hdrs[1]["OBS_ID"]
+            except (KeyError, IndexError):
                 logger.info(colored("Unable to idenify OBSID", "red"))
                 self.reprocess_err = True
+                self.err_msg = f"no OBS_ID in {infile}"
         try:
-            self.ra = hdul[0].header["RA_OBJ"]
-            self.dec = hdul[0].header["DEC_OBJ"]
+            self.ra = hdrs[0]["RA_OBJ"]
+            self.dec = hdrs[0]["DEC_OBJ"]
 
         except KeyError:
             logger.info(colored("Unable to identify required metadata.",
@@ -90,6 +104,7 @@ class Reprocess:
             logger.info("OR")
             logger.info("Try nicerl2 manually")
             self.reprocess_err = True
+            self.err_msg = f"no RA_OBJ/DEC_OBJ in {infile}"
         return self.reprocess_err
 
     def checkcal(self):
@@ -99,12 +114,10 @@ class Reprocess:
         logger.info(f"Latest NICER CALDB: {self.curr_caldb}")
         logger.info("")
         for i in self.clevts:
-            os.chdir(f"{self.base_dir}/xti/event_cl/")
-            hdul = fits.open(i)
             try:
-                self.last_caldb = hdul[1].header["CALDBVER"]
+                self.last_caldb = self.headers[i][1]["CALDBVER"]
                 logger.info(f"CALDB for {i}: {self.last_caldb}")
-            except KeyError:
+            except (KeyError, IndexError):
                 logger.info(colored("!!!!! CANNOT IDENTIFY CALDB !!!!!",
                                     "red"))
                 break
@@ -120,10 +133,20 @@ class Reprocess:
             logger.info(colored((f"{premessage} Up to date "
                                  "with latest NICER CALDB\n"),
                         color))
-            hdul.close()
-        os.chdir(self.base_dir)
         return self.calstate
 
+    def _extract(self, files):
+        """
+        Runs files through the shared Decompressor (or a temporary one)
+        """
+        if self.decompressor is not None:
+            for j in self.decompressor.run(files):
+                logger.info(j)
+        else:
+            with Decompressor() as decompressor:
+                for j in decompressor.run(files):
+                    logger.info(j)
+
     def decompress(self):
         """
         Extracts/decompresses all files in xti/event_cl
@@ -131,33 +154,83 @@ class Reprocess:
         """
         logger.info(colored(f"######## Decompressing {self.obsid} ########",
                             "green"))
-        os.chdir(f"{self.base_dir}/xti/event_cl/")
-        gzs = glob.glob("*.evt.gz")
-        with concurrent.futures.ThreadPoolExecutor() as executor:
-            exts_gz = [executor.submit(extract_gz, i) for i in gzs]
-            for j in concurrent.futures.as_completed(exts_gz):
-                logger.info(j.result())
-
-        tars = glob.glob("*.tar.gz")
-        with concurrent.futures.ThreadPoolExecutor() as executor:
-            ext_tar = [executor.submit(extract_tar, i) for i in tars]
-            for j in concurrent.futures.as_completed(ext_tar):
-                logger.info(j.result())
+        event_cl = f"{self.base_dir}/xti/event_cl/"
+        gzs = glob.glob(f"{event_cl}*.evt.gz")
+        tars = glob.glob(f"{event_cl}*.tar.gz")
+        self._extract(gzs + tars)
         if len(gzs) > 0 or len(tars) > 0:
             self.comp_det = True
-        os.chdir(self.base_dir)
         return self.comp_det
 
-    def reprocess(self, bc=None, compress=None):
+    def extract_tars(self):
+        """
+        Extracts the .tar.gz archives in xti/event_cl, leaving .gz event
+        files compressed for the HEASoft tasks to read as they are
+        """
+        event_cl = f"{self.base_dir}/xti/event_cl/"
+        if glob.glob(f"{event_cl}*.evt.gz"):
+            self.comp_det = True
+        tars = glob.glob(f"{event_cl}*.tar.gz")
+        self._extract(tars)
+        if len(tars) > 0:
+            self.comp_det = True
+        return self.comp_det
+
+    def remove_stale(self):
+        """
+        Removes the .gz copies of event files nicerl2 just rewrote
+
+        Returns:
+        list, .gz files removed
+        """
+        event_cl = f"{self.base_dir}/xti/event_cl/"
+        stale = [f"{i}.gz" for i in glob.glob(f"{event_cl}*.evt")
+                 if os.path.exists(f"{i}.gz")]
+        for i in stale:
+            os.remove(i)
+        return stale
+
+    def reprocess(self, bc=None, compress=None, gz_native=False, echo=True):
         """
         Reprocesses an existing dataset with latest calibrations
+
+        Parameters:
+        bc: bool, apply a barycenter correction
+        compress: bool, .gz compress the reprocessed event files
+        gz_native: bool, don't decompress the dataset first. nicerl2 reads
+                   its .gz inputs directly and rewrites the event_cl files,
+                   so only tars are extracted and only new outputs are
+                   compressed
+        echo: bool, copy the nicerl2/barycorr output to stdout as well as
+              to log/niOBSID_autonicer.log
+        """
+        # from inside a running event loop await areprocess instead
+        asyncio.run(self.areprocess(bc, compress, gz_native, echo))
+
+    async def areprocess(self, bc=None, compress=None, gz_native=False,
+                         echo=True):
         """
+        Reprocesses an existing dataset with latest calibrations, the
+        decompression and compression run off of the event loop and
+        nicerl2/barycorr with a PFILES dir of their own
+
+        Parameters:
+        bc: bool, apply a barycenter correction
+        compress: bool, .gz compress the reprocessed event files
+        gz_native: bool, only extract tars and compress new outputs
+        echo: bool, copy the nicerl2/barycorr output to stdout as well as
+              to log/niOBSID_autonicer.log
+        """
+        loop = asyncio.get_running_loop()
         if self.calstate is True:
             logger.info(f"Passing Reprocess of {self.obsid}\n")
         elif self.reprocess_err is True:
-            logger.info(colored("!!!!! CANNOT REPROCESS !!!!!"), "red")
+            logger.info(colored("!!!!! CANNOT REPROCESS !!!!!", "red"))
         else:
-            self.decompress()
+            if gz_native is True:
+                await loop.run_in_executor(None, self.extract_tars)
+            else:
+                await loop.run_in_executor(None, self.decompress)
             if bc is True:
                 self.bc_det = bc
             an = autonicer.AutoNICER(src=self.src, bc=self.bc_det, comp=False)
@@ -165,42 +238,199 @@ class Reprocess:
                               "ra": self.ra,
                               "dec": self.dec}
             an.queue.append(reprocess_dict)
-            proc_dir = self.base_dir.split(f"{self.obsid}")
-            os.chdir(proc_dir[0])
-            an.reduce(reprocess_dict)
-            os.chdir(f"{self.base_dir}/xti/event_cl/")
+            proc_dir = os.path.dirname(self.base_dir)
+            log_path = f"{self.base_dir}/log/ni{self.obsid}_autonicer.log"
+            try:
+                os.makedirs(os.path.dirname(log_path), exist_ok=True)
+                with tempfile.TemporaryDirectory(
+                        prefix="autonicer_pfiles_") as pfiles, \
+                        open(log_path, "wb") as log:
+                    await an.areduce(reprocess_dict, pfiles_env(pfiles),
+                                     log, echo, base_dir=proc_dir)
+            except (TaskError, OSError) as e:
+                logger.info(colored(f"!!!!! {e} !!!!!", "red"))
+                self.reprocess_err = True
+                self.err_msg = str(e)
+                return
+            if gz_native is True:
+                for i in await loop.run_in_executor(None, self.remove_stale):
+                    logger.info(f"{i} replaced by reprocessed file")
             if compress is True or self.comp_det is True:
-                an.nicer_compress()
+                await loop.run_in_executor(
+                    None, an.nicer_compress, f"{self.base_dir}/xti/event_cl")
+            self.reprocessed = True
 
 
-def reprocess_check(argp, cals=None):
+def reprocess_check(argp, cals=None, decompressor=None, echo=True,
+                    base_dir=None):
     """
     Parses and Runs --reprocess and --checkcal
+
+    Parameters:
+    base_dir: str, OBSID dir to check (default: cwd)
+
+    Returns:
+    Reprocess, the checked dataset
     """
-    check = Reprocess(cals)
+    check = Reprocess(cals, decompressor, base_dir)
     if argp.checkcal is True:
         check.checkcal()
     if argp.reprocess is True:
-        check.reprocess(argp.bc, argp.compress)
+        check.reprocess(argp.bc, argp.compress,
+                        argp.gz_native, echo)
+    return check
+
+
+def status(check):
+    """
+    Summary status of a dataset after reprocess_check
+    """
+    if check.reprocess_err is True:
+        return "error"
+    if check.reprocessed is True:
+        return "reprocessed"
+    if check.calstate is True:
+        return "up to date"
+    if check.calstate is False:
+        return "stale"
+    if len(check.clevts) == 0:
+        return "error"
+    return "unchecked"
+
+
+def check_dataset(path, argp, cals, decompressor=None, echo=True):
+    """
+    Runs --checkcal and/or --reprocess on one NICER OBSID dir
+
+    Parameters:
+    path: str, OBSID dir
+    argp: argparse.Namespace, parsed CLI options
+    cals: str, current CALDB version
+    decompressor: Decompressor, pool to decompress with (default: one
+                  for this dataset with its argp.jobs share of the cores)
+    echo: bool, copy task output to stdout
+
+    Returns:
+    dict, summary row (Dataset, OBSID, CALDB, Status, Message)
+    """
+    row = {"Dataset": path, "OBSID": "", "CALDB": "", "Status": "error",
+           "Message": ""}
+    if not os.path.isdir(path):
+        logger.info(f"{path} is not a directory! Passing...")
+        row["Message"] = "not a directory"
+        return row
+    try:
+        if decompressor is None:
+            # the --jobs workers split the cores and the in-flight cap, so
+            # a dataset decompresses with fewer threads but the sweep never
+            # runs more threads than there are cores
+            jobs = max(1, argp.jobs)
+            workers = max(1, (os.cpu_count() or 1) // jobs)
+            inflight = parse_size(argp.decompress_inflight) // jobs
+            with Decompressor(workers, inflight) as dc:
+                check = reprocess_check(argp, cals, dc, echo, path)
+        else:
+            check = reprocess_check(argp, cals, decompressor, echo, path)
+    except Exception as e:
+        row["Message"] = str(e)
+        return row
+    row["OBSID"] = check.obsid or ""
+    row["CALDB"] = check.last_caldb or ""
+    row["Status"] = status(check)
+    if check.err_msg is not None:
+        row["Message"] = check.err_msg
+    elif len(check.clevts) == 0:
+        row["Message"] = "no cl.evt files"
+    return row
+
+
+def _init_worker(pfiles_root):
+    """
+    Quiets the log of a --inlist worker process and gives it its own
+    PFILES dir so parallel HEASoft tasks don't share .par files
+    """
+    logger.setLevel(logging.WARNING)
+    pfiles = tempfile.mkdtemp(dir=pfiles_root)
+    os.environ["PFILES"] = pfiles_env(pfiles)["PFILES"]
+
+
+def sweep(dirs, argp, cals, decomp):
+    """
+    Runs check_dataset on every dataset, in a process pool with
+    argp.jobs workers when jobs > 1
+
+    Returns:
+    list, summary row of each dataset in the order given
+    """
+    if argp.jobs <= 1:
+        rows = []
+        for i in dirs:
+            logger.info(f"Migrating to {colored(i, 'cyan')}")
+            rows.append(check_dataset(i, argp, cals, decomp))
+        return rows
+    logger.info(f"Checking {len(dirs)} datasets with {argp.jobs} workers "
+                "(task output in each OBSID/log dir)")
+    with tempfile.TemporaryDirectory(prefix="autonicer_pfiles_") as root:
+        with concurrent.futures.ProcessPoolExecutor(
+                argp.jobs, initializer=_init_worker,
+                initargs=(root,)) as executor:
+            futures = [executor.submit(check_dataset, i, argp, cals, None,
+                                       False) for i in dirs]
+            rows = []
+            for i, future in zip(dirs, futures):
+                try:
+                    rows.append(future.result())
+                except Exception as e:
+                    rows.append({"Dataset": i, "OBSID": "", "CALDB": "",
+                                 "Status": "error", "Message": str(e)})
+    return rows
+
+
+def summarize(rows, cals):
+    """
+    Logs a table of the status of every dataset of a --inlist sweep
+    """
+    if len(rows) == 0:
+        return
+    columns = list(rows[0])
+    widths = [max(len(c), *(len(str(r[c])) for r in rows)) for c in columns]
+    logger.info("")
+    logger.info(f"Latest NICER CALDB: {cals}")
+    logger.info(" ".join(c.rjust(w) for c, w in zip(columns, widths)))
+    for r in rows:
+        logger.info(" ".join(str(r[c]).rjust(w)
+                             for c, w in zip(columns, widths)))
+    counts = collections.Counter(r["Status"] for r in rows)
+    logger.info(", ".join(f"{n} {s}" for s, n in counts.most_common()))
 
 
 def inlist(argp):
     """
     Runs --reprocess and/or checkcal for an input file
     with paths to NICER OBSID dirs or .evt files
+
+    Returns:
+    list, summary row of each dataset
     """
-    cwd = os.getcwd()
-    curr_cals = autonicer.get_caldb_ver()
+    with Decompressor(max_inflight=argp.decompress_inflight) as decomp:
+        return _inlist(argp, decomp)
+
+
+def resolve_inlist(argp):
+    """
+    Resolves --inlist (csv with an Input column, OBSID dirs or a Unix
+    style pathname pattern) to the OBSID dirs it lists
+
+    Returns:
+    list, OBSID dirs
+    """
+    dirs = []
     try:
         if len(argp.inlist) == 1:
             try:
-                df = pd.read_csv(f"{argp.inlist[0]}")
-                for i in df["Input"]:
-                    path_sep = i.split("/xti/event_cl/")
-                    os.chdir(path_sep[0])
-                    if argp.checkcal is True or argp.reprocess is True:
-                        reprocess_check(argp, curr_cals)
-                    os.chdir(cwd)
+                with open(argp.inlist[0], newline="") as f:
+                    dirs = [i["Input"].split("/xti/event_cl/")[0]
+                            for i in csv.DictReader(f)]
             except IsADirectoryError:
                 raise FileNotFoundError
         else:
@@ -210,21 +440,53 @@ def inlist(argp):
         dirs = argp.inlist
         if len(argp.inlist) == 1:
             dirs = glob.glob(f"{argp.inlist[0]}")
-        if len(dirs) != 0:
-            for i in dirs:
-                try:
-                    os.chdir(i)
-                    logger.info(f"Migrating to {colored(i, 'cyan')}")
-                    if argp.checkcal is True or argp.reprocess is True:
-                        reprocess_check(argp, curr_cals)
-                    os.chdir(cwd)
-                except NotADirectoryError:
-                    logger.info(f"{i} is not a directory! Passing...")
-        else:
+        if len(dirs) == 0:
             logger.info(colored("DATASETS NOT FOUND", "red"))
-    except pd.errors.ParserError:
+    except (csv.Error, UnicodeDecodeError):
         logger.info(colored(f"Unable to resolve --inlist {argp.inlist[0]}",
                             "red"))
     except KeyError:
         logger.info(colored(f"{argp.inlist[0]} format not readable", "red"))
         logger.info("Format must be csv with Input column for inlist files.")
+    return dirs
+
+
+def _inlist(argp, decomp):
+    curr_cals = autonicer.get_caldb_ver()
+    dirs = resolve_inlist(argp)
+    if argp.checkcal is not True and argp.reprocess is not True:
+        return []
+    rows = sweep(dirs, argp, curr_cals, decomp)
+    summarize(rows, curr_cals)
+    return rows
+
+
+def indexed(argp):
+    """
+    Runs --checkcal and/or --reprocess off of the --index archive index
+
+    --inlist datasets are (re)indexed first, rereading only those whose
+    event files changed, and limit the query to them. --checkcal is
+    answered from the index alone and --reprocess sweeps just the stale
+    datasets, which are then indexed again.
+
+    Returns:
+    list, summary row of each dataset
+    """
+    index = ArchiveIndex(argp.index)
+    curr_cals = autonicer.get_caldb_ver()
+    paths = None
+    if argp.inlist is not None:
+        paths = resolve_inlist(argp)
+        n = index.refresh(paths)
+        logger.info(f"Indexed {n} new/changed of {len(paths)} datasets")
+    if argp.reprocess is True:
+        dirs = index.stale(curr_cals, argp.src, paths)
+        logger.info(f"{len(dirs)} stale datasets to reprocess")
+        with Decompressor(max_inflight=argp.decompress_inflight) as decomp:
+            rows = sweep(dirs, argp, curr_cals, decomp)
+        index.refresh(dirs)
+    else:
+        rows = index.status(curr_cals, argp.src, paths)
+    summarize(rows, curr_cals)
+    return rows
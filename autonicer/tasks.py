@@ -0,0 +1,91 @@
+# AutoNICER
+# Copyright 2022-2025 Nicholas Kuechel
+# License Apache 2.0
+
+import os
+import sys
+import time
+import logging
+import asyncio
+from collections import namedtuple
+
+AUTONICER = os.path.basename(sys.argv[0])
+logger = logging.getLogger(AUTONICER)
+
+TaskResult = namedtuple("TaskResult", ["name", "returncode", "seconds"])
+
+
+def pfiles_env(path: str) -> dict:
+    """
+    Environment whose PFILES puts a private parameter file dir in front
+    of the system one, so concurrent HEASoft tasks never write each
+    other's .par files
+
+    Parameters:
+    path: str, directory for the task's own .par files
+    """
+    env = os.environ.copy()
+    syspfiles = env.get("PFILES", "").split(";")[-1]
+    if syspfiles == "" and "HEADAS" in env:
+        syspfiles = os.path.join(env["HEADAS"], "syspfiles")
+    env["PFILES"] = f"{path};{syspfiles}"
+    return env
+
+
+class TaskError(Exception):
+    """
+    Raised when a reduction task exits with a non-zero status
+    """
+
+    def __init__(self, result: TaskResult):
+        super().__init__(f"{result.name} failed with exit code "
+                         f"{result.returncode}")
+        self.result = result
+
+
+async def run_task(args: list, log=None, env=None, cwd=None,
+                   echo=False) -> TaskResult:
+    """
+    Runs a HEASoft task as an asyncio subprocess
+
+    stdout and stderr are streamed line by line into log as the task
+    runs, and the exit code and wall time are recorded at the end.
+
+    Parameters:
+    args: list, the task and its parameters (i.e. ["nicerl2", "indir=..."])
+    log: file, binary file the task output is written to
+    env: dict, environment for the task (default: inherited)
+    cwd: str, directory the task is run from (default: cwd)
+    echo: bool, also copy the task output to stdout
+
+    Returns:
+    TaskResult, name, exit code and wall time of the task
+
+    Raises:
+    TaskError, if the task exits non-zero or cannot be started
+    """
+    name = os.path.basename(args[0])
+    start = time.perf_counter()
+    try:
+        proc = await asyncio.create_subprocess_exec(
+            *args, stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.STDOUT, env=env, cwd=cwd)
+    except OSError as e:
+        logger.error(f"ERROR: unable to start {name}: {e}")
+        raise TaskError(TaskResult(name, 127, 0.0)) from e
+    if log is not None:
+        log.write(f"$ {' '.join(args)}\n".encode())
+    async for line in proc.stdout:
+        if log is not None:
+            log.write(line)
+        if echo:
+            sys.stdout.write(line.decode(errors="replace"))
+    returncode = await proc.wait()
+    result = TaskResult(name, returncode, time.perf_counter() - start)
+    if log is not None:
+        log.write(f"# {name} exited {returncode} after "
+                  f"{result.seconds:.1f}s\n".encode())
+        log.flush()
+    if returncode != 0:
+        raise TaskError(result)
+    return result
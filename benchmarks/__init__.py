@@ -0,0 +1,6 @@
+# AutoNICER
+# Copyright 2022-2025 Nicholas Kuechel
+# License Apache 2.0
+"""
+Offline benchmarks of autonicer (run with python -m benchmarks)
+"""
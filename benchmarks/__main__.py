@@ -0,0 +1,199 @@
+# AutoNICER
+# Copyright 2022-2025 Nicholas Kuechel
+# License Apache 2.0
+
+import os
+import sys
+import json
+import logging
+import datetime
+import platform
+import tempfile
+import subprocess
+import argparse as ap
+from importlib.metadata import version
+from importlib.metadata import PackageNotFoundError
+from autonicer.cache import user_cache_dir
+from autonicer.compress import LEVEL
+from .suites import SUITES
+from .suites import events_file
+from .suites import run_suite
+
+
+def results_dir():
+    """
+    Default dir of results files ($XDG_CACHE_HOME/autonicer/benchmarks),
+    kept out of the source tree
+    """
+    return os.path.join(user_cache_dir(), "benchmarks")
+
+
+def autonicer_version():
+    try:
+        return version("autonicer")
+    except PackageNotFoundError:
+        return "unknown"
+
+
+def revision():
+    """
+    git describe of the tree being benchmarked, the installed version
+    doesn't change with the code
+    """
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    try:
+        out = subprocess.run(["git", "describe", "--always", "--dirty"],
+                             cwd=root, capture_output=True, text=True)
+    except OSError:
+        return "unknown"
+    return out.stdout.strip() or "unknown"
+
+
+def compare(results: dict, baseline: dict, threshold=0.1) -> list:
+    """
+    Compares the metrics of two benchmark runs
+
+    Parameters:
+    results: dict, benchmark run to check
+    baseline: dict, benchmark run to check against
+    threshold: float, relative change that counts as a regression
+
+    Returns:
+    list, (suite, metric, baseline, result, change, regressed) rows of
+    the metrics found in both runs
+    """
+    rows = []
+    for suite, metrics in results["results"].items():
+        for name, new in metrics.items():
+            old = baseline["results"].get(suite, {}).get(name)
+            if old is None or old["value"] == 0:
+                continue
+            change = new["value"] / old["value"] - 1
+            worse = -change if new["better"] == "higher" else change
+            rows.append((suite, name, old["value"], new["value"], change,
+                         worse > threshold))
+    return rows
+
+
+def report(results: dict, baseline=None, threshold=0.1) -> bool:
+    """
+    Prints the metrics of a run (against baseline if given)
+
+    Returns:
+    bool, whether any metric regressed past threshold
+    """
+    print(f"\nautonicer {results['autonicer']} "
+          f"({results.get('revision', 'unknown')}) on {results['machine']}")
+    for suite, metrics in results["results"].items():
+        for name, m in metrics.items():
+            print(f"{suite:<11}{name:<24}{m['value']:>12.3f} {m['unit']}")
+    if baseline is None:
+        return False
+    print(f"\nagainst autonicer {baseline['autonicer']} "
+          f"({baseline.get('revision', 'unknown')}) on "
+          f"{baseline['machine']} ({baseline['date']})")
+    regressed = False
+    for suite, name, old, new, change, worse in compare(results, baseline,
+                                                        threshold):
+        flag = "  REGRESSION" if worse else ""
+        print(f"{suite:<11}{name:<24}{old:>12.3f}{new:>12.3f}"
+              f"{change:>+9.1%}{flag}")
+        regressed |= worse
+    return regressed
+
+
+def main(args=None):
+    p = ap.ArgumentParser(
+        prog="python -m benchmarks",
+        description=("Offline benchmarks of autonicer against a local "
+                     "stand-in for the HEASARC S3 archive and stub HEASoft "
+                     "tasks"))
+    p.add_argument("suites", nargs="*", default=list(SUITES),
+                   help=f"benchmarks to run (default: {' '.join(SUITES)})")
+    p.add_argument("--obsids", type=int, default=4,
+                   help="OBSIDs served by the archive (default: 4)")
+    p.add_argument("--file-size", dest="file_size", type=float, default=4,
+                   help="MB per large archive file (default: 4)")
+    p.add_argument("--latency", type=float, default=0,
+                   help="ms before each archive response (default: 0)")
+    p.add_argument("--connections", type=int, default=4,
+                   help="files downloaded at once (default: 4)")
+    p.add_argument("--prefetch", type=int, default=1,
+                   help="OBSIDs downloaded ahead (default: 1)")
+    p.add_argument("--jobs", type=int, default=1,
+                   help="OBSIDs reduced/datasets checked at once "
+                        "(default: 1)")
+    p.add_argument("--nicerl2", type=float, default=0.5,
+                   help="seconds the stub nicerl2 takes (default: 0.5)")
+    p.add_argument("--barycorr", type=float, default=0.1,
+                   help="seconds the stub barycorr takes (default: 0.1)")
+    p.add_argument("--evt-size", dest="evt_size", type=float, default=16,
+                   help="MB per ufa.evt file (default: 16)")
+    p.add_argument("--files", type=int, default=4,
+                   help="ufa.evt files to (de)compress (default: 4)")
+    p.add_argument("--level", type=int, default=LEVEL,
+                   help=f".gz compression level (default: {LEVEL})")
+    p.add_argument("--workers", type=int, default=None,
+                   help="compression threads (default: all cores)")
+    p.add_argument("--datasets", type=int, default=200,
+                   help="datasets in the checkcal sweep (default: 200)")
+    p.add_argument("--repeat", type=int, default=3,
+                   help="runs per benchmark, the median is kept "
+                        "(default: 3)")
+    p.add_argument("--work-dir", dest="work_dir", default=None,
+                   help="scratch dir (default: a temporary dir)")
+    p.add_argument("-o", "--output", default=None,
+                   help=("results file (default: $XDG_CACHE_HOME/autonicer/"
+                         "benchmarks/<revision>-<host>-<date>.json)"))
+    p.add_argument("--compare", default=None,
+                   help="results file to compare against")
+    p.add_argument("--threshold", type=float, default=0.1,
+                   help="relative change counted as a regression "
+                        "(default: 0.1)")
+    p.add_argument("-v", "--verbose", action="store_true",
+                   help="show autonicer output")
+    argp = p.parse_args(args)
+    unknown = [i for i in argp.suites if i not in SUITES]
+    if unknown:
+        p.error(f"unknown benchmark(s) {', '.join(unknown)}")
+
+    logging.basicConfig(stream=sys.stdout, format="%(message)s",
+                        level=logging.INFO if argp.verbose
+                        else logging.WARNING)
+    now = datetime.datetime.now()
+    results = {"autonicer": autonicer_version(),
+               "revision": revision(),
+               "date": now.isoformat(timespec="seconds"),
+               "machine": f"{platform.node()} ({os.cpu_count()} cpus)",
+               "python": platform.python_version(),
+               "params": {k: v for k, v in vars(argp).items()
+                          if k not in ("output", "compare", "work_dir",
+                                       "verbose", "threshold")},
+               "results": {}}
+    with tempfile.TemporaryDirectory(prefix="autonicer_bench_",
+                                     dir=argp.work_dir) as work:
+        argp.events = events_file(work, argp)
+        for suite in argp.suites:
+            print(f"running {suite}...", flush=True)
+            results["results"][suite] = run_suite(suite, work, argp)
+
+    output = argp.output
+    if output is None:
+        output = os.path.join(results_dir(), f"{results['revision']}-"
+                                             f"{platform.node() or 'host'}-"
+                                             f"{now:%Y%m%d-%H%M%S}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2)
+
+    baseline = None
+    if argp.compare is not None:
+        with open(argp.compare) as f:
+            baseline = json.load(f)
+    regressed = report(results, baseline, argp.threshold)
+    print(f"\nresults saved to {output}")
+    return 1 if regressed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,202 @@
+# AutoNICER
+# Copyright 2022-2025 Nicholas Kuechel
+# License Apache 2.0
+
+import os
+import time
+import threading
+from http.server import BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer
+
+S3 = "https://nasa-heasarc.s3.amazonaws.com/nicer/data/obs/"
+CALDB = "xti20240206"
+BLOCK = 2880
+# TIME, PI, PHA, DET_ID
+ROW = 8 + 2 + 2 + 1
+
+
+def obsid_info(n: int) -> dict:
+    """
+    AutoNICER.queue entry of the nth synthetic OBSID
+    """
+    return {"OBSID": f"{1000000001 + n}", "year": "2019", "month": "01",
+            "ra": 83.633, "dec": 22.0145}
+
+
+def obsid_links(info: dict) -> dict:
+    """
+    Big and small file urls of an OBSID dataset in the HEASARC S3 layout
+    (AutoNICER._make_download_links)
+    """
+    from autonicer.autonicer import AutoNICER
+    return AutoNICER._make_download_links(None, info)
+
+
+def synthetic_events(rows: int, seed=0) -> bytes:
+    """
+    Big endian event table rows that compress about as well as real
+    NICER event files (increasing TIMEs, clustered PI/PHA, 56 DET_IDs)
+    """
+    import numpy as np
+    rng = np.random.default_rng(seed)
+    events = np.zeros(rows, dtype=[("TIME", ">f8"), ("PI", ">i2"),
+                                   ("PHA", ">i2"), ("DET_ID", "u1")])
+    events["TIME"] = 1.9e8 + np.cumsum(rng.exponential(1e-3, rows))
+    events["PI"] = rng.poisson(150, rows)
+    events["PHA"] = events["PI"] * 3 + rng.integers(0, 40, rows)
+    events["DET_ID"] = rng.integers(0, 56, rows)
+    return events.tobytes()
+
+
+def _card(key: str, value) -> bytes:
+    if isinstance(value, bool):
+        value = f"{'T' if value else 'F':>20}"
+    elif isinstance(value, str):
+        value = f"'{value:<8}'"
+    else:
+        value = f"{value:>20}"
+    return f"{key:<8}= {value}".ljust(80).encode("ascii")
+
+
+def _header(cards: list) -> bytes:
+    header = b"".join(_card(k, v) for k, v in cards)
+    header += b"END".ljust(80)
+    return header + b" " * (-len(header) % BLOCK)
+
+
+def write_evt(path, obsid: str, caldb=CALDB, data=b"", target="BENCH"):
+    """
+    Writes a minimal NICER event file, a primary HDU with the OBSID,
+    target and pointing and an EVENTS table of data (synthetic_events
+    rows)
+    """
+    primary = _header([("SIMPLE", True), ("BITPIX", 8), ("NAXIS", 0),
+                       ("EXTEND", True), ("OBS_ID", obsid),
+                       ("OBJECT", target), ("RA_OBJ", 83.633),
+                       ("DEC_OBJ", 22.0145)])
+    events = _header([("XTENSION", "BINTABLE"), ("BITPIX", 8),
+                      ("NAXIS", 2), ("NAXIS1", ROW),
+                      ("NAXIS2", len(data) // ROW), ("PCOUNT", 0),
+                      ("GCOUNT", 1), ("TFIELDS", 4), ("TTYPE1", "TIME"),
+                      ("TFORM1", "1D"), ("TTYPE2", "PI"), ("TFORM2", "1I"),
+                      ("TTYPE3", "PHA"), ("TFORM3", "1I"),
+                      ("TTYPE4", "DET_ID"), ("TFORM4", "1B"),
+                      ("EXTNAME", "EVENTS"), ("OBS_ID", obsid),
+                      ("CALDBVER", caldb)])
+    tmp = f"{path}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(primary)
+        f.write(events)
+        f.write(data)
+        f.write(b"\x00" * (-len(data) % BLOCK))
+    os.replace(tmp, path)
+
+
+class Handler(BaseHTTPRequestHandler):
+    """
+    Serves the files of server.sizes out of the shared server.payload
+    with HEAD/GET/Range support, after server.latency seconds. One
+    handler serves one TCP connection, counted in server.connections
+    """
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def setup(self):
+        super().setup()
+        with self.server.lock:
+            self.server.connections += 1
+
+    def _body(self):
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        size = self.server.sizes.get(self.path)
+        if size is None:
+            self.send_response(404)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return None
+        start, end = 0, size - 1
+        rng = self.headers.get("Range")
+        if rng is not None:
+            first, last = rng.split("=")[1].split("-")
+            start = int(first)
+            end = min(int(last), end) if last else end
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+        else:
+            self.send_response(200)
+        self.send_header("Content-Length", str(end - start + 1))
+        self.send_header("Accept-Ranges", "bytes")
+        self.send_header("ETag", '"bench"')
+        self.end_headers()
+        return memoryview(self.server.payload)[start:end + 1]
+
+    def do_HEAD(self):
+        self._body()
+        with self.server.lock:
+            self.server.heads += 1
+
+    def do_GET(self):
+        body = self._body()
+        if body is not None:
+            self.wfile.write(body)
+        with self.server.lock:
+            self.server.requests += 1
+
+
+class Archive:
+    """
+    Local stand-in for the HEASARC S3 bucket serving synthetic OBSID
+    datasets (every file of AutoNICER._make_download_links)
+
+    Parameters:
+    obsids: int, number of OBSIDs served
+    big: int, bytes of each of the large files (.mkf, .att, .evt)
+    small: int, bytes of each of the small files (logs, hk, products)
+    latency: float, seconds before each response (time to first byte)
+    """
+
+    def __init__(self, obsids=2, big=4 * 1024 ** 2, small=16 * 1024,
+                 latency=0.0):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.server.payload = os.urandom(max(big, small))
+        self.server.latency = latency
+        self.server.lock = threading.Lock()
+        self.server.requests = 0
+        self.server.heads = 0
+        self.server.connections = 0
+        self.server.sizes = {}
+        self.url = (f"http://127.0.0.1:{self.server.server_port}"
+                    "/nicer/data/obs/")
+        self.queue = [obsid_info(i) for i in range(obsids)]
+        self.total = 0
+        for info in self.queue:
+            urls = obsid_links(info)
+            for url, size in [(i, big) for i in urls["big"]] + \
+                    [(i, small) for i in urls["small"]]:
+                path = url.replace(S3, "/nicer/data/obs/")
+                if path not in self.server.sizes:
+                    self.server.sizes[path] = size
+                    self.total += size
+        self._thread = None
+
+    def urls(self, info: dict) -> list:
+        """
+        Urls of an OBSID dataset on this archive
+        """
+        urls = obsid_links(info)
+        return [i.replace(S3, self.url)
+                for i in dict.fromkeys(urls["big"] + urls["small"])]
+
+    def __enter__(self):
+        self._thread = threading.Thread(target=self.server.serve_forever,
+                                        daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
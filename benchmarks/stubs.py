@@ -0,0 +1,131 @@
+# AutoNICER
+# Copyright 2022-2025 Nicholas Kuechel
+# License Apache 2.0
+
+import os
+import sys
+import time
+import shutil
+import contextlib
+from . import archive
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TASKS = ("nicerl2", "barycorr", "nicaldbver")
+# seconds each stub takes by default
+RUNTIMES = {"nicerl2": 0.5, "barycorr": 0.1, "nicaldbver": 0.0}
+LAUNCHER = """#!{python}
+import sys
+sys.path.insert(0, {root!r})
+from benchmarks.stubs import main
+sys.exit(main())
+"""
+
+
+def _params(args: list) -> dict:
+    return dict(i.split("=", 1) for i in args if "=" in i)
+
+
+def nicerl2(args: list):
+    """
+    Writes the ufa and cl event files of indir/xti/event_cl, the ufa
+    file being the events in $AUTONICER_BENCH_EVENTS and the cl file a
+    quarter of them. OBSIDs listed in $AUTONICER_BENCH_FAIL exit with 1
+    """
+    indir = _params(args)["indir"].rstrip("/")
+    obsid = os.path.basename(indir)
+    if obsid in os.environ.get("AUTONICER_BENCH_FAIL", "").split(","):
+        print(f"nicerl2: {obsid} failed")
+        return 1
+    event_cl = os.path.join(indir, "xti", "event_cl")
+    os.makedirs(event_cl, exist_ok=True)
+    with open(os.environ["AUTONICER_BENCH_EVENTS"], "rb") as f:
+        events = f.read()
+    caldb = os.environ.get("AUTONICER_BENCH_CALDB", archive.CALDB)
+    archive.write_evt(os.path.join(event_cl, f"ni{obsid}_0mpu7_ufa.evt"),
+                      obsid, caldb, events)
+    cl = events[:len(events) // 4 // archive.ROW * archive.ROW]
+    archive.write_evt(os.path.join(event_cl, f"ni{obsid}_0mpu7_cl.evt"),
+                      obsid, caldb, cl)
+    print(f"nicerl2: {obsid} done (PFILES={os.environ.get('PFILES')})")
+
+
+def barycorr(args: list):
+    """
+    Copies infile to outfile
+    """
+    params = _params(args)
+    shutil.copyfile(params["infile"], params["outfile"])
+    print(f"barycorr: {params['outfile']} written")
+
+
+def nicaldbver(args: list):
+    print(os.environ.get("AUTONICER_BENCH_CALDB", archive.CALDB))
+
+
+def main() -> int:
+    """
+    Entry point of the stub tasks, the task is picked by the name it
+    was called by and sleeps for $AUTONICER_BENCH_<TASK> seconds first
+    """
+    task = os.path.basename(sys.argv[0])
+    delay = os.environ.get(f"AUTONICER_BENCH_{task.upper()}",
+                           RUNTIMES[task])
+    time.sleep(float(delay))
+    return globals()[task](sys.argv[1:]) or 0
+
+
+def install(bin_dir) -> str:
+    """
+    Writes nicerl2, barycorr and nicaldbver stubs to bin_dir
+
+    Returns:
+    str, bin_dir
+    """
+    os.makedirs(bin_dir, exist_ok=True)
+    for task in TASKS:
+        path = os.path.join(bin_dir, task)
+        with open(path, "w") as f:
+            f.write(LAUNCHER.format(python=sys.executable, root=ROOT))
+        os.chmod(path, 0o755)
+    return str(bin_dir)
+
+
+@contextlib.contextmanager
+def stub_env(bin_dir, events, runtimes=None, caldb=archive.CALDB,
+             fail=()):
+    """
+    Puts the stubs first on PATH (and $CALDB out of the way, so the
+    version comes from the nicaldbver stub) for the length of a with
+    block
+
+    Parameters:
+    bin_dir: str, dir the stubs are installed in
+    events: str, file with the event rows nicerl2 writes out
+    runtimes: dict, seconds per task (default: RUNTIMES)
+    caldb: str, CALDB version reported by the stubs
+    fail: list, OBSIDs nicerl2 fails on
+    """
+    from autonicer import caldb as caldb_mod
+    env = {"PATH": f"{install(bin_dir)}{os.pathsep}{os.environ['PATH']}",
+           "AUTONICER_BENCH_EVENTS": str(events),
+           "AUTONICER_BENCH_CALDB": caldb, "CALDB": None,
+           "AUTONICER_BENCH_FAIL": ",".join(fail)}
+    for task, seconds in {**RUNTIMES, **(runtimes or {})}.items():
+        env[f"AUTONICER_BENCH_{task.upper()}"] = str(seconds)
+    saved = {i: os.environ.get(i) for i in env}
+    resolved = dict(caldb_mod._resolved)
+    for key, value in env.items():
+        if value is None:
+            os.environ.pop(key, None)
+        else:
+            os.environ[key] = value
+    caldb_mod._resolved.update(signature=None, version=None)
+    try:
+        yield bin_dir
+    finally:
+        for key, value in saved.items():
+            if value is None:
+                os.environ.pop(key, None)
+            else:
+                os.environ[key] = value
+        caldb_mod._resolved.update(resolved)
@@ -0,0 +1,250 @@
+# AutoNICER
+# Copyright 2022-2025 Nicholas Kuechel
+# License Apache 2.0
+
+import os
+import time
+import shutil
+import asyncio
+import argparse
+import statistics
+from . import archive
+from .archive import Archive
+from .stubs import stub_env
+
+MB = 1024 ** 2
+
+
+def metric(value, unit, better="higher"):
+    return {"value": round(value, 4), "unit": unit, "better": better}
+
+
+def _median(runs: list) -> dict:
+    """
+    Median of each metric over repeated runs
+    """
+    out = {}
+    for key, first in runs[0].items():
+        out[key] = dict(first, value=round(statistics.median(
+            i[key]["value"] for i in runs), 4))
+    return out
+
+
+def bench_nicer(url: str, **kwargs):
+    """
+    AutoNICER downloading from the archive at url that records when each
+    OBSID started downloading, finished reducing and was logged
+    """
+    from autonicer.autonicer import AutoNICER
+
+    class BenchNICER(AutoNICER):
+        def __init__(self):
+            self.started = {}
+            self.reduced = {}
+            self.finished = {}
+            super().__init__(**kwargs)
+
+        def _make_download_links(self, info):
+            urls = super()._make_download_links(info)
+            return {k: [i.replace(archive.S3, url) for i in v]
+                    for k, v in urls.items()}
+
+        async def download(self, data, *args, **kw):
+            self.started[data["OBSID"]] = time.perf_counter()
+            return await super().download(data, *args, **kw)
+
+        async def areduce(self, data, *args, **kw):
+            try:
+                return await super().areduce(data, *args, **kw)
+            finally:
+                self.reduced[data["OBSID"]] = time.perf_counter()
+
+        def write_log(self, base_dir, obsid):
+            super().write_log(base_dir, obsid)
+            self.finished[obsid] = time.perf_counter()
+
+    return BenchNICER()
+
+
+def download(work, params) -> dict:
+    """
+    Downloads every OBSID dataset of the archive through one Downloader
+    """
+    from autonicer.download import Downloader
+    with Archive(params.obsids, int(params.file_size * MB),
+                 latency=params.latency / 1000) as arc:
+        async def fetch(base_dir):
+            dl = Downloader(limit=2 * params.connections,
+                            files=params.connections, progress=False)
+            async with dl:
+                await asyncio.gather(*[
+                    dl.fetch_all(arc.urls(info), base_dir, priority=n)
+                    for n, info in enumerate(arc.queue)])
+
+        base_dir = os.path.join(work, "download")
+        os.makedirs(base_dir)
+        start = time.perf_counter()
+        asyncio.run(fetch(base_dir))
+        elapsed = time.perf_counter() - start
+        shutil.rmtree(base_dir)
+        return {"download_mb_s": metric(arc.total / MB / elapsed, "MB/s"),
+                "requests": metric(arc.server.requests, "requests",
+                                   "lower")}
+
+
+def pipeline(work, params) -> dict:
+    """
+    Runs the OBSIDs of the archive through the whole download -> reduce
+    -> compress -> log pipeline with stub HEASoft tasks
+    """
+    from autonicer.download import Downloader
+    base_dir = os.path.join(work, "pipeline")
+    os.makedirs(base_dir)
+    runtimes = {"nicerl2": params.nicerl2, "barycorr": params.barycorr}
+    with Archive(params.obsids, int(params.file_size * MB),
+                 latency=params.latency / 1000) as arc, \
+            stub_env(os.path.join(work, "bin"), params.events, runtimes):
+        an = bench_nicer(arc.url, src="BENCH", bc=True, comp=True,
+                         prefetch=params.prefetch, jobs=params.jobs,
+                         downloader=Downloader(limit=2 * params.connections,
+                                               files=params.connections,
+                                               progress=False))
+        an.q_set = "y"
+        an.q_name = "bench"
+        an.queue = [dict(i) for i in arc.queue]
+        start = time.perf_counter()
+        failed = an.pull_reduce(base_dir)
+        elapsed = time.perf_counter() - start
+    shutil.rmtree(base_dir)
+    if failed:
+        raise RuntimeError(f"pipeline failed: {failed}")
+    latency = [an.finished[i] - an.started[i] for i in an.finished]
+    return {"pipeline_s": metric(elapsed, "s", "lower"),
+            "obsids_per_min": metric(60 * len(latency) / elapsed,
+                                     "OBSIDs/min"),
+            "obsid_latency_mean_s": metric(statistics.mean(latency), "s",
+                                           "lower"),
+            "obsid_latency_max_s": metric(max(latency), "s", "lower")}
+
+
+def _evt_files(path, params) -> list:
+    with open(params.events, "rb") as f:
+        events = f.read()
+    files = []
+    for n in range(params.files):
+        obsid = archive.obsid_info(n)["OBSID"]
+        files.append(os.path.join(path, f"ni{obsid}_0mpu{n % 7}_ufa.evt"))
+        archive.write_evt(files[-1], obsid, data=events)
+    return files
+
+
+def compress(work, params) -> dict:
+    """
+    Compresses synthetic ufa.evt files with AutoNICER.nicer_compress
+    """
+    from autonicer.autonicer import AutoNICER
+    from autonicer.download import Downloader
+    path = os.path.join(work, "compress")
+    os.makedirs(path)
+    files = _evt_files(path, params)
+    size = sum(os.path.getsize(i) for i in files)
+    an = AutoNICER(src="BENCH", bc=False, comp=True, gz_level=params.level,
+                   gz_workers=params.workers,
+                   downloader=Downloader(progress=False))
+    start = time.perf_counter()
+    an.nicer_compress(path)
+    elapsed = time.perf_counter() - start
+    gz = sum(os.path.getsize(f"{i}.gz") for i in files)
+    shutil.rmtree(path)
+    return {"compress_mb_s": metric(size / MB / elapsed, "MB/s"),
+            "compress_ratio": metric(size / gz, "x")}
+
+
+def decompress(work, params) -> dict:
+    """
+    Decompresses .evt.gz files through one Decompressor
+    """
+    from autonicer.compress import Decompressor
+    from autonicer.compress import gzip_file
+    path = os.path.join(work, "decompress")
+    os.makedirs(path)
+    files = [gzip_file(i, params.level, workers=params.workers)
+             for i in _evt_files(path, params)]
+    size = sum(os.path.getsize(i) for i in files)
+    start = time.perf_counter()
+    with Decompressor(params.workers) as dc:
+        for _ in dc.run(files):
+            pass
+    elapsed = time.perf_counter() - start
+    out = sum(os.path.getsize(i[:-3]) for i in files)
+    shutil.rmtree(path)
+    return {"decompress_mb_s": metric(out / MB / elapsed, "MB/s"),
+            "decompress_gz_mb_s": metric(size / MB / elapsed, "MB/s")}
+
+
+def checkcal(work, params) -> dict:
+    """
+    --checkcal --inlist sweep over synthetic datasets reduced with an
+    older CALDB
+    """
+    from autonicer.reprocess import inlist
+    from autonicer.compress import gzip_file
+    path = os.path.join(work, "checkcal")
+    for n in range(params.datasets):
+        obsid = archive.obsid_info(n)["OBSID"]
+        event_cl = os.path.join(path, obsid, "xti", "event_cl")
+        os.makedirs(event_cl)
+        archive.write_evt(os.path.join(event_cl, f"ni{obsid}_0mpu7_cl.evt"),
+                          obsid, "xti20221001", b"\x00" * archive.ROW * 64)
+        bc = os.path.join(event_cl, f"bc{obsid}_0mpu7_cl.evt")
+        archive.write_evt(bc, obsid, "xti20221001",
+                          b"\x00" * archive.ROW * 64)
+        gzip_file(bc, workers=1)
+    argp = argparse.Namespace(checkcal=True, reprocess=False,
+                              inlist=[os.path.join(path, "*")],
+                              jobs=params.jobs, decompress_inflight="2G",
+                              bc=None, compress=None, gz_native=False,
+                              src=None, index=None)
+    with stub_env(os.path.join(work, "bin"), params.events):
+        start = time.perf_counter()
+        rows = inlist(argp)
+        elapsed = time.perf_counter() - start
+    shutil.rmtree(path)
+    if any(i["Status"] != "stale" for i in rows):
+        raise RuntimeError("checkcal did not flag every dataset as stale")
+    return {"checkcal_datasets_s": metric(len(rows) / elapsed,
+                                          "datasets/s")}
+
+
+SUITES = {"download": download, "pipeline": pipeline, "compress": compress,
+          "decompress": decompress, "checkcal": checkcal}
+
+
+def run_suite(name: str, work, params) -> dict:
+    """
+    Runs a benchmark params.repeat times in work
+
+    Returns:
+    dict, median of each metric
+    """
+    runs = []
+    for n in range(params.repeat):
+        run_dir = os.path.join(work, f"{name}{n}")
+        os.makedirs(run_dir)
+        try:
+            runs.append(SUITES[name](run_dir, params))
+        finally:
+            shutil.rmtree(run_dir, ignore_errors=True)
+    return _median(runs)
+
+
+def events_file(work, params) -> str:
+    """
+    Writes the synthetic events used by the stub nicerl2 and the
+    compression benchmarks
+    """
+    path = os.path.join(work, "events.bin")
+    rows = int(params.evt_size * MB) // archive.ROW
+    with open(path, "wb") as f:
+        f.write(archive.synthetic_events(rows))
+    return path
@@ -0,0 +1,45 @@
+import datetime
+import pandas as pd
+import pytest
+from autonicer import AutoNICER
+from benchmarks.archive import write_evt
+
+OBSID = "1013010112"
+
+
+@pytest.fixture
+def dataset():
+    """
+    Makes root/OBSID/xti/event_cl holding a barycenter corrected cl.evt
+    reduced with caldb (see benchmarks.archive.write_evt)
+
+    Returns:
+    function, (root, obsid, caldb, target) -> OBSID dir
+    """
+    def make(root, obsid=OBSID, caldb="xti20221001", target="BENCH"):
+        event_cl = root / obsid / "xti" / "event_cl"
+        event_cl.mkdir(parents=True)
+        write_evt(event_cl / f"bc{obsid}_0mpu7_cl.evt", obsid, caldb,
+                  target=target)
+        return root / obsid
+    return make
+
+
+@pytest.fixture
+def crab():
+    """
+    AutoNICER with a made up nicermastr table of five Crab OBSIDs
+    """
+    an = AutoNICER(src="Crab", bc="n", comp="n")
+    xti = pd.DataFrame({
+        "OBSID": ["1013010112", "1013010113", "2013010101", "3013010101",
+                  "3013010102"],
+        "TIME": [datetime.datetime(2017, 7, 1), datetime.datetime(2017, 7, 2),
+                 datetime.datetime(2019, 3, 5), datetime.datetime(2020, 1, 1),
+                 datetime.datetime(2020, 1, 2, 12)],
+        "RA": [83.6] * 5,
+        "DEC": [22.0] * 5,
+        "EXPOSURE": [500.0, 2000.0, 3000.0, 100.0, 4000.0],
+    })
+    an._index_xti(xti)
+    return an
@@ -38,7 +38,7 @@ def test_make_cycle():
     assert len(an.xti["Cycle#"]) == len(an.xti["OBSID"])
     cnt = 0
     for i in an.xti["OBSID"]:
-        cyc = an.xti.loc[cnt, "Cycle#"]
+        cyc = an.xti["Cycle#"].iloc[cnt]
         convo = float(i) * (10 ** (-9))
         assert np.floor(convo) == cyc
         cnt += 1
@@ -0,0 +1,45 @@
+from autonicer.batch import Batch
+
+
+def make_batch(tmp_path, crab, targets, **manifest):
+    batch = Batch({"output": str(tmp_path), "targets": targets, **manifest})
+    batch._tables["Crab"] = crab.xti
+    return batch
+
+
+def queued(an):
+    return [i["OBSID"] for i in an.queue]
+
+
+def test_select(tmp_path, crab):
+    target = {"src": "Crab", "obsids": ["2013010101"], "cycles": [1],
+              "dates": [["2020-01-01", "2020-01-02"]], "exposure": 1000}
+    an = make_batch(tmp_path, crab, [target]).prepare(target, "xti20240206")
+    assert queued(an) == ["2013010101", "1013010113", "3013010102"]
+    assert an.caldb_ver == "xti20240206"
+
+
+def test_select_all(tmp_path, crab):
+    batch = make_batch(tmp_path, crab, [])
+    an = batch.prepare({"src": "Crab", "all": True}, "xti20240206")
+    assert len(an.queue) == 5
+    an = batch.prepare({"src": "Crab", "all": True, "exposure": 2500},
+                       "xti20240206")
+    assert queued(an) == ["2013010101", "3013010102"]
+    an = batch.prepare({"src": "Crab", "select": ["range 1013010112 "
+                                                  "1013010113",
+                                                  "3013010101"]},
+                       "xti20240206")
+    assert queued(an) == ["1013010112", "1013010113", "3013010101"]
+
+
+def test_options(tmp_path, crab):
+    batch = make_batch(tmp_path, crab, [], bc=True, log="batch.csv", jobs=2)
+    an = batch.prepare({"src": "Crab", "jobs": 3, "compress": True},
+                       "xti20240206")
+    assert an.bc_sel == "y" and an.tar_sel == "y"
+    assert an.jobs == 3
+    assert an.ledger is batch.ledger
+    assert an.q_path == str(tmp_path / "batch.csv")
+    an = batch.prepare({"src": "Crab"}, "xti20240206")
+    assert an.jobs == 2 and an.tar_sel == "n"
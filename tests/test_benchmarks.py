@@ -0,0 +1,40 @@
+import json
+import platform
+from benchmarks.__main__ import compare
+from benchmarks.__main__ import main
+
+
+def test_benchmarks_offline(tmp_path):
+    out = tmp_path / "results.json"
+    assert main(["--repeat", "1", "--obsids", "1", "--file-size", "0.5",
+                 "--nicerl2", "0", "--barycorr", "0", "--evt-size", "0.5",
+                 "--files", "1", "--datasets", "3", "--workers", "1",
+                 "-o", str(out)]) == 0
+    results = json.loads(out.read_text())
+    assert set(results["results"]) == {"download", "pipeline", "compress",
+                                       "decompress", "checkcal"}
+    assert results["results"]["compress"]["compress_ratio"]["value"] > 1
+    assert main(["checkcal", "--repeat", "1", "--datasets", "3",
+                 "--evt-size", "0.1", "-o", str(tmp_path / "new.json"),
+                 "--compare", str(out), "--threshold", "100"]) == 0
+
+
+def test_default_output(tmp_path, monkeypatch):
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path))
+    assert main(["checkcal", "--repeat", "1", "--datasets", "1",
+                 "--evt-size", "0.1"]) == 0
+    # kept out of the source tree, named after the revision and host
+    out, = (tmp_path / "autonicer" / "benchmarks").iterdir()
+    results = json.loads(out.read_text())
+    assert out.name.startswith(f"{results['revision']}-{platform.node()}-")
+
+
+def test_compare():
+    def run(mb_s, seconds):
+        return {"results": {"x": {
+            "mb_s": {"value": mb_s, "unit": "MB/s", "better": "higher"},
+            "wall_s": {"value": seconds, "unit": "s", "better": "lower"}}}}
+    rows = compare(run(80, 1.05), run(100, 1.0))
+    assert [i[5] for i in rows] == [True, False]
+    rows = compare(run(120, 1.5), run(100, 1.0))
+    assert [i[5] for i in rows] == [False, True]
@@ -0,0 +1,134 @@
+import asyncio
+import pytest
+from autonicer.budget import BudgetError
+from autonicer.budget import dir_size
+from autonicer.budget import DiskBudget
+from autonicer.budget import prune
+from autonicer.download import Downloader
+from autonicer.pipeline import Pipeline
+from benchmarks.archive import Archive
+from benchmarks.archive import synthetic_events
+from benchmarks.archive import write_evt
+from benchmarks.stubs import stub_env
+from benchmarks.suites import bench_nicer
+
+
+def test_estimate(tmp_path):
+    budget = DiskBudget("1M", tmp_path, expansion=2)
+    assert budget.cap == 1024 ** 2
+    sizes = {"a/ni1_0mpu0_uf.evt.gz": 100, "a/ni1.mkf.gz": 50,
+             "a/ni1_0mpu7_cl.evt.gz": 10}
+    assert budget.estimate(sizes) == 160 + 200
+
+
+def test_admission(tmp_path):
+    async def run():
+        budget = DiskBudget(1000, tmp_path)
+        await budget.acquire("1", 600)
+        second = asyncio.ensure_future(budget.acquire("2", 600))
+        await asyncio.sleep(0.05)
+        assert not second.done()
+        # shrinking the first OBSID to what it takes up lets the next in
+        budget.resize("1", 300)
+        await asyncio.wait_for(second, 1)
+        assert budget.used == 900
+        budget.release("1")
+        budget.release("2")
+        # larger than the cap runs on its own
+        await budget.acquire("3", 5000)
+        assert budget.peak == 5000
+        budget.release("3")
+        with pytest.raises(BudgetError):
+            await budget.acquire("4", 10 ** 18)
+    asyncio.run(run())
+
+
+def test_kept(tmp_path):
+    async def run():
+        budget = DiskBudget(1000, tmp_path)
+        await budget.acquire("1", 600)
+        await budget.acquire("2", 300)
+        third = asyncio.ensure_future(budget.acquire("3", 400))
+        await asyncio.sleep(0.05)
+        # what a finished OBSID left on disk stays counted
+        budget.release("1", 500)
+        await asyncio.sleep(0.05)
+        assert not third.done()
+        budget.release("2", 100)
+        await asyncio.wait_for(third, 1)
+        assert budget.used == 1000
+        budget.release("3", 400)
+        # the rest of the run doesn't fit in what is left of the cap
+        with pytest.raises(BudgetError):
+            await budget.acquire("4", 200)
+        assert budget.peak == 1000
+    asyncio.run(run())
+
+
+def test_prune(tmp_path):
+    event_uf = tmp_path / "xti" / "event_uf"
+    event_cl = tmp_path / "xti" / "event_cl"
+    event_uf.mkdir(parents=True)
+    event_cl.mkdir(parents=True)
+    (event_uf / "ni1_0mpu0_uf.evt.gz").write_bytes(b"x" * 10)
+    (event_cl / "ni1_0mpu7_ufa.evt").write_bytes(b"new")
+    (event_cl / "ni1_0mpu7_ufa.evt.gz").write_bytes(b"old" * 2)
+    (event_cl / "ni1_0mpu7_cl.evt.gz").write_bytes(b"kept")
+    assert prune(tmp_path) == 16
+    assert sorted(i.name for i in event_cl.iterdir()) == \
+        ["ni1_0mpu7_cl.evt.gz", "ni1_0mpu7_ufa.evt"]
+    assert list(event_uf.iterdir()) == []
+
+
+def test_pipeline_budget(tmp_path):
+    events = tmp_path / "events.bin"
+    events.write_bytes(synthetic_events(20000))
+    with Archive(3, 64 * 1024, 1024) as arc, \
+            stub_env(tmp_path / "bin", events, {"nicerl2": 0.2,
+                                                "barycorr": 0}):
+        an = bench_nicer(arc.url, src="BENCH", bc=True, comp=True,
+                         prefetch=3,
+                         downloader=Downloader(progress=False))
+        an.queue = [dict(i) for i in arc.queue]
+        one = arc.total // 3
+        pipe = Pipeline(an, prefetch=3, base_dir=tmp_path / "data",
+                        budget=int(one * 4.5), prune=True)
+        assert asyncio.run(pipe.run()) == {}
+        # files looked up for admission aren't looked up again
+        assert arc.server.heads == sum(len(arc.urls(i)) for i in arc.queue)
+    # room for one estimated OBSID and a finished one, never all three
+    assert 0 < pipe.budget.peak <= pipe.budget.cap
+    assert pipe.budget.reserved == {}
+    for info in arc.queue:
+        obs = tmp_path / "data" / info["OBSID"] / "xti"
+        assert list((obs / "event_uf").glob("*uf.evt*")) == []
+        assert (obs / "event_cl" / f"ni{info['OBSID']}_0mpu7_ufa.evt.gz"
+                ).exists()
+
+
+def test_resumed_budget(tmp_path):
+    events = tmp_path / "events.bin"
+    events.write_bytes(synthetic_events(20000))
+    base_dir = tmp_path / "data"
+    with Archive(2, 64 * 1024, 1024) as arc, \
+            stub_env(tmp_path / "bin", events, {"nicerl2": 0,
+                                                "barycorr": 0}):
+        # reduced by nicerl2 with the current CALDB, barycorr still to run
+        for info in arc.queue:
+            event_cl = base_dir / info["OBSID"] / "xti" / "event_cl"
+            event_cl.mkdir(parents=True)
+            write_evt(event_cl / f"ni{info['OBSID']}_0mpu7_cl.evt",
+                      info["OBSID"], data=events.read_bytes())
+        before = dir_size(base_dir / arc.queue[0]["OBSID"])
+        an = bench_nicer(arc.url, src="BENCH", bc=True, comp=True,
+                         downloader=Downloader(progress=False))
+        an.queue = [dict(i) for i in arc.queue]
+        pipe = Pipeline(an, base_dir=base_dir, incremental=True,
+                        budget="1G")
+        assert asyncio.run(pipe.run()) == {}
+    assert set(pipe.stages.values()) == {"barycorr"}
+    assert arc.server.requests == 0
+    # resumed OBSIDs reserve what they hold, the bc file and .gz copies
+    assert pipe.budget.peak >= 3 * before
+    assert pipe.budget.reserved == {}
+    assert pipe.budget.kept == dir_size(base_dir)
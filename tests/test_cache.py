@@ -0,0 +1,73 @@
+import datetime
+import os
+import pandas as pd
+import pytest
+import autonicer.autonicer
+from autonicer.cache import CatalogCache
+from autonicer.cache import parse_size
+
+
+@pytest.fixture
+def xti():
+    return pd.DataFrame({
+        "OBSID": ["1013010112", "1013010113"],
+        "TIME": [datetime.datetime(2017, 8, 1), datetime.datetime(2017, 8, 2)],
+        "RA": [83.63, 83.63],
+        "DEC": [22.01, 22.01],
+    })
+
+
+def test_parse_size():
+    assert parse_size("512") == 512
+    assert parse_size("1.5K") == 1536
+    assert parse_size("50G") == 50 * 1024 ** 3
+    assert parse_size("2gb") == 2 * 1024 ** 3
+
+
+def test_catalog_roundtrip(tmp_path, xti):
+    catalog = CatalogCache(tmp_path)
+    assert catalog.load("PSR_B0531+21") is None
+    catalog.save("PSR_B0531+21", xti)
+    cached, age = catalog.load("PSR_B0531+21")
+    assert age < catalog.ttl
+    assert list(cached["OBSID"]) == list(xti["OBSID"])
+    for i in cached["TIME"]:
+        assert isinstance(i, datetime.datetime)
+
+
+@pytest.mark.parametrize("data", [b"", b"\x80\x04\x95garbage"])
+def test_catalog_corrupt(tmp_path, xti, data):
+    catalog = CatalogCache(tmp_path)
+    catalog.save("PSR_B0531+21", xti)
+    catalog._file("PSR_B0531+21").write_bytes(data)
+    # a cache miss, not an error before HEASARC is queried
+    assert catalog.load("PSR_B0531+21") is None
+    catalog.save("PSR_B0531+21", xti)
+    assert catalog.load("PSR_B0531+21") is not None
+
+
+def test_catalog_age(tmp_path, xti):
+    catalog = CatalogCache(tmp_path, ttl=3600)
+    catalog.save("PSR B0531+21", xti)
+    file = catalog._file("PSR B0531+21")
+    old = file.stat().st_mtime - 7200
+    os.utime(file, (old, old))
+    cached, age = catalog.load("PSR B0531+21")
+    assert age > catalog.ttl
+
+
+def test_offline_fallback(tmp_path, xti, monkeypatch):
+    catalog = CatalogCache(tmp_path, ttl=0)
+    catalog.save("PSR_B0531+21", xti)
+
+    def offline(name):
+        raise ConnectionError("no network")
+
+    monkeypatch.setattr(autonicer.autonicer.SkyCoord, "from_name", offline)
+    an = autonicer.AutoNICER(src="PSR_B0531+21", bc=True, comp=True,
+                             catalog=catalog)
+    an.call_nicer()
+    assert list(an.xti["OBSID"]) == list(xti["OBSID"])
+    an.obj = "Vela"
+    with pytest.raises(ConnectionError):
+        an.call_nicer()
@@ -0,0 +1,47 @@
+import os
+import subprocess as sp
+import pytest
+from autonicer import caldb
+
+
+@pytest.fixture
+def nicaldbver(tmp_path, monkeypatch):
+    index = tmp_path / "caldb" / "data" / "nicer" / "xti" / "caldb.indx"
+    index.parent.mkdir(parents=True)
+    index.write_text("")
+    monkeypatch.setenv("CALDB", str(tmp_path / "caldb"))
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "cache"))
+    monkeypatch.setitem(caldb._resolved, "signature", None)
+    monkeypatch.setitem(caldb._resolved, "version", None)
+    calls = []
+
+    def run(*args, **kwargs):
+        calls.append(args)
+        return sp.CompletedProcess(args, 0, stdout="xti20240206\n")
+
+    monkeypatch.setattr(caldb.sp, "run", run)
+    return index, calls
+
+
+def test_resolved_once(nicaldbver):
+    index, calls = nicaldbver
+    for _ in range(5):
+        assert caldb.get_caldb_ver() == "xti20240206"
+    assert len(calls) == 1
+
+
+def test_disk_cache(nicaldbver):
+    index, calls = nicaldbver
+    caldb.get_caldb_ver()
+    caldb._resolved["version"] = None
+    assert caldb.get_caldb_ver() == "xti20240206"
+    assert len(calls) == 1
+
+
+def test_invalidated_by_caldb_update(nicaldbver):
+    index, calls = nicaldbver
+    caldb.get_caldb_ver()
+    stat = index.stat()
+    os.utime(index, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    caldb.get_caldb_ver()
+    assert len(calls) == 2
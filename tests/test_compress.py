@@ -0,0 +1,82 @@
+import gzip
+import os
+import zlib
+import tarfile
+import pytest
+from autonicer.compress import gzip_file
+from autonicer.compress import Decompressor
+from autonicer.compress import extract_tar
+from autonicer.compress import gz_size
+
+
+@pytest.mark.parametrize("size", [0, 10, 1024 ** 2, 3 * 1024 ** 2 + 7])
+def test_roundtrip(tmp_path, size):
+    data = os.urandom(size // 2) + bytes(size - size // 2)
+    file = tmp_path / "ni1013010112_0mpu7_ufa.evt"
+    file.write_bytes(data)
+    out = gzip_file(str(file), block_size=256 * 1024, workers=4)
+    assert not file.exists()
+    raw = open(out, "rb").read()
+    assert gzip.decompress(raw) == data
+    # one gzip member, not several concatenated ones
+    assert zlib.decompress(raw, 31) == data
+
+
+def test_level(tmp_path):
+    data = b"TIME PI PHA DET_ID " * 200_000
+    sizes = []
+    for level in (1, 9):
+        file = tmp_path / f"l{level}.evt"
+        file.write_bytes(data)
+        sizes.append(os.path.getsize(gzip_file(str(file), level)))
+    assert sizes[1] <= sizes[0]
+
+
+def test_decompressor(tmp_path):
+    originals = {}
+    for i in range(6):
+        # compresses about 5:1 like an event file
+        data = os.urandom(20_000) * 5
+        originals[f"ni1013010112_0mpu{i}_ufa.evt"] = data
+        with gzip.open(tmp_path / f"ni1013010112_0mpu{i}_ufa.evt.gz",
+                       "wb") as f:
+            f.write(data)
+    peak = []
+    with Decompressor(workers=3, max_inflight="250K") as dc:
+        acquire = dc._acquire
+
+        def track(size):
+            acquire(size)
+            peak.append(dc.inflight)
+        dc._acquire = track
+        results = list(dc.run(sorted(tmp_path.glob("*.gz"))))
+    assert len(results) == 6
+    assert max(peak) <= 250 * 1024
+    for name, data in originals.items():
+        assert (tmp_path / name).read_bytes() == data
+    assert not list(tmp_path.glob("*.gz"))
+
+
+def test_gz_size_wrapped(tmp_path):
+    file = tmp_path / "ni1013010112_0mpu7_ufa.evt.gz"
+    data = os.urandom(1000) * 100
+    file.write_bytes(gzip.compress(data))
+    assert gz_size(file) == len(data)
+    # a 6 GiB file compressed 4:1 has an ISIZE of 2 GiB and a 1.5 GiB .gz
+    with open(file, "wb") as f:
+        f.truncate(3 * 2 ** 29 - 4)
+        f.seek(0, os.SEEK_END)
+        f.write((2 ** 31).to_bytes(4, "little"))
+    assert gz_size(file) >= 6 * 2 ** 30
+
+
+def test_extract_tar_stays_in_dest(tmp_path):
+    (tmp_path / "a.evt").write_bytes(b"a")
+    with tarfile.open(tmp_path / "x.tar.gz", "w:gz") as tar:
+        tar.add(tmp_path / "a.evt", arcname="a.evt")
+        tar.add(tmp_path / "a.evt", arcname="../escape.evt")
+    out = tmp_path / "out"
+    out.mkdir()
+    extract_tar(str(tmp_path / "x.tar.gz"), str(out))
+    assert (out / "a.evt").read_bytes() == b"a"
+    assert not (tmp_path / "escape.evt").exists()
@@ -0,0 +1,51 @@
+import gzip
+import shutil
+import numpy as np
+import pytest
+from astropy.io import fits
+from autonicer.fitshead import read_headers
+from autonicer.fitshead import getval
+
+
+@pytest.fixture(params=["", ".gz"])
+def evt(tmp_path, request):
+    primary = fits.PrimaryHDU(np.zeros((3, 5), dtype=np.int16))
+    primary.header["OBS_ID"] = "1013010112"
+    primary.header["RA_OBJ"] = 83.633
+    primary.header["DEC_OBJ"] = 22.0145
+    events = fits.BinTableHDU.from_columns(
+        [fits.Column(name="TIME", format="D", array=np.arange(5000.))])
+    events.header["CALDBVER"] = "xti20240206"
+    events.header["OBJECT"] = "PSR B0531+21 ('Crab')"
+    path = tmp_path / "ni1013010112_0mpu7_cl.evt"
+    fits.HDUList([primary, events]).writeto(path)
+    if request.param:
+        with open(path, "rb") as f_in, \
+                gzip.open(f"{path}.gz", "wb") as f_out:
+            shutil.copyfileobj(f_in, f_out)
+        path = tmp_path / f"{path.name}.gz"
+    return path
+
+
+def test_matches_astropy(evt):
+    hdrs = read_headers(evt)
+    with fits.open(evt) as hdul:
+        for hdr, hdu in zip(hdrs, hdul):
+            for key in ("OBS_ID", "RA_OBJ", "DEC_OBJ", "CALDBVER", "OBJECT",
+                        "NAXIS2", "BITPIX"):
+                if key in hdu.header:
+                    assert hdr[key] == hdu.header[key]
+
+
+def test_getval(evt):
+    assert getval(evt, "CALDBVER", ext=1) == "xti20240206"
+    with pytest.raises(KeyError):
+        getval(evt, "CALDBVER")
+    with pytest.raises(IndexError):
+        getval(evt, "CALDBVER", ext=2)
+
+
+def test_not_fits(tmp_path):
+    (tmp_path / "x.evt").write_bytes(b"not a fits file")
+    with pytest.raises(OSError):
+        read_headers(tmp_path / "x.evt")
@@ -0,0 +1,53 @@
+from autonicer import AutoNICER
+from benchmarks.archive import write_evt
+
+OBSID = "1013010112"
+
+
+def setup(tmp_path, bc=True, comp=True):
+    an = AutoNICER(src="Crab", bc=bc, comp=comp)
+    an.caldb_ver = "xti20240206"
+    event_cl = tmp_path / OBSID / "xti" / "event_cl"
+    event_cl.mkdir(parents=True)
+    return an, event_cl
+
+
+def plan(an, tmp_path):
+    return an.plan({"OBSID": OBSID}, str(tmp_path))
+
+
+def test_new_obsid(tmp_path):
+    an, event_cl = setup(tmp_path)
+    assert plan(an, tmp_path) == "download"
+
+
+def test_old_caldb(tmp_path):
+    an, event_cl = setup(tmp_path)
+    write_evt(event_cl / f"bc{OBSID}_0mpu7_cl.evt", OBSID, "xti20221001")
+    assert plan(an, tmp_path) == "download"
+
+
+def test_resume_barycorr(tmp_path):
+    an, event_cl = setup(tmp_path)
+    write_evt(event_cl / f"ni{OBSID}_0mpu7_cl.evt", OBSID, "xti20240206")
+    assert plan(an, tmp_path) == "barycorr"
+
+
+def test_resume_compress_then_done(tmp_path):
+    an, event_cl = setup(tmp_path)
+    write_evt(event_cl / f"ni{OBSID}_0mpu7_cl.evt", OBSID, "xti20240206")
+    write_evt(event_cl / f"bc{OBSID}_0mpu7_cl.evt", OBSID, "xti20240206")
+    assert plan(an, tmp_path) == "compress"
+    (event_cl / f"ni{OBSID}_0mpu7_cl.evt").rename(
+        event_cl / f"ni{OBSID}_0mpu7_cl.evt.gz")
+    assert plan(an, tmp_path) == "done"
+
+
+def test_resume_log(tmp_path):
+    an, event_cl = setup(tmp_path, bc=False, comp=False)
+    write_evt(event_cl / f"ni{OBSID}_0mpu7_cl.evt", OBSID, "xti20240206")
+    an.q_set = "y"
+    an.q_path = str(tmp_path / "log.csv")
+    assert plan(an, tmp_path) == "log"
+    an.write_log(str(tmp_path), OBSID)
+    assert plan(an, tmp_path) == "done"
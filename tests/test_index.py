@@ -0,0 +1,34 @@
+import os
+import shutil
+from astropy.io import fits
+from autonicer.index import ArchiveIndex
+
+
+def test_refresh_and_stale(tmp_path, dataset):
+    data = tmp_path / "data"
+    dirs = [dataset(data, "1013010112", "xti20240206", "PSR_B0531+21"),
+            dataset(data, "1013010113", "xti20221001", "PSR_B0531+21"),
+            dataset(data, "2584010101", "xti20221001", "Vela")]
+    index = ArchiveIndex(tmp_path / "archive.sqlite")
+    assert index.refresh(dirs) == 3
+    # nothing changed, nothing is read again
+    assert index.refresh(dirs) == 0
+    stale = index.stale("xti20240206")
+    assert [os.path.basename(i) for i in stale] == \
+        ["1013010113", "2584010101"]
+    assert len(index.stale("xti20240206", target="b0531")) == 1
+    status = {r["OBSID"]: r["Status"] for r in index.status("xti20240206")}
+    assert status == {"1013010112": "up to date", "1013010113": "stale",
+                      "2584010101": "stale"}
+
+    # reprocessing rewrites the event file, only that dataset is reread
+    evt = dirs[1] / "xti" / "event_cl" / "bc1013010113_0mpu7_cl.evt"
+    fits.setval(evt, "CALDBVER", value="xti20240206", ext=1)
+    os.utime(evt, ns=(1, 2))
+    assert index.refresh(dirs) == 1
+    assert len(index.stale("xti20240206")) == 1
+
+    shutil.rmtree(dirs[2])
+    index.refresh(dirs[:2])
+    assert index.stale("xti20240206") == []
+    assert len(index.datasets()) == 2
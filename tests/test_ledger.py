@@ -0,0 +1,62 @@
+import multiprocessing
+import pandas as pd
+from autonicer.autonicer import AutoNICER
+from autonicer.ledger import Ledger
+
+
+def add_rows(path, start):
+    ledger = Ledger(path)
+    for i in range(start, start + 50):
+        ledger.add(f"/data/{i}/bc{i}_0mpu7_cl.evt", str(i), "xti20240206")
+
+
+def test_append(tmp_path):
+    path = tmp_path / "log.csv"
+    ledger = Ledger(path)
+    ledger.add("/data/1013010112/bc1013010112_0mpu7_cl.evt", "1013010112",
+               "xti20240206")
+    ledger.add("/data/1013010113/bc1013010113_0mpu7_cl.evt", "1013010113",
+               "xti20240206")
+    log = pd.read_csv(path)
+    assert list(log.columns) == ["Input", "OBSID", "CALDB", "DateTime"]
+    assert list(log["OBSID"]) == ["NI1013010112", "NI1013010113"]
+    assert len(ledger.rows()) == 2
+
+
+def test_import_and_export(tmp_path):
+    path = tmp_path / "old.csv"
+    pd.DataFrame({"Input": ["/a"], "OBSID": ["NI1"], "CALDB": ["x"],
+                  "DateTime": ["2024"]}).to_csv(path, index=False)
+    ledger = Ledger(path)
+    ledger.add("/b", "2", "x")
+    assert [r[0] for r in ledger.rows()] == ["/a", "/b"]
+    ledger.export(tmp_path / "copy.csv")
+    assert list(pd.read_csv(tmp_path / "copy.csv")["Input"]) == ["/a", "/b"]
+
+
+def test_add2q(tmp_path):
+    path = tmp_path / "log.csv"
+    an = AutoNICER(src="Crab", bc="n", comp="n")
+    an.q_path = str(path)
+    an.caldb_ver = "xti20240206"
+    # the old log DataFrame argument is still taken and ignored
+    an.add2q(pd.DataFrame(), tmp_path, "1013010112")
+    an.add2q(None, tmp_path, "1013010113")
+    log = pd.read_csv(path)
+    assert list(log["OBSID"]) == ["NI1013010112", "NI1013010113"]
+    assert log["Input"][0] == \
+        f"{tmp_path}/1013010112/xti/event_cl/bc1013010112_0mpu7_cl.evt"
+
+
+def test_concurrent_writers(tmp_path):
+    path = tmp_path / "log.csv"
+    Ledger(path)
+    procs = [multiprocessing.Process(target=add_rows, args=(path, i * 100))
+             for i in range(4)]
+    for p in procs:
+        p.start()
+    for p in procs:
+        p.join()
+    log = pd.read_csv(path)
+    assert len(log) == 200
+    assert len(Ledger(path).rows()) == 200
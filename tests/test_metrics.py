@@ -0,0 +1,73 @@
+import json
+import pytest
+from autonicer.download import Downloader
+from autonicer.metrics import Metrics
+from autonicer.metrics import timed
+from benchmarks.archive import Archive
+from benchmarks.archive import synthetic_events
+from benchmarks.stubs import stub_env
+from benchmarks.suites import bench_nicer
+
+
+def read(path):
+    return [json.loads(i) for i in path.read_text().splitlines()]
+
+
+def test_metrics(tmp_path):
+    path = tmp_path / "metrics.jsonl"
+    with Metrics(path) as metrics:
+        metrics.record("file", 0.5, bytes=1024, retries=1)
+        metrics.record("file", 1.5, bytes=3072, retries=0)
+        with metrics.timer("log", obsid="1013010112") as fields:
+            fields["rows"] = 1
+        with pytest.raises(ValueError):
+            with metrics.timer("compress"):
+                raise ValueError("disk full")
+    recs = read(path)
+    assert [i["stage"] for i in recs] == ["file", "file", "log", "compress",
+                                          "summary"]
+    assert recs[2]["rows"] == 1 and recs[2]["obsid"] == "1013010112"
+    assert recs[3]["status"] == "failed" and recs[3]["error"] == "disk full"
+    summary = recs[-1]["stages"]["file"]
+    assert summary["count"] == 2 and summary["bytes"] == 4096
+    assert summary["seconds"] == 2.0 and summary["max_seconds"] == 1.5
+    assert summary["mean_seconds"] == 1.0
+    # nothing kept, counters still go into the dict
+    with timed(None, "log", obsid="1013010112") as fields:
+        fields["rows"] = 1
+    assert fields == {"obsid": "1013010112", "rows": 1}
+
+
+def test_pipeline_metrics(tmp_path):
+    events = tmp_path / "events.bin"
+    events.write_bytes(synthetic_events(1000))
+    path = tmp_path / "metrics.jsonl"
+    base_dir = tmp_path / "data"
+    with Archive(1, 64 * 1024, 1024) as arc, \
+            stub_env(tmp_path / "bin", events, {"nicerl2": 0,
+                                                "barycorr": 0}), \
+            Metrics(path) as metrics:
+        an = bench_nicer(arc.url, src="BENCH", bc=True, comp=True,
+                         metrics=metrics,
+                         downloader=Downloader(progress=False,
+                                               metrics=metrics))
+        an.queue = [dict(i) for i in arc.queue]
+        assert an.pull_reduce(base_dir) == {}
+    recs = read(path)
+    stages = [i["stage"] for i in recs]
+    files = [i for i in recs if i["stage"] == "file"]
+    assert len(files) == len(arc.urls(arc.queue[0]))
+    assert all(i["source"] == "network" and i["retries"] == 0
+               for i in files)
+    assert sum(i["bytes"] for i in files) == arc.total
+    for stage in ("download", "nicerl2", "barycorr", "gzip", "compress",
+                  "log", "obsid"):
+        assert stage in stages
+    obsid = recs[stages.index("obsid")]
+    assert obsid["status"] == "ok" and obsid["obsid"] == "1000000001"
+    download = recs[stages.index("download")]
+    assert download["bytes"] == arc.total and download["seconds"] > 0
+    gz = recs[stages.index("gzip")]
+    assert gz["ratio"] > 1
+    assert recs[-1]["stage"] == "summary"
+    assert recs[-1]["stages"]["nicerl2"]["count"] == 1
@@ -0,0 +1,80 @@
+import asyncio
+import os
+import pytest
+from autonicer.download import Downloader
+from autonicer.pipeline import Pipeline
+from benchmarks.archive import Archive
+from benchmarks.archive import synthetic_events
+from benchmarks.stubs import stub_env
+from benchmarks.suites import bench_nicer
+
+
+def run_pipeline(tmp_path, obsids, runtimes, prefetch=1, fail=(),
+                 downloader=None, **kwargs):
+    events = tmp_path / "events.bin"
+    events.write_bytes(synthetic_events(1000))
+    with Archive(obsids, 16 * 1024, 1024) as arc, \
+            stub_env(tmp_path / "bin", events, runtimes, fail=fail):
+        an = bench_nicer(arc.url, src="BENCH", bc=True, comp=True,
+                         downloader=downloader or Downloader(progress=False))
+        an.queue = [dict(i) for i in arc.queue]
+        compressed = []
+        compress = an.nicer_compress
+
+        def track(event_cl):
+            compressed.append(os.path.basename(
+                os.path.dirname(os.path.dirname(event_cl))))
+            return compress(event_cl)
+        an.nicer_compress = track
+        pipe = Pipeline(an, prefetch=prefetch, base_dir=tmp_path / "data",
+                        **kwargs)
+        failed = asyncio.run(pipe.run())
+    an.compressed = compressed
+    return an, pipe, arc, failed
+
+
+@pytest.mark.parametrize("prefetch", [1, 2])
+def test_prefetch(tmp_path, prefetch):
+    an, pipe, arc, failed = run_pipeline(
+        tmp_path, 4, {"nicerl2": 0.3, "barycorr": 0}, prefetch)
+    assert failed == {}
+    obsids = [i["OBSID"] for i in arc.queue]
+    assert list(an.finished) == obsids
+    for n, obsid in enumerate(obsids[:-1]):
+        # the next OBSID downloads while this one is reduced
+        assert an.started[obsids[n + 1]] < an.reduced[obsid]
+    for n in range(len(obsids) - prefetch - 1):
+        # but no more than prefetch OBSIDs wait for reduction
+        assert an.started[obsids[n + prefetch + 1]] >= \
+            an.reduced[obsids[n]]
+    if prefetch == 2:
+        assert an.started[obsids[2]] < an.reduced[obsids[0]]
+
+
+def test_failed_obsid(tmp_path):
+    bad = "1000000002"
+    an, pipe, arc, failed = run_pipeline(
+        tmp_path, 3, {"nicerl2": 0, "barycorr": 0}, fail=[bad])
+    # only the failed OBSID drops out, at reduction
+    assert list(failed) == [bad]
+    assert failed[bad].startswith("Reduction: nicerl2 failed")
+    assert bad not in an.compressed and bad not in an.finished
+    others = [i["OBSID"] for i in arc.queue if i["OBSID"] != bad]
+    assert an.compressed == others
+    assert list(an.finished) == others
+    for obsid in others:
+        assert [i.name for i in pipe.results[obsid]] == ["nicerl2",
+                                                         "barycorr"]
+
+
+def test_one_session(tmp_path):
+    downloader = Downloader(limit=4, progress=False)
+    an, pipe, arc, failed = run_pipeline(
+        tmp_path, 3, {"nicerl2": 0, "barycorr": 0}, prefetch=2,
+        downloader=downloader)
+    assert failed == {}
+    files = sum(len(arc.urls(i)) for i in arc.queue)
+    assert arc.server.requests == files
+    # every file of every OBSID went over the pooled connections of one
+    # session, not a connection per file or per OBSID
+    assert arc.server.connections <= downloader.limit
@@ -0,0 +1,159 @@
+import argparse
+import asyncio
+import concurrent.futures
+import gzip
+import os
+import tarfile
+from pathlib import Path
+import autonicer
+from autonicer import reprocess
+from autonicer.reprocess import Reprocess
+from autonicer.reprocess import inlist
+from benchmarks.archive import synthetic_events
+from benchmarks.archive import write_evt
+from benchmarks.stubs import stub_env
+
+OBSID = "1013010112"
+
+
+def make_dataset(dataset, root):
+    """
+    A stale dataset with a .gz and a tarred ufa.evt still to extract
+    """
+    obs = dataset(root)
+    event_cl = obs / "xti" / "event_cl"
+    with gzip.open(event_cl / f"ni{OBSID}_0mpu0_ufa.evt.gz", "wb") as f:
+        f.write(b"old")
+    (root / "mpu1.evt").write_bytes(b"tarred")
+    with tarfile.open(event_cl / "ufa.tar.gz", "w:gz") as tar:
+        tar.add(root / "mpu1.evt", arcname=f"ni{OBSID}_0mpu1_ufa.evt")
+    return obs, event_cl
+
+
+def test_gz_native(tmp_path, monkeypatch, dataset):
+    obs, event_cl = make_dataset(dataset, tmp_path)
+    monkeypatch.chdir(obs)
+    rep = Reprocess(cals="xti20240206")
+    assert rep.obsid == OBSID
+    assert rep.extract_tars() is True
+    # .gz event files are left alone, tars are unpacked
+    assert (event_cl / f"ni{OBSID}_0mpu0_ufa.evt.gz").exists()
+    assert (event_cl / f"ni{OBSID}_0mpu1_ufa.evt").exists()
+    assert not (event_cl / "ufa.tar.gz").exists()
+    # nicerl2 rewriting a file makes its .gz stale
+    (event_cl / f"ni{OBSID}_0mpu0_ufa.evt").write_bytes(b"new")
+    stale = rep.remove_stale()
+    assert [os.path.basename(i) for i in stale] == \
+        [f"ni{OBSID}_0mpu0_ufa.evt.gz"]
+
+
+def test_checkcal(tmp_path, monkeypatch, dataset):
+    obs, event_cl = make_dataset(dataset, tmp_path)
+    monkeypatch.chdir(obs)
+    assert Reprocess(cals="xti20240206").checkcal() is False
+    assert Reprocess(cals="xti20221001").checkcal() is True
+
+
+def test_clevts(tmp_path, dataset):
+    obs, event_cl = make_dataset(dataset, tmp_path)
+    # a bc + compress dataset keeps its non-bc cl.evt compressed
+    ni = event_cl / f"ni{OBSID}_0mpu7_cl.evt"
+    write_evt(ni, OBSID, "xti20240206")
+    with open(ni, "rb") as f_in, gzip.open(f"{ni}.gz", "wb") as f_out:
+        f_out.write(f_in.read())
+    ni.unlink()
+    rep = Reprocess(cals="xti20221001", base_dir=obs)
+    assert rep.clevts == [f"bc{OBSID}_0mpu7_cl.evt"]
+    assert rep.checkcal() is True
+    # .gz files are only read when nothing is left uncompressed
+    bc = event_cl / f"bc{OBSID}_0mpu7_cl.evt"
+    with open(bc, "rb") as f_in, gzip.open(f"{bc}.gz", "wb") as f_out:
+        f_out.write(f_in.read())
+    bc.unlink()
+    rep = Reprocess(cals="xti20221001", base_dir=obs)
+    assert rep.clevts == [f"ni{OBSID}_0mpu7_cl.evt.gz",
+                          f"bc{OBSID}_0mpu7_cl.evt.gz"]
+    assert rep.bc_det is True
+    # the bc file decides the state
+    assert rep.checkcal() is True
+
+
+def test_inlist_jobs(tmp_path, monkeypatch, dataset):
+    old = tmp_path / "old"
+    old.mkdir()
+    make_dataset(dataset, old)
+    (tmp_path / "empty").mkdir()
+    argp = argparse.Namespace(
+        inlist=[str(old / OBSID), str(tmp_path / "empty"),
+                str(tmp_path / "missing")],
+        checkcal=True, reprocess=False, bc=None, compress=None,
+        gz_native=False, jobs=2, decompress_inflight="2G")
+    monkeypatch.setattr(autonicer, "get_caldb_ver", lambda: "xti20240206")
+    rows = inlist(argp)
+    assert [r["Status"] for r in rows] == ["stale", "error", "error"]
+    assert rows[0]["OBSID"] == OBSID
+    assert rows[0]["CALDB"] == "xti20221001"
+
+
+def test_check_dataset_workers(tmp_path, monkeypatch, dataset):
+    obs, _ = make_dataset(dataset, tmp_path)
+    sizes = []
+
+    class Sized(reprocess.Decompressor):
+        def __init__(self, workers=None, max_inflight="2G"):
+            super().__init__(workers, max_inflight)
+            sizes.append((self.workers, self.max_inflight))
+
+    argp = argparse.Namespace(
+        checkcal=True, reprocess=False, bc=None, compress=None,
+        gz_native=False, jobs=4, decompress_inflight="2G")
+    monkeypatch.setattr(reprocess, "Decompressor", Sized)
+    monkeypatch.setattr(os, "cpu_count", lambda: 8)
+    row = reprocess.check_dataset(str(obs), argp, "xti20240206", echo=False)
+    assert row["Status"] == "stale"
+    # the --jobs workers split the cores and the in-flight cap
+    assert sizes == [(2, 512 * 1024 ** 2)]
+
+
+def test_path_explicit_threads(tmp_path, dataset):
+    dirs = []
+    for i in range(4):
+        root = tmp_path / f"d{i}"
+        root.mkdir()
+        dirs.append(make_dataset(dataset, root)[0])
+    with concurrent.futures.ThreadPoolExecutor(4) as executor:
+        checks = list(executor.map(
+            lambda d: Reprocess(cals="xti20240206", base_dir=d), dirs))
+    assert all(c.obsid == OBSID and c.extract_tars() for c in checks)
+    for d in dirs:
+        assert (d / "xti" / "event_cl" / f"ni{OBSID}_0mpu1_ufa.evt").exists()
+    # nothing extracted relative to the cwd
+    assert not list(Path.cwd().glob(f"ni{OBSID}*"))
+
+
+def test_areprocess_concurrent(tmp_path, dataset):
+    events = tmp_path / "events.bin"
+    events.write_bytes(synthetic_events(100))
+    dirs = []
+    for i in range(2):
+        root = tmp_path / f"d{i}"
+        root.mkdir()
+        dirs.append(make_dataset(dataset, root)[0])
+
+    async def run():
+        # both in one running loop, as an async service would
+        checks = [Reprocess(cals="xti20240206", base_dir=d) for d in dirs]
+        await asyncio.gather(*[i.areprocess(gz_native=True, echo=False)
+                               for i in checks])
+        return checks
+
+    with stub_env(tmp_path / "bin", events, {"nicerl2": 0.2,
+                                             "barycorr": 0}):
+        checks = asyncio.run(run())
+    assert all(i.reprocessed and not i.reprocess_err for i in checks)
+    pfiles = set()
+    for d in dirs:
+        log = (d / "log" / f"ni{OBSID}_autonicer.log").read_text()
+        pfiles.add(log.split("PFILES=")[1].split(";")[0])
+    # each reduction wrote its .par files to a dir of its own
+    assert len(pfiles) == 2
@@ -0,0 +1,30 @@
+def queued(an):
+    return [i["OBSID"] for i in an.queue]
+
+
+def test_cycle_column(crab):
+    an = crab
+    assert an.xti["Cycle#"].tolist() == [1, 1, 2, 3, 3]
+
+
+def test_sel_obs(crab):
+    an = crab
+    an.command_center("2013010101")
+    an.command_center("2013010101")
+    an.command_center("9999999999")
+    assert queued(an) == ["2013010101"]
+    assert an.queue[0]["year"] == "2019"
+    assert an.queue[0]["month"] == "03"
+
+
+def test_bulk(crab):
+    an = crab
+    an.command_center("cycle 1 3 exposure 1000")
+    assert queued(an) == ["1013010113", "3013010102"]
+    an.command_center("date 2020-01-01 2020-01-02")
+    assert queued(an) == ["1013010113", "3013010102", "3013010101"]
+    an.command_center("rm all")
+    an.command_center("range 1013010113 2013010101")
+    assert queued(an) == ["1013010113", "2013010101"]
+    an.command_center("cycle x")
+    assert len(an.queue) == 2
@@ -0,0 +1,45 @@
+import json
+import os
+import subprocess
+import sys
+
+HEAVY = ("pandas", "numpy", "astropy", "astroquery", "aiohttp", "tqdm")
+# seconds, generous enough for a slow CI box yet well under the
+# multi-second bill of importing everything up front
+BUDGET = 1.0
+
+PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import autonicer
+try:
+    autonicer.run({args!r})
+except SystemExit:
+    pass
+seconds = time.perf_counter() - start
+heavy = sorted({{m.split(".")[0] for m in sys.modules}} & set({heavy!r}))
+print(json.dumps({{"seconds": seconds, "heavy": heavy}}))
+"""
+
+
+def startup(args, cwd, tmp_path):
+    env = dict(os.environ, XDG_CACHE_HOME=str(tmp_path / "cache"))
+    env.pop("CALDB", None)
+    out = subprocess.run([sys.executable, "-c",
+                          PROBE.format(args=args, heavy=HEAVY)],
+                         cwd=cwd, env=env, capture_output=True, text=True,
+                         check=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def test_version(tmp_path):
+    result = startup(["--version"], tmp_path, tmp_path)
+    assert result["heavy"] == []
+    assert result["seconds"] < BUDGET
+
+
+def test_checkcal(tmp_path, dataset):
+    dataset(tmp_path)
+    result = startup(["--checkcal"], tmp_path / "1013010112", tmp_path)
+    assert result["heavy"] == []
+    assert result["seconds"] < BUDGET
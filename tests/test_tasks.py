@@ -0,0 +1,30 @@
+import asyncio
+import io
+import sys
+import pytest
+from autonicer.tasks import run_task
+from autonicer.tasks import TaskError
+
+
+def test_run_task_log():
+    log = io.BytesIO()
+    args = [sys.executable, "-c",
+            "import sys; print('out'); print('err', file=sys.stderr)"]
+    result = asyncio.run(run_task(args, log=log))
+    assert result.returncode == 0
+    assert result.seconds > 0
+    assert b"out\n" in log.getvalue()
+    assert b"err\n" in log.getvalue()
+
+
+def test_run_task_failure():
+    args = [sys.executable, "-c", "raise SystemExit(3)"]
+    with pytest.raises(TaskError) as err:
+        asyncio.run(run_task(args))
+    assert err.value.result.returncode == 3
+
+
+def test_run_task_missing():
+    with pytest.raises(TaskError) as err:
+        asyncio.run(run_task(["autonicer-no-such-task"]))
+    assert err.value.result.returncode == 127